@@ -0,0 +1,104 @@
+# backend/admission_control.py
+
+import asyncio
+import math
+import os
+import subprocess
+import time
+from collections import deque
+
+from metrics import ADMISSION_REJECTED, ADMISSION_WAITING
+
+# 同時に実行する重い処理（/analyze, /benchmark-summary）の数
+ADMISSION_MAX_CONCURRENT_JOBS = int(os.getenv("ADMISSION_MAX_CONCURRENT_JOBS", "1"))
+# 実行待ちにできる数。これを超えたリクエストは 429 で断る
+ADMISSION_MAX_QUEUED_JOBS = int(os.getenv("ADMISSION_MAX_QUEUED_JOBS", "4"))
+# 実測値がまだないときの「処理時間 / 音声の長さ」
+ADMISSION_DEFAULT_REAL_TIME_FACTOR = float(os.getenv("ADMISSION_DEFAULT_REAL_TIME_FACTOR", "0.5"))
+EWMA_ALPHA = 0.3
+# ffprobe で長さが取れない場合に、ファイルサイズから長さを概算するためのビットレート（128kbps）
+FALLBACK_BYTES_PER_SECOND = 16_000
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after_seconds: int, queued: int):
+        super().__init__(f"混雑しています。約{retry_after_seconds}秒後に再試行してください。（待機中: {queued}件）")
+        self.retry_after_seconds = retry_after_seconds
+
+
+def probe_audio_duration(file_path: str) -> float:
+    """ffprobe でヘッダーから音声の長さ（秒）を取得する。デコードしないため高速です。"""
+    try:
+        output = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", file_path], check=True, capture_output=True, text=True).stdout
+        return float(output.strip())
+    except (subprocess.CalledProcessError, ValueError, OSError):
+        return os.path.getsize(file_path) / FALLBACK_BYTES_PER_SECOND
+
+
+class AdmissionController:
+    """
+    重い処理の同時実行数を制限し、上限付きの待ち行列で順番に実行するクラス。
+    各ジョブの処理時間は「音声の長さ × 実測の real-time factor」で見積もり、
+    待ち行列が一杯のときは、行列が捌けるまでの見込み時間を Retry-After として返します。
+    """
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT_JOBS, max_queued: int = ADMISSION_MAX_QUEUED_JOBS):
+        self.max_concurrent, self.max_queued = max_concurrent, max_queued
+        self.real_time_factors = {}
+        self.running = []
+        self.waiting = deque()
+
+    def estimate_seconds(self, endpoint: str, audio_seconds: float) -> float:
+        return audio_seconds * self.real_time_factors.get(endpoint, ADMISSION_DEFAULT_REAL_TIME_FACTOR)
+
+    def drain_seconds(self) -> float:
+        """実行中・待機中のジョブがすべて終わるまでの見込み時間（秒）。"""
+        now = time.monotonic()
+        remaining = sum(max(0.0, job["estimated_seconds"] - (now - job["started_at"])) for job in self.running)
+        remaining += sum(job["estimated_seconds"] for job in self.waiting)
+        return remaining / max(1, self.max_concurrent)
+
+    async def acquire(self, endpoint: str, audio_seconds: float) -> dict:
+        """実行枠を確保する。枠が空くまで待ち、待ち行列が一杯なら AdmissionRejected を送出する。"""
+        job = {"endpoint": endpoint, "audio_seconds": audio_seconds, "estimated_seconds": self.estimate_seconds(endpoint, audio_seconds), "started_at": None, "future": None}
+        if len(self.running) < self.max_concurrent and not self.waiting:
+            return self._start(job)
+        if len(self.waiting) >= self.max_queued:
+            ADMISSION_REJECTED.labels(endpoint).inc()
+            raise AdmissionRejected(max(1, math.ceil(self.drain_seconds())), len(self.waiting))
+        job["future"] = asyncio.get_running_loop().create_future()
+        self.waiting.append(job); ADMISSION_WAITING.set(len(self.waiting))
+        try:
+            await job["future"]
+        except asyncio.CancelledError:
+            # 待機中にクライアントが切断した場合は行列から外す（既に枠を割り当てられていれば返す）
+            if job in self.waiting:
+                self.waiting.remove(job); ADMISSION_WAITING.set(len(self.waiting))
+            elif job in self.running:
+                self.release(job, succeeded=False)
+            raise
+        return job
+
+    def release(self, job: dict, succeeded: bool = True):
+        """実行枠を返し、成功したジョブの実測時間で real-time factor を更新して、次の待機ジョブを開始する。"""
+        if job not in self.running:
+            return
+        self.running.remove(job)
+        if succeeded and job["audio_seconds"] > 0:
+            factor = (time.monotonic() - job["started_at"]) / job["audio_seconds"]
+            previous = self.real_time_factors.get(job["endpoint"])
+            self.real_time_factors[job["endpoint"]] = factor if previous is None else (1 - EWMA_ALPHA) * previous + EWMA_ALPHA * factor
+        while self.waiting and len(self.running) < self.max_concurrent:
+            next_job = self.waiting.popleft()
+            if not next_job["future"].done():
+                self._start(next_job)
+                next_job["future"].set_result(None)
+        ADMISSION_WAITING.set(len(self.waiting))
+
+    def _start(self, job: dict) -> dict:
+        job["started_at"] = time.monotonic()
+        self.running.append(job)
+        return job
+
+
+admission_controller = AdmissionController()
@@ -4,6 +4,8 @@ import re  # ★ 正規表現ライブラリをインポート
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from models import get_llm
+from stage_timer import track_stage
+from metrics import observe_llm_tokens
 
 # ★★★ ここから追加 ★★★
 def _parse_json_from_response(response_content: str):
@@ -145,30 +147,40 @@ def _evaluate_reliability(llm, model_name: str, transcript_text: str, final_summ
         chain = prompt | llm
     return chain.invoke({"transcript": transcript_text, "summary": final_summary})
 
+# パイプラインが失敗したときの reliability["justification"] の先頭
+PIPELINE_ERROR_PREFIX = "パイプラインエラー"
+
+def is_pipeline_error(reliability_info: dict) -> bool:
+    return str(reliability_info.get("justification", "")).startswith(PIPELINE_ERROR_PREFIX)
+
 def run_self_improvement_pipeline(model_name: str, transcript_text: str):
     try:
         llm = get_llm(model_name)
         total_token_usage = {"input_tokens": 0, "output_tokens": 0}
         
-        response1 = _generate_draft(llm, model_name, transcript_text)
-        usage = _extract_token_usage(response1); total_token_usage["input_tokens"] += usage["input_tokens"]; total_token_usage["output_tokens"] += usage["output_tokens"]
+        with track_stage("llm_draft", model=model_name):
+            response1 = _generate_draft(llm, model_name, transcript_text)
+        usage = _extract_token_usage(response1); observe_llm_tokens(model_name, "draft", usage); total_token_usage["input_tokens"] += usage["input_tokens"]; total_token_usage["output_tokens"] += usage["output_tokens"]
         # ★ 変更点: json.loads を _parse_json_from_response に変更
         draft_result = _parse_json_from_response(response1.content)
 
-        response2 = _review_draft(llm, model_name, transcript_text, draft_result)
-        usage = _extract_token_usage(response2); total_token_usage["input_tokens"] += usage["input_tokens"]; total_token_usage["output_tokens"] += usage["output_tokens"]
+        with track_stage("llm_review", model=model_name):
+            response2 = _review_draft(llm, model_name, transcript_text, draft_result)
+        usage = _extract_token_usage(response2); observe_llm_tokens(model_name, "review", usage); total_token_usage["input_tokens"] += usage["input_tokens"]; total_token_usage["output_tokens"] += usage["output_tokens"]
         review_feedback = response2.content
         
-        response3 = _revise_draft(llm, model_name, transcript_text, draft_result, review_feedback)
-        usage = _extract_token_usage(response3); total_token_usage["input_tokens"] += usage["input_tokens"]; total_token_usage["output_tokens"] += usage["output_tokens"]
+        with track_stage("llm_revise", model=model_name):
+            response3 = _revise_draft(llm, model_name, transcript_text, draft_result, review_feedback)
+        usage = _extract_token_usage(response3); observe_llm_tokens(model_name, "revise", usage); total_token_usage["input_tokens"] += usage["input_tokens"]; total_token_usage["output_tokens"] += usage["output_tokens"]
         # ★ 変更点: json.loads を _parse_json_from_response に変更
         final_result = _parse_json_from_response(response3.content)
 
         summary = "\n".join(f"- {item}" for item in final_result.get("summary", []))
         todos = final_result.get("todos", [])
         
-        response4 = _evaluate_reliability(llm, model_name, transcript_text, summary)
-        usage = _extract_token_usage(response4); total_token_usage["input_tokens"] += usage["input_tokens"]; total_token_usage["output_tokens"] += usage["output_tokens"]
+        with track_stage("llm_evaluate", model=model_name):
+            response4 = _evaluate_reliability(llm, model_name, transcript_text, summary)
+        usage = _extract_token_usage(response4); observe_llm_tokens(model_name, "evaluate", usage); total_token_usage["input_tokens"] += usage["input_tokens"]; total_token_usage["output_tokens"] += usage["output_tokens"]
         # ★ 変更点: json.loads を _parse_json_from_response に変更
         evaluation = _parse_json_from_response(response4.content)
         
@@ -179,7 +191,7 @@ def run_self_improvement_pipeline(model_name: str, transcript_text: str):
         return summary, todos, reliability_info, total_token_usage
     except Exception as e:
         print(f"LLMパイプラインでエラーが発生しました ({model_name}): {e}")
-        return "要約の生成に失敗しました。", ["ToDoの抽出に失敗しました。"], {"score": 0.0, "justification": f"パイプラインエラー: {e}"}, {"input_tokens": 0, "output_tokens": 0}
+        return "要約の生成に失敗しました。", ["ToDoの抽出に失敗しました。"], {"score": 0.0, "justification": f"{PIPELINE_ERROR_PREFIX}: {e}"}, {"input_tokens": 0, "output_tokens": 0}
 
 def run_benchmark_pipeline(transcript_text: str, models_to_run: list[str]):
     benchmark_results = []
@@ -0,0 +1,86 @@
+# backend/asr_engines.py
+
+import os
+from abc import ABC, abstractmethod
+
+import numpy as np
+import whisper_timestamped as whisper
+
+# --- 文字起こしのプロファイル ---
+# engine: whisper_timestamped / faster_whisper
+# compute_type: faster_whisper の量子化（int8 は CPU で最も速い）。whisper_timestamped では無視される
+# threads: faster_whisper の CPU スレッド数。0 の場合はライブラリの既定値（物理コア数）
+#   whisper_timestamped（torch）のスレッド数はプロセス全体の設定のため、ここでは変えない（gunicorn では post_fork で設定する）
+ASR_PROFILES = {
+    "fast": {"engine": "faster_whisper", "model_size": "base", "compute_type": "int8", "beam_size": 1, "best_of": 1, "threads": 0, "detect_disfluencies": False},
+    "balanced": {"engine": "faster_whisper", "model_size": "small", "compute_type": "int8", "beam_size": 5, "best_of": 5, "threads": 0, "detect_disfluencies": False},
+    "accurate": {"engine": "whisper_timestamped", "model_size": "small", "compute_type": "float32", "beam_size": 5, "best_of": 5, "threads": 0, "detect_disfluencies": True},
+    # これまでと同じ設定（whisper_timestamped の base、貪欲法、言いよどみ検出あり）
+    "legacy": {"engine": "whisper_timestamped", "model_size": "base", "compute_type": "float32", "beam_size": None, "best_of": None, "threads": 0, "detect_disfluencies": True},
+}
+DEFAULT_ASR_PROFILE = os.getenv("ASR_PROFILE", "legacy")
+
+
+class ASREngine(ABC):
+    """
+    文字起こしエンジンの共通インターフェース。
+    transcribe は whisper_timestamped と同じ構造（text / segments[].words[] の text, start, end, confidence）を返し、
+    merge_results や VAD のタイムスタンプ補正がエンジンによらずそのまま使えるようにします。
+    """
+
+    def __init__(self, profile_name: str, device: str):
+        self.profile_name = profile_name
+        self.profile = ASR_PROFILES[profile_name]
+        self.device = device
+        self.model = None
+
+    @abstractmethod
+    def load(self):
+        """モデルを読み込み、self.model に設定する。"""
+
+    @abstractmethod
+    def transcribe(self, audio: np.ndarray, language: str = "ja", detect_disfluencies: bool | None = None) -> dict:
+        """16kHz・モノラルの音声を文字起こしする。"""
+
+
+class WhisperTimestampedEngine(ASREngine):
+    def load(self):
+        self.model = whisper.load_model(self.profile["model_size"], device=self.device)
+
+    def transcribe(self, audio, language="ja", detect_disfluencies=None):
+        if detect_disfluencies is None:
+            detect_disfluencies = self.profile["detect_disfluencies"]
+        return whisper.transcribe(self.model, audio, language=language, detect_disfluencies=detect_disfluencies,
+                                  beam_size=self.profile["beam_size"], best_of=self.profile["best_of"])
+
+
+class FasterWhisperEngine(ASREngine):
+    """CTranslate2 ベースの faster-whisper。CPU では int8 量子化により whisper_timestamped より数倍速い。"""
+
+    def load(self):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError as e:
+            raise RuntimeError(f"ASRプロファイル '{self.profile_name}' には faster-whisper が必要です (pip install faster-whisper)") from e
+        compute_type = self.profile["compute_type"] if self.device == "cpu" else "float16"
+        self.model = WhisperModel(self.profile["model_size"], device=self.device, compute_type=compute_type, cpu_threads=self.profile["threads"])
+
+    def transcribe(self, audio, language="ja", detect_disfluencies=None):
+        # faster-whisper には言いよどみ検出がないため、detect_disfluencies は無視する
+        segments, _ = self.model.transcribe(audio, language=language, beam_size=self.profile["beam_size"], best_of=self.profile["best_of"], word_timestamps=True)
+        result_segments = []
+        for segment in segments:
+            words = [{"text": word.word.strip(), "start": round(word.start, 2), "end": round(word.end, 2), "confidence": round(word.probability, 3)} for word in segment.words or []]
+            result_segments.append({"id": len(result_segments), "start": round(segment.start, 2), "end": round(segment.end, 2), "text": segment.text.strip(), "words": words})
+        return {"text": "".join(segment["text"] for segment in result_segments), "segments": result_segments, "language": language}
+
+
+ENGINES = {"whisper_timestamped": WhisperTimestampedEngine, "faster_whisper": FasterWhisperEngine}
+
+
+def create_engine(profile_name: str, device: str) -> ASREngine:
+    if profile_name not in ASR_PROFILES:
+        raise ValueError(f"不明なASRプロファイルです: {profile_name}（{', '.join(ASR_PROFILES)} から選択）")
+    engine = ENGINES[ASR_PROFILES[profile_name]["engine"]](profile_name, device)
+    engine.load()
+    return engine
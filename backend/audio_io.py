@@ -0,0 +1,33 @@
+# backend/audio_io.py
+
+import subprocess
+
+import numpy as np
+import torch
+
+SAMPLE_RATE = 16000
+
+
+def decode_audio(file_path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    ffmpeg で音声を1回だけデコードし、16kHzモノラルの float32 配列（-1.0〜1.0）を返す。
+    中間のWAVファイルは作らず、パイプから直接読み込みます。
+    この配列を Whisper と pyannote の両方に渡すことで、同じファイルを二度デコードしないようにします。
+    """
+    command = ["ffmpeg", "-nostdin", "-threads", "0", "-i", file_path, "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-"]
+    try:
+        raw = subprocess.run(command, check=True, capture_output=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"音声のデコードに失敗しました: {e.stderr.decode(errors='ignore')}") from e
+    audio = np.frombuffer(raw, np.int16).astype(np.float32)
+    del raw
+    audio /= 32768.0
+    return audio
+
+
+def to_pyannote_input(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> dict:
+    """
+    pyannote の Pipeline に渡すインメモリ形式（{"waveform": (チャンネル, サンプル) のTensor, "sample_rate": ...}）に変換する。
+    torch.from_numpy はメモリを共有するため、配列のコピーは発生しません。
+    """
+    return {"waveform": torch.from_numpy(audio).unsqueeze(0), "sample_rate": sample_rate}
@@ -0,0 +1,162 @@
+# backend/context_assembler.py
+
+import os
+import tiktoken
+
+# モデルごとのコンテキスト用トークン予算（プロンプトのうち、検索結果に割り当てる上限）
+# 注: 回答品質とコストのバランスを見て決めた値で、各モデルのコンテキスト長の上限ではありません
+MODEL_CONTEXT_TOKEN_BUDGETS = {
+    "gpt-4o-mini": 3000,
+    "gpt-4o": 3000,
+    "gemini-1.5-flash-latest": 4000,
+    "gemini-1.5-pro-latest": 4000,
+    "claude-3-haiku-20240307": 3000,
+    "claude-3-sonnet-20240229": 3000,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = 3000
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+# 隣接チャンクの重複とみなす最小の一致文字数（これより短い一致は偶然とみなす）
+MIN_OVERLAP_CHARS = 20
+
+
+def _get_encoding(model_name: str):
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _overlap_length(head: str, tail: str) -> int:
+    """head の末尾と tail の先頭が一致する最長の文字数を返す。MIN_OVERLAP_CHARS 未満なら0。"""
+    for length in range(min(len(head), len(tail)), MIN_OVERLAP_CHARS - 1, -1):
+        if head.endswith(tail[:length]):
+            return length
+    return 0
+
+
+class ContextAssembler:
+    """
+    ナレッジベースの検索結果から、LLMに渡すコンテキスト文字列を組み立てるクラス。
+
+    - 同じ議事録の隣接チャンクを1つにまとめ、チャンク間で重複している文字列を取り除く
+    - 関連度の高い順にトークン予算へ詰め、収まらないものは落とす
+    - 採用したものを会議の日付順（同じ会議内は発言順）に並べる
+    """
+
+    def __init__(self, model_name: str = "gpt-4o-mini", token_budget: int | None = None):
+        """
+        Args:
+            model_name (str): 回答を生成するモデル名。トークン数の計算と既定の予算に使います。
+            token_budget (int | None): コンテキストに使う最大トークン数。省略時は環境変数
+                KNOWLEDGE_CONTEXT_TOKEN_BUDGET、なければ MODEL_CONTEXT_TOKEN_BUDGETS の値を使います。
+        """
+        self.model_name = model_name
+        env_budget = os.getenv("KNOWLEDGE_CONTEXT_TOKEN_BUDGET")
+        self.token_budget = token_budget or (int(env_budget) if env_budget else MODEL_CONTEXT_TOKEN_BUDGETS.get(model_name, DEFAULT_CONTEXT_TOKEN_BUDGET))
+        self.encoding = _get_encoding(model_name)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    def assemble(self, retrieved: dict) -> dict:
+        """
+        Args:
+            retrieved (dict): KnowledgeBaseManager.query_knowledge_base の戻り値（ids / documents / metadatas）。
+
+        Returns:
+            dict: context（組み立てたコンテキスト）, source_ids（採用したチャンクID）,
+                source_files（source_ids と同じ順の、各チャンクのソースファイル名）,
+                naive_tokens（検索結果を単純に連結した場合のトークン数）, context_tokens,
+                tokens_saved（naive_tokens - context_tokens。チャンク見出しの分だけ context が長くなる場合があるため 0 で下限を取る）。
+        """
+        documents = retrieved.get("documents", [])
+        naive_tokens = self.count_tokens(CONTEXT_SEPARATOR.join(documents))
+        segments = self._merge_segments(retrieved)
+
+        selected, used_tokens = [], 0
+        for segment in sorted(segments, key=lambda s: s["rank"]):
+            text = self._format_segment(segment)
+            tokens = self.count_tokens(text) + (self.count_tokens(CONTEXT_SEPARATOR) if selected else 0)
+            if used_tokens + tokens > self.token_budget:
+                if selected:
+                    continue
+                # 最も関連度の高い断片すら収まらない場合は、予算に収まるように切り詰めて使う
+                text = self.encoding.decode(self.encoding.encode(text)[:self.token_budget])
+                tokens = self.count_tokens(text)
+            selected.append({**segment, "formatted": text})
+            used_tokens += tokens
+
+        selected.sort(key=lambda s: (s["created_at"] or "~", s["order"]))
+        context = CONTEXT_SEPARATOR.join(s["formatted"] for s in selected)
+        context_tokens = self.count_tokens(context)
+        tokens_saved = max(0, naive_tokens - context_tokens)
+        print(f"Context Assembled: {len(documents)} chunks -> {len(selected)} segments, Tokens: {naive_tokens} -> {context_tokens} (saved {tokens_saved}, budget {self.token_budget})")
+        return {
+            "context": context,
+            "source_ids": [chunk_id for s in selected for chunk_id in s["ids"]],
+            "source_files": [s["source_file"] for s in selected for _ in s["ids"]],
+            "naive_tokens": naive_tokens,
+            "context_tokens": context_tokens,
+            "tokens_saved": tokens_saved,
+        }
+
+    def _merge_segments(self, retrieved: dict) -> list[dict]:
+        """同じソースのチャンクを、チャンク番号が連続するか文字列が重複していれば1つに結合する。"""
+        ids = retrieved.get("ids", [])
+        documents = retrieved.get("documents", [])
+        metadatas = retrieved.get("metadatas") or [{} for _ in documents]
+
+        groups = {}
+        for rank, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+            metadata = metadata or {}
+            chunk_index = metadata.get("chunk_index")
+            groups.setdefault(metadata.get("source_file", ""), []).append({
+                "ids": [chunk_id], "text": document, "rank": rank,
+                "first_index": chunk_index, "last_index": chunk_index,
+                "order": metadata.get("start_time", chunk_index if chunk_index is not None else rank),
+                "created_at": metadata.get("created_at", ""), "source_file": metadata.get("source_file", ""),
+            })
+
+        segments = []
+        for group in groups.values():
+            # チャンク番号がない古いデータは検索順のまま扱う
+            group.sort(key=lambda s: (s["first_index"] is None, s["first_index"] if s["first_index"] is not None else s["rank"]))
+            merged = True
+            while merged:
+                merged = False
+                for i in range(len(group)):
+                    for j in range(len(group)):
+                        if i != j and self._try_merge(group[i], group[j]):
+                            group.pop(j)
+                            merged = True
+                            break
+                    if merged:
+                        break
+            segments.extend(group)
+        return segments
+
+    @staticmethod
+    def _try_merge(head: dict, tail: dict) -> bool:
+        """tail を head の後ろに結合できれば head を更新して True を返す。"""
+        if tail["text"] in head["text"]:
+            head["ids"] += tail["ids"]; head["rank"] = min(head["rank"], tail["rank"])
+            return True
+        adjacent = head["last_index"] is not None and tail["first_index"] is not None and tail["first_index"] == head["last_index"] + 1
+        overlap = _overlap_length(head["text"], tail["text"])
+        if not adjacent and not overlap:
+            return False
+        joiner = "" if overlap else "\n"
+        head["text"] = head["text"] + joiner + tail["text"][overlap:]
+        head["ids"] += tail["ids"]
+        head["rank"] = min(head["rank"], tail["rank"])
+        head["last_index"] = tail["last_index"] if tail["last_index"] is not None else head["last_index"]
+        return True
+
+    @staticmethod
+    def _format_segment(segment: dict) -> str:
+        """どの会議のいつの発言かがLLMに分かるよう、見出しを付ける。"""
+        header = f"[会議: {segment['source_file'] or '不明'}"
+        if segment["created_at"]:
+            header += f" / 日付: {segment['created_at'][:10]}"
+        return f"{header}]\n{segment['text']}"
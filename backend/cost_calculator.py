@@ -1,5 +1,7 @@
 # backend/cost_calculator.py
 
+from metrics import COST_JPY
+
 # 2025年8月時点のおおよそのドル円レートを固定値として使用
 # 本番環境では、APIなどでリアルタイムに取得するのが望ましいです
 USD_TO_JPY_RATE = 145.0
@@ -30,7 +32,10 @@ def calculate_cost_in_jpy(model_name: str, total_input_tokens: int, total_output
     
     # 1. LLMのコストを計算 (USD)
     prices = MODEL_PRICES_PER_MILLION_TOKENS.get(model_name)
-    if not prices:
+    if model_name.startswith("mock-"):
+        # 負荷試験用のモックLLMは課金されない
+        llm_cost_usd = 0.0
+    elif not prices:
         print(f"警告: モデル '{model_name}' の料金情報が見つかりません。")
         llm_cost_usd = 0.0
     else:
@@ -45,6 +50,7 @@ def calculate_cost_in_jpy(model_name: str, total_input_tokens: int, total_output
     # 3. 合計コストを日本円に換算
     total_cost_usd = llm_cost_usd + whisper_cost_usd
     total_cost_jpy = total_cost_usd * USD_TO_JPY_RATE
+    COST_JPY.labels(model_name).inc(total_cost_jpy)
     
     print(f"Cost Calculated: LLM Tokens (in:{total_input_tokens}, out:{total_output_tokens}), Audio Duration: {audio_duration_seconds:.2f}s, Total Cost: ¥{total_cost_jpy:.4f}")
     
@@ -0,0 +1,71 @@
+# backend/gunicorn.conf.py
+#
+# マルチプロセスで動かすための gunicorn 設定。
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# - preload_app: 親プロセスで main をインポートし、PRELOAD_MODELS=true なら Whisper / pyannote もここで読み込む。
+#   ワーカーは fork 時にモデルのメモリをコピーオンライトで共有するため、ワーカーを増やしてもモデル分のメモリは増えない
+# - post_fork: ワーカーごとに torch のスレッド数と CPU アフィニティを設定する（ワーカー同士でコアを奪い合わないように）。
+#   親で読み込んだモデルの MODEL_LOADED もワーカーで設定し直す
+# - max_requests / WORKER_MAX_JOBS: メモリの増加を抑えるため、一定数の処理でワーカーを入れ替える
+
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# 長い録音の分析は数分かかるため、タイムアウトは長めにする
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "1800"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "600"))
+# 全リクエスト（/metrics や /history を含む）での入れ替え。重い処理の件数での入れ替えは WORKER_MAX_JOBS（main.py）
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# ワーカー1つあたりの torch スレッド数（0 なら CPU数 / ワーカー数）
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "0"))
+# true なら各ワーカーを担当のCPUコアに固定する
+PIN_WORKER_CPUS = os.getenv("PIN_WORKER_CPUS", "true").lower() == "true"
+
+# /metrics をワーカー間で集計するための prometheus_client のマルチプロセスモード
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# preload_app では on_starting より前に main（と metrics）がインポートされるため、ディレクトリはこの設定ファイルの読み込み時に用意する。
+# 設定の再読み込み（SIGHUP）では、動いているワーカーのファイルを消さないように何もしない
+if PROMETHEUS_MULTIPROC_DIR and not os.getenv("TRUSTALK_MULTIPROC_DIR_READY"):
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    os.environ["TRUSTALK_MULTIPROC_DIR_READY"] = "1"
+
+
+def pre_fork(server, worker):
+    """親プロセスで、空いているワーカー番号を割り当てる（入れ替え後も同じコアの組を引き継ぐため）。"""
+    used_slots = {getattr(w, "slot", None) for w in server.WORKERS.values()}
+    worker.slot = next(slot for slot in range(server.num_workers + 1) if slot not in used_slots)
+
+
+def post_fork(server, worker):
+    import sys
+    import torch
+
+    available_cpus = sorted(os.sched_getaffinity(0))
+    per_worker = max(1, len(available_cpus) // max(1, server.num_workers))
+    threads = TORCH_THREADS_PER_WORKER or per_worker
+    torch.set_num_threads(threads)
+    cpus = None
+    if PIN_WORKER_CPUS and len(available_cpus) >= server.num_workers:
+        start = (worker.slot % server.num_workers) * per_worker
+        cpus = available_cpus[start:start + per_worker]
+        os.sched_setaffinity(0, cpus)
+    os.environ["TRUSTALK_GUNICORN_WORKER"] = "1"
+    # マルチプロセスモードのメトリクスはプロセスごとのため、親で読み込んだモデルの状態をワーカーで設定し直す
+    app_module = sys.modules.get("main")
+    if app_module:
+        app_module.mark_loaded_models()
+    server.log.info(f"Worker {worker.pid} (slot {worker.slot}): torch threads={threads}, cpus={cpus or 'all'}")
+
+
+def child_exit(server, worker):
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
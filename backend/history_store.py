@@ -0,0 +1,25 @@
+# backend/history_store.py
+
+import json
+import os
+
+
+def summarize_history_record(data: dict) -> dict:
+    """履歴一覧に表示する項目だけを取り出す。"""
+    reliability_data = data.get("reliability", {})
+    score = reliability_data.get("score", 0.0) if isinstance(reliability_data, dict) else 0.0
+    return { "id": data.get("id"), "createdAt": data.get("createdAt"), "originalFilename": data.get("originalFilename", "ファイル名不明"), "cost": data.get("cost", 0.0), "model_name": data.get("model_name", "不明"), "reliability_score": score }
+
+
+def list_history_summaries(history_dir: str) -> list[dict]:
+    """
+    履歴ディレクトリ内のすべての分析結果を読み込み、作成日時の新しい順に一覧用のサマリーを返す。
+    """
+    history_summary = []
+    files = [f for f in os.listdir(history_dir) if f.endswith(".json")]
+    for filename in files:
+        file_path = os.path.join(history_dir, filename)
+        with open(file_path, "r", encoding="utf-8") as f:
+            history_summary.append(summarize_history_record(json.load(f)))
+    valid_history = [h for h in history_summary if h.get("createdAt")]
+    return sorted(valid_history, key=lambda x: x["createdAt"], reverse=True)
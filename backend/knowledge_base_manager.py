@@ -3,12 +3,14 @@ __import__('pysqlite3')
 import sys
 sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
 
+import asyncio
 import chromadb
 import os
 import openai
 from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import uuid
+from transcript_chunker import TranscriptChunker
+from vector_index import QuantizedVectorIndex
 
 # このファイル自身の場所を基準に、絶対的なパスを構築する
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -16,34 +18,52 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 class KnowledgeBaseManager:
     """
     ミーティングのナレッジを管理するためのクラス。
-    ベクトルデータベース(ChromaDB)への接続、データの追加、検索を担当します。
+    ベクトルデータベース(ChromaDB、またはint8量子化のメモリマップインデックス)への接続、データの追加、検索を担当します。
     """
     # BASE_DIRを基準にDBのパスを構築
     DB_PATH = os.path.join(BASE_DIR, "db", "chroma_db")
+    MMAP_INDEX_PATH = os.path.join(BASE_DIR, "db", "mmap_index")
     COLLECTION_NAME = "meeting_transcripts"
+    # "chroma"（既定）または "mmap"
+    DEFAULT_BACKEND = os.getenv("KNOWLEDGE_BASE_BACKEND", "chroma")
+    # mmapバックエンドの検索方式: "exact" または "ivf"
+    MMAP_SEARCH_MODE = os.getenv("KNOWLEDGE_BASE_SEARCH_MODE", "exact")
 
-    def __init__(self):
+    def __init__(self, backend: str | None = None):
         """
         KnowledgeBaseManagerを初期化します。
         DBへの接続とコレクションの準備を行います。
+
+        Args:
+            backend (str | None): "chroma" または "mmap"。省略時は環境変数 KNOWLEDGE_BASE_BACKEND の値を使います。
         """
-        os.makedirs(self.DB_PATH, exist_ok=True)
-        
-        self.client = chromadb.PersistentClient(path=self.DB_PATH)
-        self.collection = self.client.get_or_create_collection(name=self.COLLECTION_NAME)
+        self.backend = backend or self.DEFAULT_BACKEND
         
         if "OPENAI_API_KEY" not in os.environ:
             raise ValueError("環境変数 `OPENAI_API_KEY` が設定されていません。")
         openai.api_key = os.environ["OPENAI_API_KEY"]
         
         self.embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-        )
+
+        if self.backend == "chroma":
+            os.makedirs(self.DB_PATH, exist_ok=True)
+            self.db_path = self.DB_PATH
+            self.client = chromadb.PersistentClient(path=self.DB_PATH)
+            self.collection = self.client.get_or_create_collection(name=self.COLLECTION_NAME)
+        elif self.backend == "mmap":
+            # 埋め込みは OpenAIEmbeddings で計算し、int8に量子化してメモリマップファイルへ保存する
+            self.db_path = os.path.join(self.MMAP_INDEX_PATH, self.COLLECTION_NAME)
+            self.client = None
+            self.collection = QuantizedVectorIndex(self.db_path, embedding_function=self.embedding_model, search_mode=self.MMAP_SEARCH_MODE)
+        else:
+            raise ValueError(f"サポートされていないナレッジベースのバックエンドです: {self.backend}")
+
+        # 話者ターンと日本語の文境界で区切り、トークン数でサイズを決めるチャンカー（重複なし）
+        self.text_splitter = TranscriptChunker(max_tokens=400, overlap_sentences=0)
         
         print("✅ ナレッジベースの準備が完了しました。")
-        print(f"データベースのパス: {os.path.abspath(self.DB_PATH)}")
+        print(f"バックエンド: {self.backend}")
+        print(f"データベースのパス: {os.path.abspath(self.db_path)}")
         print(f"コレクション名: {self.collection.name}")
         print(f"現在のナレッジ数: {self.collection.count()}")
 
@@ -66,28 +86,76 @@ class KnowledgeBaseManager:
         
         print(f"✅ ソース: {metadata.get('source_file', '不明')} から {len(chunks)}個のナレッジを追加しました。")
 
-    def search_knowledge_base(self, query_text: str, n_results: int = 5) -> list[str]:
+    def add_transcript_to_knowledge_base(self, speakers_text: str, metadata: dict, speaker_turns: list[dict] | None = None):
         """
-        ナレッジベースを検索し、クエリに関連性の高いドキュメントのリストを返します。
+        話者分離済みの文字起こしをナレッジベースに追加します。
+        speaker_turns（分析結果の話者ターン）があれば、それを使って各チャンクに発言時刻も記録します。
+        """
+        if speaker_turns:
+            chunks = self.text_splitter.split_turns(speaker_turns)
+        else:
+            chunks = self.text_splitter.split_transcript(speakers_text or "")
+        if not chunks:
+            print(f"⚠️  ソース: {metadata.get('source_file', '不明')} のコンテンツが空のため、スキップします。")
+            return
+
+        self.collection.add(
+            ids=[str(uuid.uuid4()) for _ in chunks],
+            documents=[chunk["text"] for chunk in chunks],
+            metadatas=[{**metadata, **chunk["metadata"]} for chunk in chunks]
+        )
+
+        print(f"✅ ソース: {metadata.get('source_file', '不明')} から {len(chunks)}個のナレッジを追加しました。")
+
+    def query_knowledge_base(self, query_text: str, n_results: int = 5) -> dict:
+        """
+        ナレッジベースを検索し、関連チャンクのID・本文・メタデータをまとめて返します。
         """
         print(f"🔍 ナレッジベースを検索中... クエリ: '{query_text}'")
         results = self.collection.query(
             query_texts=[query_text],
             n_results=n_results
         )
-        
-        # 'documents' の中の最初のリスト（クエリは1つなので）を返す
+
+        # 各キーの最初のリスト（クエリは1つなので）を取り出す
         retrieved_docs = results['documents'][0]
+        metadatas = results.get('metadatas') or [[{} for _ in retrieved_docs]]
         print(f"✅ {len(retrieved_docs)}個の関連ドキュメントを取得しました。")
-        return retrieved_docs
+        return {
+            "ids": results['ids'][0],
+            "documents": retrieved_docs,
+            "metadatas": [m or {} for m in metadatas[0]],
+        }
+
+    def search_knowledge_base(self, query_text: str, n_results: int = 5) -> list[str]:
+        """
+        ナレッジベースを検索し、クエリに関連性の高いドキュメントのリストを返します。
+        """
+        return self.query_knowledge_base(query_text, n_results)["documents"]
+
+    async def aquery_knowledge_base(self, query_text: str, n_results: int = 5) -> dict:
+        """
+        query_knowledge_base の非同期版。
+        ChromaDBのクライアントは同期APIのみのため、イベントループを塞がないようスレッドで実行します。
+        """
+        return await asyncio.to_thread(self.query_knowledge_base, query_text, n_results)
+
+    async def asearch_knowledge_base(self, query_text: str, n_results: int = 5) -> list[str]:
+        """
+        search_knowledge_base の非同期版。
+        """
+        return (await self.aquery_knowledge_base(query_text, n_results))["documents"]
         
     def reset_database(self):
         """
         データベースのコレクションを一度削除し、再作成することで中身を空にします。
         """
         print("🗑️ データベースをリセットしています...")
-        self.client.delete_collection(name=self.COLLECTION_NAME)
-        self.collection = self.client.get_or_create_collection(name=self.COLLECTION_NAME)
+        if self.backend == "mmap":
+            self.collection.reset()
+        else:
+            self.client.delete_collection(name=self.COLLECTION_NAME)
+            self.collection = self.client.get_or_create_collection(name=self.COLLECTION_NAME)
         print("✅ データベースのリセットが完了しました。")
 
 # このファイルが直接実行された場合のテスト用コード
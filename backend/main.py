@@ -3,28 +3,44 @@ import uuid
 import json
 import torch
 import traceback
-import subprocess
 import re
 import threading
+import asyncio
+import zipfile
+import contextlib
+import fcntl
+import shutil
+import signal
+import gc
+import time
 from datetime import datetime, timezone
 from typing import List
 from pydantic import BaseModel
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Response, Header
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pyannote.audio import Pipeline
-import whisper_timestamped as whisper
-from ai_pipelines import run_self_improvement_pipeline, run_benchmark_pipeline
+from asr_engines import ASR_PROFILES, DEFAULT_ASR_PROFILE, create_engine
+from ai_pipelines import run_self_improvement_pipeline, run_benchmark_pipeline, is_pipeline_error
 from cost_calculator import calculate_cost_in_jpy
+from audio_io import SAMPLE_RATE, decode_audio, to_pyannote_input
+from vad import filter_speech, remap_transcription
+from transcript_utils import merge_results_with_turns, parse_speaker_contributions
+from history_store import list_history_summaries
+from stage_timer import StageTimer, track_stage
+from request_profiler import start_profiling, delete_profile
+from model_router import model_router
+from admission_control import AdmissionRejected, admission_controller, probe_audio_duration
+from metrics import ERRORS, IN_FLIGHT, MODEL_LOADED, UPLOAD_SIZE, observe_whisper_rtf, render_metrics
 from io import BytesIO
 
 # --- 追加機能のためのインポート ---
 import asana
 from asana.rest import ApiException
 from knowledge_base_manager import KnowledgeBaseManager
-from langchain_openai import ChatOpenAI
+from context_assembler import ContextAssembler
 from langchain_core.prompts import ChatPromptTemplate
-from models import get_llm
+from models import get_llm, get_provider
 
 # --- 環境変数 ---
 HF_TOKEN = os.getenv("HF_TOKEN")
@@ -33,19 +49,28 @@ if not HF_TOKEN:
 
 # --- AIモデルのグローバル変数 (遅延読み込み) ---
 device = "cuda" if torch.cuda.is_available() else "cpu"
-whisper_model = None
+# ASRプロファイル名 -> 読み込み済みのエンジン
+asr_engines = {}
 diarization_pipeline = None
 whisper_lock = threading.Lock()
 pyannote_lock = threading.Lock()
+# 文字起こしと話者分離はCPU（GPU）を使い切るため、/analyze・/benchmark-summary・/analyze-batch をまたいでプロセス内で1件ずつ実行する
+inference_lock = asyncio.Lock()
 
 # --- モデル読み込み関数 ---
-def load_whisper_model():
-    global whisper_model
+def load_whisper_model(profile_name: str = None):
+    """指定したASRプロファイルのエンジンを返す（初回のみ読み込む）。"""
+    profile_name = profile_name or DEFAULT_ASR_PROFILE
     with whisper_lock:
-        if whisper_model is None:
-            print("Whisper: Loading 'base' model for the first time...")
-            whisper_model = whisper.load_model("base", device=device)
-            print("Whisper: Model loaded successfully.")
+        if profile_name not in asr_engines:
+            profile = ASR_PROFILES.get(profile_name)
+            if profile is None:
+                raise HTTPException(status_code=400, detail=f"不明なASRプロファイルです: {profile_name}（{', '.join(ASR_PROFILES)} から選択）")
+            print(f"ASR: Loading profile '{profile_name}' ({profile['engine']} / {profile['model_size']} / {profile['compute_type']}) for the first time...")
+            asr_engines[profile_name] = create_engine(profile_name, device)
+            MODEL_LOADED.labels(f"asr:{profile_name}").set(1)
+            print("ASR: Model loaded successfully.")
+        return asr_engines[profile_name]
 
 def load_pyannote_pipeline():
     global diarization_pipeline
@@ -53,8 +78,78 @@ def load_pyannote_pipeline():
         if diarization_pipeline is None:
             print("Pyannote: Loading diarization pipeline for the first time...")
             diarization_pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization-3.1", use_auth_token=HF_TOKEN).to(torch.device(device))
+            MODEL_LOADED.labels("pyannote").set(1)
             print("Pyannote: Diarization pipeline loaded successfully.")
 
+def mark_loaded_models():
+    """読み込み済みのモデルを MODEL_LOADED に反映する（gunicorn の post_fork から、fork 後のワーカーで呼ぶ）。"""
+    for profile_name in asr_engines:
+        MODEL_LOADED.labels(f"asr:{profile_name}").set(1)
+    if diarization_pipeline is not None:
+        MODEL_LOADED.labels("pyannote").set(1)
+
+def transcribe_speech(asr_engine, audio, detect_disfluencies: bool | None = None):
+    """
+    VADで発話区間だけを切り出して文字起こしし、タイムスタンプを元の録音の時刻に戻す。
+    戻り値は (文字起こし結果, VADの統計情報)。
+    """
+    with track_stage("vad"):
+        speech_audio, mapping, vad_stats = filter_speech(audio)
+    started = time.perf_counter()
+    with track_stage("transcribe", model=asr_engine.profile_name):
+        transcription_result = asr_engine.transcribe(speech_audio, language="ja", detect_disfluencies=detect_disfluencies)
+    if mapping:
+        remap_transcription(transcription_result, mapping)
+        # 切り出し後の長さあたりの処理時間から、省けた処理時間を概算する
+        seconds_per_audio_second = (time.perf_counter() - started) / max(len(speech_audio) / SAMPLE_RATE, 1e-6)
+        vad_stats["estimated_seconds_saved"] = round(vad_stats["skipped_seconds"] * seconds_per_audio_second, 2)
+    print(f"VAD: 発話 {vad_stats['speech_seconds']:.1f}s / {vad_stats['audio_seconds']:.1f}s (割合 {vad_stats['speech_ratio']:.0%}), 切り出し: {vad_stats['applied']}")
+    return transcription_result, vad_stats
+
+# --- 一括分析（/analyze-batch）の設定 ---
+BATCH_AUDIO_EXTENSIONS = (".mp3", ".m4a", ".wav", ".mp4", ".aac", ".flac", ".ogg", ".webm")
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+# zip から展開する音声ファイルの合計サイズの上限（展開前に zip のファイル一覧で確認する）
+BATCH_MAX_EXTRACTED_BYTES = int(os.getenv("BATCH_MAX_EXTRACTED_BYTES", str(2 * 1024 ** 3)))
+# ffmpeg のデコードは別プロセスなので並列に実行できる
+BATCH_DECODE_CONCURRENCY = int(os.getenv("BATCH_DECODE_CONCURRENCY", "4"))
+# プロバイダーごとのLLM同時呼び出し数（レート制限を超えないように）
+PROVIDER_CONCURRENCY = {
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", "4")),
+    "google": int(os.getenv("GOOGLE_MAX_CONCURRENCY", "2")),
+    "anthropic": int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "2")),
+    "mock": int(os.getenv("MOCK_MAX_CONCURRENCY", "16")),
+}
+provider_semaphores = {provider: threading.BoundedSemaphore(limit) for provider, limit in PROVIDER_CONCURRENCY.items()}
+
+def run_pipeline_with_provider_limit(model_name: str, transcript_text: str):
+    """プロバイダーごとの同時呼び出し数の上限内で要約パイプラインを実行する（スレッドから呼ぶ）。"""
+    semaphore = provider_semaphores.get(get_provider(model_name))
+    if semaphore is None:
+        return run_self_improvement_pipeline(model_name, transcript_text)
+    with semaphore:
+        return run_self_improvement_pipeline(model_name, transcript_text)
+
+# --- gunicorn（gunicorn.conf.py）で複数ワーカーとして動かす場合の設定 ---
+# preload_app により親プロセスでモデルを読み込み、ワーカーにコピーオンライトで共有する
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "false").lower() == "true"
+# ワーカーがこの件数の重い処理を終えたら入れ替える（0 なら無効）
+WORKER_MAX_JOBS = int(os.getenv("WORKER_MAX_JOBS", "0"))
+worker_jobs_done = 0
+
+def count_finished_job():
+    global worker_jobs_done
+    worker_jobs_done += 1
+    if WORKER_MAX_JOBS and worker_jobs_done == WORKER_MAX_JOBS and os.getenv("TRUSTALK_GUNICORN_WORKER"):
+        # SIGTERM で処理中のリクエストを終えてから終了し、gunicorn が新しいワーカーを起動する
+        print(f"Worker {os.getpid()}: {worker_jobs_done}件の処理を終えたため、ワーカーを入れ替えます。")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+if PRELOAD_MODELS:
+    load_whisper_model(); load_pyannote_pipeline()
+    # 読み込み済みのオブジェクトを GC の対象外にし、fork 後に参照カウント以外でページが書き換わるのを防ぐ
+    gc.freeze()
+
 # --- FastAPIアプリケーションのセットアップ ---
 app = FastAPI(title="Trustalk API", version="3.0.0")
 
@@ -71,45 +166,71 @@ app.add_middleware(
 )
 HISTORY_DIR = "history"
 os.makedirs(HISTORY_DIR, exist_ok=True)
+PROFILE_DIR = os.path.join(HISTORY_DIR, "profiles")
 
 # --- ナレッジベースとLLMの準備 ---
 kb_manager = KnowledgeBaseManager()
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+# 負荷試験ではモック（例: mock-gpt）に差し替えられるよう、環境変数でモデルを指定できる
+KNOWLEDGE_LLM_MODEL = os.getenv("KNOWLEDGE_LLM_MODEL", "gpt-4o-mini")
+llm = get_llm(KNOWLEDGE_LLM_MODEL)
+context_assembler = ContextAssembler(model_name=KNOWLEDGE_LLM_MODEL)
+KNOWLEDGE_BASE_PROMPT = ChatPromptTemplate.from_template(
+    """あなたはTrustalkプロジェクトの優秀なAIアシスタントです。
+過去のミーティング議事録から検索された以下の「コンテキスト情報」のみに基づいて、ユーザーの「質問」に日本語で回答してください。
+コンテキスト情報に答えがない場合は、「ナレッジベースには関連する情報が見つかりませんでした。」と回答してください。
+
+# コンテキスト情報
+{context}
+
+# 質問
+{question}
+"""
+)
 
 
 # --- ヘルパー関数 ---
-def merge_results(diarization, transcription):
-    if not diarization: return "話者分離パイプラインが利用できません。", transcription.get("text", "")
-    word_speakers, current_speaker, current_speech = [], None, ""
-    for segment in transcription.get("segments", []):
-        for word in segment.get("words", []):
-            speaker_label = "UNKNOWN"
-            try:
-                cropped_annotation = diarization.crop(word)
-                if cropped_annotation:
-                    speaker_turn = cropped_annotation.get_timeline().support().pop(0)
-                    speaker_label = speaker_turn[2]
-            except (IndexError, KeyError): speaker_label = "UNKNOWN"
-            word_speakers.append({'word': word.get('text', ''), 'speaker': speaker_label})
-    if not word_speakers: return "発言が見つかりませんでした。", transcription.get("text", "")
-    full_transcript_with_speakers, current_speaker, current_speech = "", word_speakers[0]['speaker'], ""
-    for item in word_speakers:
-        word, speaker = item['word'], item['speaker']
-        if speaker != current_speaker:
-            full_transcript_with_speakers += f"**{current_speaker}**: {current_speech.strip()}\n\n"; current_speech = ""
-        current_speech += word + " "; current_speaker = speaker
-    if current_speech: full_transcript_with_speakers += f"**{current_speaker}**: {current_speech.strip()}\n"
-    return full_transcript_with_speakers.strip(), transcription.get("text", "")
+# アップロードをディスクに書き出すときに一度に読む大きさ
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+async def save_upload(file: UploadFile, path: str) -> int:
+    """アップロードを UPLOAD_CHUNK_BYTES ずつディスクに書き出し、そのバイト数を返す（全体をメモリに載せない）。"""
+    size = 0
+    with open(path, "wb") as buffer:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            buffer.write(chunk); size += len(chunk)
+    return size
+
+async def run_blocking(profiler, fn, *args):
+    """
+    デコード・文字起こし・話者分離・LLMなどの重い処理をスレッドで実行し、イベントループを止めない。
+    プロファイル中のリクエストでは、そのスレッドもプロファイルの対象にする。
+    """
+    def call():
+        with profiler.follow_thread() if profiler else contextlib.nullcontext():
+            return fn(*args)
+    return await asyncio.to_thread(call)
+
+def build_knowledge_prompt(question: str, context_text: str) -> str:
+    return KNOWLEDGE_BASE_PROMPT.format(context=context_text, question=question)
+
+def format_sse(event: str, data: dict) -> str:
+    """Server-Sent Events の1イベント分の文字列を生成する。"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 # --- Pydanticモデル定義 ---
 class DeleteHistoryRequest(BaseModel):
     ids: List[str]
 
+class RerunRequest(BaseModel):
+    models: List[str]
+
 class AskRequest(BaseModel):
     question: str
 
 class AskResponse(BaseModel):
     answer: str
+    context_tokens: int = 0
+    tokens_saved: int = 0
 
 class SpeakerContribution(BaseModel):
     name: str
@@ -131,60 +252,264 @@ class AsanaExportResponse(BaseModel):
 @app.get("/", summary="APIのヘルスチェック")
 def read_root(): return {"status": "ok"}
 
+@app.get("/metrics", summary="Prometheus形式のメトリクス")
+def get_metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 @app.post("/analyze", summary="音声ファイルの分析")
-async def analyze_audio(file: UploadFile = File(...), model_name: str = Form("gpt-4o-mini")):
-    load_whisper_model(); load_pyannote_pipeline()
+async def analyze_audio(file: UploadFile = File(...), model_name: str = Form("gpt-4o-mini"), routing: bool = Form(False, description="true の場合、混雑時は指定モデルより速い・安いモデルに切り替える（model_name=auto でも有効）"), asr_profile: str | None = Form(None, description="fast / balanced / accurate / legacy（未指定なら ASR_PROFILE）"), detect_disfluencies: bool | None = Form(None, description="言いよどみ検出の有無（未指定ならプロファイルの設定）"), x_profile: str | None = Header(None, description="sample または cprofile を指定すると、このリクエストのプロファイルを保存する")):
+    asr_engine = await asyncio.to_thread(load_whisper_model, asr_profile); await asyncio.to_thread(load_pyannote_pipeline)
+    endpoint = "analyze"
     original_filename, temp_file_path = file.filename, f"/tmp/{uuid.uuid4()}_{file.filename}"
-    wav_file_path = f"{os.path.splitext(temp_file_path)[0]}.wav"
+    timer = StageTimer()
+    admission_ticket = None
+    profiler = start_profiling(x_profile)
+    IN_FLIGHT.labels(endpoint).inc()
+    routing_info, llm_job_started = None, False
     try:
-        with open(temp_file_path, "wb") as buffer: contents = await file.read(); buffer.write(contents)
-        command = ["ffmpeg", "-i", temp_file_path, "-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le", wav_file_path]; subprocess.run(command, check=True, capture_output=True, text=True)
-        audio = whisper.load_audio(wav_file_path)
-        audio_duration_seconds = len(audio) / whisper.audio.SAMPLE_RATE
-        transcription_result = whisper.transcribe(whisper_model, audio, language="ja", detect_disfluencies=True)
-        diarization_result = diarization_pipeline(wav_file_path)
-        speakers_text, transcript_text = merge_results(diarization_result, transcription_result)
-        cleaned_text = re.sub(r'[\(\[].*?[\)\]]', '', transcript_text or "").strip()
-        if len(cleaned_text) < 10:
-            summary_text, todos_list, reliability_info, token_usage = "- 音声が短すぎるため要約できません。", [], {"score": 0.0, "justification": "評価できません。"}, {"input_tokens": 0, "output_tokens": 0}
-        else:
-            summary_text, todos_list, reliability_info, token_usage = run_self_improvement_pipeline(model_name, transcript_text)
-        calculated_cost_jpy = calculate_cost_in_jpy(model_name=model_name, total_input_tokens=token_usage.get("input_tokens", 0), total_output_tokens=token_usage.get("output_tokens", 0), audio_duration_seconds=audio_duration_seconds)
-        result = { "id": str(uuid.uuid4()), "createdAt": datetime.now(timezone.utc).isoformat(), "originalFilename": original_filename, "model_name": model_name, "transcript": transcript_text if transcript_text and transcript_text.strip() else "有効な音声が検出されませんでした。", "summary": summary_text, "todos": todos_list, "speakers": speakers_text, "cost": calculated_cost_jpy, "reliability": reliability_info }
-        history_file_path = os.path.join(HISTORY_DIR, f"{result['id']}.json")
-        with open(history_file_path, "w", encoding="utf-8") as f: json.dump(result, f, ensure_ascii=False, indent=4)
-        return JSONResponse(content=result)
+        with timer.activate():
+            with track_stage("upload"):
+                upload_size = await save_upload(file, temp_file_path)
+            UPLOAD_SIZE.labels(endpoint).observe(upload_size)
+            with track_stage("admission"):
+                admission_ticket = await admission_controller.acquire(endpoint, await run_blocking(profiler, probe_audio_duration, temp_file_path))
+            with track_stage("decode"):
+                audio = await run_blocking(profiler, decode_audio, temp_file_path)
+            audio_duration_seconds = len(audio) / SAMPLE_RATE
+            async with inference_lock:
+                transcription_result, vad_stats = await run_blocking(profiler, transcribe_speech, asr_engine, audio, detect_disfluencies)
+                observe_whisper_rtf(timer.duration("transcribe"), audio_duration_seconds)
+                with track_stage("diarize"):
+                    diarization_result = await run_blocking(profiler, diarization_pipeline, to_pyannote_input(audio))
+            with track_stage("merge"):
+                speakers_text, transcript_text, speaker_turns = await run_blocking(profiler, merge_results_with_turns, diarization_result, transcription_result)
+            # ルーターの処理中の分析数には、LLMの段階に入った分析だけを数える（/analyze-batch と同じ）
+            model_router.start_job(); llm_job_started = True
+            if routing or model_name == "auto":
+                routing_info = model_router.choose(model_name, transcript_text)
+                model_name = routing_info["model_name"]
+            cleaned_text = re.sub(r'[\(\[].*?[\)\]]', '', transcript_text or "").strip()
+            if len(cleaned_text) < 10:
+                summary_text, todos_list, reliability_info, token_usage = "- 音声が短すぎるため要約できません。", [], {"score": 0.0, "justification": "評価できません。"}, {"input_tokens": 0, "output_tokens": 0}
+            else:
+                summary_text, todos_list, reliability_info, token_usage = await run_blocking(profiler, run_pipeline_with_provider_limit, model_name, transcript_text)
+                model_router.record(model_name, sum(timer.duration(stage) for stage in ("llm_draft", "llm_review", "llm_revise", "llm_evaluate")), token_usage, transcript_text, succeeded=not is_pipeline_error(reliability_info))
+            calculated_cost_jpy = calculate_cost_in_jpy(model_name=model_name, total_input_tokens=token_usage.get("input_tokens", 0), total_output_tokens=token_usage.get("output_tokens", 0), audio_duration_seconds=audio_duration_seconds)
+            result = { "id": str(uuid.uuid4()), "createdAt": datetime.now(timezone.utc).isoformat(), "originalFilename": original_filename, "model_name": model_name, "transcript": transcript_text if transcript_text and transcript_text.strip() else "有効な音声が検出されませんでした。", "summary": summary_text, "todos": todos_list, "speakers": speakers_text, "speaker_turns": speaker_turns, "cost": calculated_cost_jpy, "reliability": reliability_info, "vad": vad_stats, "asr_profile": asr_engine.profile_name }
+            if routing_info:
+                result["routing"] = {"requested": routing_info["requested"], "chosen": model_name, "reason": routing_info["reason"]}
+            if profiler:
+                # プロファイルは履歴と同じIDで保存する（保存処理自体は計測に含めない）
+                profiler.save(PROFILE_DIR, result["id"], timer, endpoint)
+                result["profile_id"] = result["id"]
+            with track_stage("save"):
+                history_file_path = os.path.join(HISTORY_DIR, f"{result['id']}.json")
+                with open(history_file_path, "w", encoding="utf-8") as f: json.dump(result, f, ensure_ascii=False, indent=4)
+        admission_controller.release(admission_ticket)
+        return JSONResponse(content=result, headers={"Server-Timing": timer.server_timing_header()})
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after_seconds)})
+    except HTTPException:
+        raise
     except Exception as e:
+        ERRORS.labels(endpoint).inc()
         print(traceback.format_exc()); raise HTTPException(status_code=500, detail=f"分析中に予期せぬエラー: {str(e)}")
     finally:
+        if profiler: profiler.stop()
+        IN_FLIGHT.labels(endpoint).dec(); count_finished_job()
+        if llm_job_started: model_router.finish_job()
+        if admission_ticket: admission_controller.release(admission_ticket, succeeded=False)
         if os.path.exists(temp_file_path): os.remove(temp_file_path)
-        if os.path.exists(wav_file_path): os.remove(wav_file_path)
 
-@app.post("/api/ask-knowledge-base", response_model=AskResponse, tags=["Knowledge Base"])
-async def ask_knowledge_base(request: AskRequest):
+def collect_batch_files(saved_files: list[tuple[str, str]], workdir: str) -> list[tuple[str, str]]:
+    """
+    アップロードされたファイルのうち、zip は展開して音声ファイルだけを (ファイル名, パス) のリストにする（スレッドから呼ぶ）。
+    ファイル数と展開後の合計サイズは、展開する前に zip のファイル一覧で確認する（zip bomb でディスクを埋めないように）。
+    """
+    archives, audio_files = {}, []
     try:
-        context_docs = kb_manager.search_knowledge_base(request.question)
-        context_text = "\n\n---\n\n".join(context_docs)
-        prompt_template = ChatPromptTemplate.from_template(
-            """あなたはTrustalkプロジェクトの優秀なAIアシスタントです。
-過去のミーティング議事録から検索された以下の「コンテキスト情報」のみに基づいて、ユーザーの「質問」に日本語で回答してください。
-コンテキスト情報に答えがない場合は、「ナレッジベースには関連する情報が見つかりませんでした。」と回答してください。
+        n_files, extracted_bytes = 0, 0
+        for filename, path in saved_files:
+            if not filename.lower().endswith(".zip"):
+                n_files += 1
+                continue
+            archive = archives[path] = zipfile.ZipFile(path)
+            members = [m for m in archive.infolist() if not m.is_dir() and m.filename.lower().endswith(BATCH_AUDIO_EXTENSIONS)]
+            n_files += len(members)
+            extracted_bytes += sum(m.file_size for m in members)
+        if n_files > BATCH_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"一度に分析できるのは{BATCH_MAX_FILES}ファイルまでです。")
+        if extracted_bytes > BATCH_MAX_EXTRACTED_BYTES:
+            raise HTTPException(status_code=400, detail=f"zip を展開した音声ファイルの合計が上限（{BATCH_MAX_EXTRACTED_BYTES // 1024 ** 2}MB）を超えています。")
 
-# コンテキスト情報
-{context}
+        for filename, path in saved_files:
+            archive = archives.get(path)
+            if archive is None:
+                audio_files.append((filename, path))
+                continue
+            for member in archive.infolist():
+                # ディレクトリ名は捨て、ファイル名だけを使う（zip slip 対策）
+                member_name = os.path.basename(member.filename)
+                if member.is_dir() or not member_name.lower().endswith(BATCH_AUDIO_EXTENSIONS):
+                    continue
+                target_path = os.path.join(workdir, f"{uuid.uuid4()}_{member_name}")
+                # ZipExtFile は一覧の file_size を超えて読まないため、展開後の合計は上で確認した値に収まる
+                with archive.open(member) as source, open(target_path, "wb") as target: shutil.copyfileobj(source, target)
+                audio_files.append((member_name, target_path))
+    finally:
+        for archive in archives.values(): archive.close()
+    return audio_files
 
-# 質問
-{question}
-"""
-        )
-        prompt = prompt_template.format(context=context_text, question=request.question)
-        response_message = llm.invoke(prompt)
+@app.post("/analyze-batch", summary="複数の音声ファイル（またはzip）を一括で分析し、完了したものから順にNDJSONで返す")
+async def analyze_batch(files: List[UploadFile] = File(...), model_name: str = Form("gpt-4o-mini", description="auto の場合はファイルごとに混雑状況と料金からモデルを選ぶ"), asr_profile: str | None = Form(None, description="fast / balanced / accurate / legacy（未指定なら ASR_PROFILE）")):
+    """
+    1つのジョブとして複数ファイルを分析する。
+    - モデルの読み込みとLLMクライアントは全ファイルで共有する
+    - デコード（ffmpeg）は並列、文字起こしと話者分離はCPUを奪い合わないよう（/analyze とも共有のロックで）1件ずつ、LLMはプロバイダーの上限内で並列に実行する
+    - デコードの枠は話者分離が終わるまで持ち続け、メモリ上のデコード済み音声を BATCH_DECODE_CONCURRENCY 件までに抑える
+    - 1行1件のJSON（accepted → result / error → done）を、完了したファイルから順にストリーミングする
+    """
+    asr_engine = await asyncio.to_thread(load_whisper_model, asr_profile); await asyncio.to_thread(load_pyannote_pipeline)
+    endpoint = "analyze-batch"
+    batch_id = str(uuid.uuid4())
+    workdir = os.path.join("/tmp", f"batch_{batch_id}")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        saved_files = []
+        for upload in files:
+            path = os.path.join(workdir, f"{uuid.uuid4()}_{os.path.basename(upload.filename)}")
+            UPLOAD_SIZE.labels(endpoint).observe(await save_upload(upload, path))
+            saved_files.append((upload.filename, path))
+        audio_files = await asyncio.to_thread(collect_batch_files, saved_files, workdir)
+        if not audio_files:
+            raise HTTPException(status_code=400, detail="分析できる音声ファイルが含まれていません。")
+        durations = await asyncio.to_thread(lambda: [probe_audio_duration(path) for _, path in audio_files])
+        admission_ticket = await admission_controller.acquire(endpoint, sum(durations))
+    except AdmissionRejected as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after_seconds)})
+    except Exception:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+
+    decode_semaphore = asyncio.Semaphore(BATCH_DECODE_CONCURRENCY)
+    events = asyncio.Queue()
+
+    async def analyze_one(original_filename: str, path: str):
+        timer = StageTimer()
+        llm_job_started = False
+        try:
+            with timer.activate():
+                async with decode_semaphore:
+                    with track_stage("decode"):
+                        audio = await asyncio.to_thread(decode_audio, path)
+                    audio_duration_seconds = len(audio) / SAMPLE_RATE
+                    async with inference_lock:
+                        transcription_result, vad_stats = await asyncio.to_thread(transcribe_speech, asr_engine, audio)
+                        observe_whisper_rtf(timer.duration("transcribe"), audio_duration_seconds)
+                        with track_stage("diarize"):
+                            diarization_result = await asyncio.to_thread(diarization_pipeline, to_pyannote_input(audio))
+                    del audio
+                with track_stage("merge"):
+                    speakers_text, transcript_text, speaker_turns = merge_results_with_turns(diarization_result, transcription_result)
+                # ルーターの処理中の分析数には、LLMの段階に入ったファイルだけを数える（/analyze と同じ）
+                model_router.start_job(); llm_job_started = True
+                file_model_name, routing_info = model_name, None
+                if model_name == "auto":
+                    routing_info = model_router.choose(model_name, transcript_text)
+                    file_model_name = routing_info["model_name"]
+                cleaned_text = re.sub(r'[\(\[].*?[\)\]]', '', transcript_text or "").strip()
+                if len(cleaned_text) < 10:
+                    summary_text, todos_list, reliability_info, token_usage = "- 音声が短すぎるため要約できません。", [], {"score": 0.0, "justification": "評価できません。"}, {"input_tokens": 0, "output_tokens": 0}
+                else:
+                    summary_text, todos_list, reliability_info, token_usage = await asyncio.to_thread(run_pipeline_with_provider_limit, file_model_name, transcript_text)
+                    model_router.record(file_model_name, sum(timer.duration(stage) for stage in ("llm_draft", "llm_review", "llm_revise", "llm_evaluate")), token_usage, transcript_text, succeeded=not is_pipeline_error(reliability_info))
+                calculated_cost_jpy = calculate_cost_in_jpy(model_name=file_model_name, total_input_tokens=token_usage.get("input_tokens", 0), total_output_tokens=token_usage.get("output_tokens", 0), audio_duration_seconds=audio_duration_seconds)
+                result = { "id": str(uuid.uuid4()), "createdAt": datetime.now(timezone.utc).isoformat(), "originalFilename": original_filename, "model_name": file_model_name, "transcript": transcript_text if transcript_text and transcript_text.strip() else "有効な音声が検出されませんでした。", "summary": summary_text, "todos": todos_list, "speakers": speakers_text, "speaker_turns": speaker_turns, "cost": calculated_cost_jpy, "reliability": reliability_info, "vad": vad_stats, "asr_profile": asr_engine.profile_name, "batch_id": batch_id }
+                if routing_info:
+                    result["routing"] = {"requested": routing_info["requested"], "chosen": file_model_name, "reason": routing_info["reason"]}
+                with track_stage("save"):
+                    with open(os.path.join(HISTORY_DIR, f"{result['id']}.json"), "w", encoding="utf-8") as f: json.dump(result, f, ensure_ascii=False, indent=4)
+            await events.put({"event": "result", "file": original_filename, "result": result, "timing": timer.server_timing_header()})
+        except Exception as e:
+            ERRORS.labels(endpoint).inc()
+            print(traceback.format_exc())
+            await events.put({"event": "error", "file": original_filename, "detail": f"分析中に予期せぬエラー: {str(e)}"})
+        finally:
+            if llm_job_started: model_router.finish_job()
+
+    async def run_all():
+        try:
+            await asyncio.gather(*(analyze_one(name, path) for name, path in audio_files))
+        finally:
+            await events.put(None)
+
+    async def event_stream():
+        IN_FLIGHT.labels(endpoint).inc()
+        succeeded, failed = 0, 0
+        runner = asyncio.create_task(run_all())
+        try:
+            yield json.dumps({"event": "accepted", "batch_id": batch_id, "files": [name for name, _ in audio_files], "audio_seconds": sum(durations)}, ensure_ascii=False) + "\n"
+            while (event := await events.get()) is not None:
+                if event["event"] == "result": succeeded += 1
+                else: failed += 1
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+            yield json.dumps({"event": "done", "batch_id": batch_id, "succeeded": succeeded, "failed": failed}, ensure_ascii=False) + "\n"
+        finally:
+            if not runner.done(): runner.cancel()
+            admission_controller.release(admission_ticket, succeeded=failed == 0)
+            IN_FLIGHT.labels(endpoint).dec(); count_finished_job()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.post("/api/ask-knowledge-base", response_model=AskResponse, tags=["Knowledge Base"])
+async def ask_knowledge_base(request: AskRequest, response: Response):
+    timer = StageTimer()
+    try:
+        with timer.stage("knowledge_search"):
+            retrieved = await kb_manager.aquery_knowledge_base(request.question)
+        with timer.stage("assemble"):
+            assembled = context_assembler.assemble(retrieved)
+        prompt = build_knowledge_prompt(request.question, assembled["context"])
+        with timer.stage("generate", model=KNOWLEDGE_LLM_MODEL):
+            response_message = await llm.ainvoke(prompt)
         answer = response_message.content
-        return AskResponse(answer=answer)
+        response.headers["Server-Timing"] = timer.server_timing_header()
+        return AskResponse(answer=answer, context_tokens=assembled["context_tokens"], tokens_saved=assembled["tokens_saved"])
     except Exception as e:
+        ERRORS.labels("ask-knowledge-base").inc()
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"AIアシスタント処理中にエラーが発生しました: {str(e)}")
 
+@app.post("/api/ask-knowledge-base/stream", tags=["Knowledge Base"])
+async def ask_knowledge_base_stream(request: AskRequest):
+    """
+    回答をServer-Sent Eventsで逐次返す。
+    最初に検索したチャンクのIDを `sources` イベントで送り、続いて回答トークンを `token` イベントで送る。
+    """
+    async def event_stream():
+        timer = StageTimer()
+        try:
+            with timer.stage("knowledge_search"):
+                retrieved = await kb_manager.aquery_knowledge_base(request.question)
+            assembled = context_assembler.assemble(retrieved)
+            yield format_sse("sources", {"ids": assembled["source_ids"], "source_files": assembled["source_files"], "context_tokens": assembled["context_tokens"], "tokens_saved": assembled["tokens_saved"]})
+            prompt = build_knowledge_prompt(request.question, assembled["context"])
+            with timer.stage("generate_stream", model=KNOWLEDGE_LLM_MODEL):
+                async for chunk in llm.astream(prompt):
+                    if chunk.content:
+                        yield format_sse("token", {"content": chunk.content})
+            yield format_sse("done", {})
+        except Exception as e:
+            ERRORS.labels("ask-knowledge-base-stream").inc()
+            # ストリーム開始後はステータスコードを変更できないため、errorイベントとして通知する
+            print(traceback.format_exc())
+            yield format_sse("error", {"detail": f"AIアシスタント処理中にエラーが発生しました: {str(e)}"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/api/dashboard/{analysis_id}", response_model=DashboardData, tags=["Dashboard"])
 async def get_dashboard_data(analysis_id: str):
     history_file_path = os.path.join(HISTORY_DIR, f"{analysis_id}.json")
@@ -193,13 +518,7 @@ async def get_dashboard_data(analysis_id: str):
     try:
         with open(history_file_path, "r", encoding="utf-8") as f:
             data = json.load(f)
-        speakers_text = data.get("speakers", "")
-        matches = re.findall(r"\*\*(.*?)\*\*:\s*(.*?)(?=\n\n\*\*|$)", speakers_text, re.DOTALL)
-        contribution_data = {}
-        for speaker, speech in matches:
-            speech_length = len(speech.strip())
-            contribution_data[speaker] = contribution_data.get(speaker, 0) + speech_length
-        speaker_contributions = [{"name": name, "value": value} for name, value in contribution_data.items()]
+        speaker_contributions = parse_speaker_contributions(data.get("speakers", ""))
         return DashboardData(speaker_contributions=speaker_contributions)
     except Exception as e:
         print(traceback.format_exc())
@@ -241,19 +560,11 @@ async def export_todo_to_asana(request: AsanaExportRequest):
 @app.get("/history", summary="分析履歴の一覧を取得")
 async def get_history_list():
     try:
-        history_summary = []
-        files = [f for f in os.listdir(HISTORY_DIR) if f.endswith(".json")]
-        for filename in files:
-            file_path = os.path.join(HISTORY_DIR, filename)
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                reliability_data = data.get("reliability", {})
-                score = reliability_data.get("score", 0.0) if isinstance(reliability_data, dict) else 0.0
-                history_summary.append({ "id": data.get("id"), "createdAt": data.get("createdAt"), "originalFilename": data.get("originalFilename", "ファイル名不明"), "cost": data.get("cost", 0.0), "model_name": data.get("model_name", "不明"), "reliability_score": score })
-        valid_history = [h for h in history_summary if h.get("createdAt")]
-        sorted_history = sorted(valid_history, key=lambda x: x["createdAt"], reverse=True)
+        with StageTimer().stage("history_list"):
+            sorted_history = list_history_summaries(HISTORY_DIR)
         return sorted_history
     except Exception as e:
+        ERRORS.labels("history").inc()
         raise HTTPException(status_code=500, detail=f"履歴の読み込み中にエラーが発生しました: {str(e)}")
 
 @app.get("/history/{file_id}", summary="特定の分析履歴を取得")
@@ -268,6 +579,117 @@ async def get_history_detail(file_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/profiles/{profile_id}", summary="プロファイルのメタデータ（ステージのタイムライン）を取得")
+async def get_profile(profile_id: str):
+    if ".." in profile_id or "/" in profile_id or "\\" in profile_id:
+        raise HTTPException(status_code=400, detail="不正なID形式です。")
+    metadata_path = os.path.join(PROFILE_DIR, f"{profile_id}.json")
+    if not os.path.exists(metadata_path):
+        raise HTTPException(status_code=404, detail="指定されたプロファイルが見つかりません。")
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+@app.get("/profiles/{profile_id}/download", summary="プロファイル本体をダウンロード（.folded は speedscope / flamegraph.pl、.prof は snakeviz で表示）")
+async def download_profile(profile_id: str):
+    metadata = await get_profile(profile_id)
+    profile_path = os.path.join(PROFILE_DIR, metadata["profileFile"])
+    if not os.path.exists(profile_path):
+        raise HTTPException(status_code=404, detail="プロファイルのファイルが見つかりません。")
+    return FileResponse(profile_path, media_type="application/octet-stream", filename=metadata["profileFile"])
+
+def load_history_transcript(history_id: str) -> tuple[str, dict]:
+    """履歴を読み込み、(履歴のパス, 履歴データ) を返す。要約できる文字起こしがなければ HTTPException を送出する。"""
+    if ".." in history_id or "/" in history_id or "\\" in history_id:
+        raise HTTPException(status_code=400, detail="不正なID形式です。")
+    file_path = os.path.join(HISTORY_DIR, f"{history_id}.json")
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="指定された分析履歴が見つかりません。")
+    with open(file_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    cleaned_text = re.sub(r'[\(\[].*?[\)\]]', '', data.get("transcript") or "").strip()
+    if len(cleaned_text) < 10 or data.get("transcript") == "有効な音声が検出されませんでした。":
+        raise HTTPException(status_code=400, detail="保存されている文字起こしが短すぎるため、要約できません。")
+    return file_path, data
+
+HISTORY_LOCK_DIR = os.path.join(HISTORY_DIR, "locks")
+
+@contextlib.contextmanager
+def history_lock(history_id: str):
+    """履歴1件の読み込み→変更→書き込みを、ワーカー（プロセス）をまたいで排他する。"""
+    os.makedirs(HISTORY_LOCK_DIR, exist_ok=True)
+    with open(os.path.join(HISTORY_LOCK_DIR, f"{history_id}.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def append_model_comparison(history_id: str, file_path: str, comparison: dict) -> bool:
+    """履歴の model_comparisons に比較結果を追記する。履歴が削除されていた場合は False（スレッドから呼ぶ）。"""
+    with history_lock(history_id):
+        if not os.path.exists(file_path):
+            return False
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        data.setdefault("model_comparisons", []).append(comparison)
+        temp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f: json.dump(data, f, ensure_ascii=False, indent=4)
+        os.replace(temp_path, file_path)
+    return True
+
+@app.post("/history/{history_id}/resummarize", summary="保存済みの文字起こしを別のモデルで要約し直す（ASRは再実行しない）")
+async def resummarize_history(history_id: str, request: RerunRequest):
+    """指定したモデルごとに要約パイプラインを並列に実行し、元の履歴にリンクした新しい履歴として保存する。"""
+    _, source = load_history_transcript(history_id)
+    if not request.models:
+        raise HTTPException(status_code=400, detail="モデルを1つ以上指定してください。")
+    transcript_text = source["transcript"]
+
+    async def resummarize(model_name: str) -> dict:
+        summary_text, todos_list, reliability_info, token_usage = await asyncio.to_thread(run_pipeline_with_provider_limit, model_name, transcript_text)
+        # 文字起こしは再実行していないため、音声分のコストは含めない
+        calculated_cost_jpy = calculate_cost_in_jpy(model_name=model_name, total_input_tokens=token_usage.get("input_tokens", 0), total_output_tokens=token_usage.get("output_tokens", 0), audio_duration_seconds=0)
+        result = {**{key: source.get(key) for key in ("originalFilename", "transcript", "speakers", "speaker_turns", "vad", "asr_profile") if key in source}, "id": str(uuid.uuid4()), "createdAt": datetime.now(timezone.utc).isoformat(), "model_name": model_name, "summary": summary_text, "todos": todos_list, "cost": calculated_cost_jpy, "reliability": reliability_info, "source_history_id": history_id}
+        with open(os.path.join(HISTORY_DIR, f"{result['id']}.json"), "w", encoding="utf-8") as f: json.dump(result, f, ensure_ascii=False, indent=4)
+        return result
+
+    try:
+        return await asyncio.gather(*(resummarize(model_name) for model_name in request.models))
+    except Exception as e:
+        ERRORS.labels("resummarize").inc()
+        print(traceback.format_exc()); raise HTTPException(status_code=500, detail=f"再要約中に予期せぬエラー: {str(e)}")
+
+@app.post("/history/{history_id}/benchmark", summary="保存済みの文字起こしで複数モデルを比較する（ASRは再実行しない）")
+async def benchmark_history(history_id: str, request: RerunRequest):
+    """
+    /benchmark-summary と同じ形式の結果を返し、元の履歴の model_comparisons に追記する。
+    パイプラインが失敗したモデルの結果には "failed": true を付けて返し、履歴には成功した結果だけを残す。
+    """
+    file_path, source = load_history_transcript(history_id)
+    if not request.models:
+        raise HTTPException(status_code=400, detail="モデルを1つ以上指定してください。")
+    transcript_text = source["transcript"]
+
+    def benchmark_one(model_name: str) -> dict:
+        semaphore = provider_semaphores.get(get_provider(model_name))
+        with semaphore if semaphore else contextlib.nullcontext():
+            result = run_benchmark_pipeline(transcript_text, [model_name])[0]
+        result["cost"] = calculate_cost_in_jpy(model_name=model_name, total_input_tokens=result["token_usage"].get("input_tokens", 0), total_output_tokens=result["token_usage"].get("output_tokens", 0), audio_duration_seconds=0)
+        return result
+
+    try:
+        benchmark_results = await asyncio.gather(*(asyncio.to_thread(benchmark_one, model_name) for model_name in request.models))
+        for result in benchmark_results:
+            if is_pipeline_error(result["reliability"]): result["failed"] = True
+        succeeded_results = [result for result in benchmark_results if not result.get("failed")]
+        if succeeded_results:
+            saved = await asyncio.to_thread(append_model_comparison, history_id, file_path, {"createdAt": datetime.now(timezone.utc).isoformat(), "results": succeeded_results})
+            if not saved: print(f"History benchmark: 履歴 {history_id} が削除されていたため、比較結果は保存しません。")
+        return benchmark_results
+    except Exception as e:
+        ERRORS.labels("history-benchmark").inc()
+        print(traceback.format_exc()); raise HTTPException(status_code=500, detail=f"ベンチマーク中に予期せぬエラー: {str(e)}")
+
 @app.post("/history/delete", summary="指定された分析履歴を削除する")
 async def delete_history(request: DeleteHistoryRequest):
     deleted_count = 0; errors = []
@@ -277,7 +699,11 @@ async def delete_history(request: DeleteHistoryRequest):
         file_path = os.path.join(HISTORY_DIR, f"{file_id}.json")
         if os.path.exists(file_path):
             try:
-                os.remove(file_path); deleted_count += 1
+                with history_lock(file_id):
+                    os.remove(file_path)
+                deleted_count += 1
+                delete_profile(PROFILE_DIR, file_id)
+                os.remove(os.path.join(HISTORY_LOCK_DIR, f"{file_id}.lock"))
             except Exception as e:
                 errors.append(f"{file_id}の削除中にエラー: {e}")
         else:
@@ -287,27 +713,44 @@ async def delete_history(request: DeleteHistoryRequest):
     return {"message": f"{deleted_count}件の履歴を削除しました。", "deleted_count": deleted_count}
 
 @app.post("/benchmark-summary", summary="単一の音声ファイルで、複数のモデルの性能を比較する")
-async def benchmark_summary_audio(file: UploadFile = File(...), models_to_benchmark: str = Form(...)):
-    load_whisper_model()
+async def benchmark_summary_audio(file: UploadFile = File(...), models_to_benchmark: str = Form(...), asr_profile: str | None = Form(None, description="fast / balanced / accurate / legacy（未指定なら ASR_PROFILE）")):
+    asr_engine = await asyncio.to_thread(load_whisper_model, asr_profile)
     try: models_to_run = json.loads(models_to_benchmark)
     except Exception: raise HTTPException(status_code=400, detail="無効なモデルリストが送信されました。")
+    endpoint = "benchmark-summary"
     original_filename, temp_file_path = file.filename, f"/tmp/{uuid.uuid4()}_{file.filename}"
-    wav_file_path = f"{os.path.splitext(temp_file_path)[0]}.wav"
+    timer = StageTimer()
+    admission_ticket = None
+    IN_FLIGHT.labels(endpoint).inc()
     try:
-        with open(temp_file_path, "wb") as buffer: contents = await file.read(); buffer.write(contents)
-        command = ["ffmpeg", "-i", temp_file_path, "-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le", wav_file_path]; subprocess.run(command, check=True, capture_output=True, text=True)
-        audio = whisper.load_audio(wav_file_path)
-        audio_duration_seconds = len(audio) / whisper.audio.SAMPLE_RATE
-        transcription_result = whisper.transcribe(whisper_model, audio, language="ja", detect_disfluencies=True)
-        transcript_text = transcription_result.get("text", "")
-        cleaned_text = re.sub(r'[\(\[].*?[\)\]]', '', transcript_text or "").strip()
-        if len(cleaned_text) < 10: raise HTTPException(status_code=400, detail="内容が短すぎるためベンチマークを実行できません。")
-        benchmark_results = run_benchmark_pipeline(transcript_text, models_to_run)
-        for result in benchmark_results:
-            result["cost"] = calculate_cost_in_jpy(model_name=result["model_name"], total_input_tokens=result["token_usage"].get("input_tokens", 0), total_output_tokens=result["token_usage"].get("output_tokens", 0), audio_duration_seconds=audio_duration_seconds)
-        return JSONResponse(content=benchmark_results)
+        with timer.activate():
+            with track_stage("upload"):
+                upload_size = await save_upload(file, temp_file_path)
+            UPLOAD_SIZE.labels(endpoint).observe(upload_size)
+            with track_stage("admission"):
+                admission_ticket = await admission_controller.acquire(endpoint, await asyncio.to_thread(probe_audio_duration, temp_file_path))
+            with track_stage("decode"):
+                audio = await asyncio.to_thread(decode_audio, temp_file_path)
+            audio_duration_seconds = len(audio) / SAMPLE_RATE
+            async with inference_lock:
+                transcription_result, vad_stats = await asyncio.to_thread(transcribe_speech, asr_engine, audio)
+            observe_whisper_rtf(timer.duration("transcribe"), audio_duration_seconds)
+            transcript_text = transcription_result.get("text", "")
+            cleaned_text = re.sub(r'[\(\[].*?[\)\]]', '', transcript_text or "").strip()
+            if len(cleaned_text) < 10: raise HTTPException(status_code=400, detail="内容が短すぎるためベンチマークを実行できません。")
+            benchmark_results = await asyncio.to_thread(run_benchmark_pipeline, transcript_text, models_to_run)
+            for result in benchmark_results:
+                result["cost"] = calculate_cost_in_jpy(model_name=result["model_name"], total_input_tokens=result["token_usage"].get("input_tokens", 0), total_output_tokens=result["token_usage"].get("output_tokens", 0), audio_duration_seconds=audio_duration_seconds)
+        admission_controller.release(admission_ticket)
+        return JSONResponse(content=benchmark_results, headers={"Server-Timing": timer.server_timing_header()})
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after_seconds)})
+    except HTTPException:
+        raise
     except Exception as e:
+        ERRORS.labels(endpoint).inc()
         print(traceback.format_exc()); raise HTTPException(status_code=500, detail=f"ベンチマーク中に予期せぬエラー: {str(e)}")
     finally:
-        if os.path.exists(temp_file_path): os.remove(temp_file_path)
-        if os.path.exists(wav_file_path): os.remove(wav_file_path)
\ No newline at end of file
+        IN_FLIGHT.labels(endpoint).dec(); count_finished_job()
+        if admission_ticket: admission_controller.release(admission_ticket, succeeded=False)
+        if os.path.exists(temp_file_path): os.remove(temp_file_path)
\ No newline at end of file
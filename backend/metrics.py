@@ -0,0 +1,60 @@
+# backend/metrics.py
+
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+from stage_timer import add_stage_observer
+
+# --- メトリクス定義 ---
+# 秒単位のバケット（数ミリ秒の検索から数分の文字起こしまでをカバー）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_DURATION = Histogram(
+    "trustalk_stage_duration_seconds", "各処理段階（decode / transcribe / diarize / llm_* / retrieve / history_list など）の所要時間",
+    ["stage", "model"], buckets=LATENCY_BUCKETS,
+)
+UPLOAD_SIZE = Histogram(
+    "trustalk_upload_size_bytes", "アップロードされた音声ファイルのサイズ",
+    ["endpoint"], buckets=(100_000, 500_000, 1_000_000, 5_000_000, 10_000_000, 50_000_000, 100_000_000, 500_000_000),
+)
+WHISPER_REAL_TIME_FACTOR = Histogram(
+    "trustalk_whisper_real_time_factor", "文字起こし時間 / 音声の長さ（1未満なら実時間より速い）",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5),
+)
+LLM_TOKENS = Histogram(
+    "trustalk_llm_tokens", "LLMの各ステップで使用したトークン数",
+    ["model", "step", "direction"], buckets=(100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000),
+)
+COST_JPY = Counter("trustalk_cost_jpy_total", "モデルごとの概算コスト（円）", ["model"])
+ERRORS = Counter("trustalk_errors_total", "エンドポイントごとのエラー件数", ["endpoint"])
+IN_FLIGHT = Gauge("trustalk_in_flight_requests", "処理中の重いリクエスト数", ["endpoint"], multiprocess_mode="livesum")
+ADMISSION_WAITING = Gauge("trustalk_admission_waiting_jobs", "実行枠を待っている重いリクエスト数", multiprocess_mode="livesum")
+ADMISSION_REJECTED = Counter("trustalk_admission_rejected_total", "待ち行列が一杯で 429 を返したリクエスト数", ["endpoint"])
+MODEL_LOADED = Gauge("trustalk_model_loaded", "モデルの読み込み状態（1: 読み込み済み）", ["model"], multiprocess_mode="livemax")
+
+
+def _observe_stage(stage: dict):
+    STAGE_DURATION.labels(stage["name"], stage["labels"].get("model", "")).observe(stage["duration"])
+
+
+add_stage_observer(_observe_stage)
+
+
+def observe_whisper_rtf(transcribe_seconds: float, audio_duration_seconds: float):
+    if audio_duration_seconds > 0:
+        WHISPER_REAL_TIME_FACTOR.observe(transcribe_seconds / audio_duration_seconds)
+
+
+def observe_llm_tokens(model_name: str, step: str, usage: dict):
+    LLM_TOKENS.labels(model_name, step, "input").observe(usage.get("input_tokens", 0))
+    LLM_TOKENS.labels(model_name, step, "output").observe(usage.get("output_tokens", 0))
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Prometheus のテキスト形式で全メトリクスを返す。gunicorn の複数ワーカーでは全ワーカー分を集計する。"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,88 @@
+# backend/mock_llm.py
+
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Iterator
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# 既定値は環境変数で変更できる。モデル名に "-<数値>ms" を含めると、そのモデルだけ遅延を上書きする（例: mock-slow-3000ms）
+DEFAULT_LATENCY_SECONDS = float(os.getenv("MOCK_LLM_LATENCY_SECONDS", "0.5"))
+DEFAULT_LATENCY_JITTER = float(os.getenv("MOCK_LLM_LATENCY_JITTER", "0.2"))
+DEFAULT_OUTPUT_TOKENS = int(os.getenv("MOCK_LLM_OUTPUT_TOKENS", "300"))
+# 未設定の場合は、プロンプトの文字数から入力トークン数を概算する
+DEFAULT_INPUT_TOKENS = int(os.getenv("MOCK_LLM_INPUT_TOKENS", "0"))
+
+
+def _mock_response(prompt: str) -> str:
+    """プロンプトの内容から、ai_pipelines のどのステップかを判定し、それらしい応答を返す。"""
+    if "faithfulness_score" in prompt:
+        return json.dumps({"faithfulness_score": 0.9, "comprehensiveness_score": 0.8, "conciseness_score": 0.85, "justification": "モック評価: 要約は文字起こしの内容を概ね反映しています。"}, ensure_ascii=False)
+    if "改善された要約1" in prompt:
+        return json.dumps({"summary": ["モック要約: 議題の確認", "モック要約: 次回までの対応方針"], "todos": ["モックToDo: 資料を準備する"]}, ensure_ascii=False)
+    if '"summary": ["要約1"' in prompt:
+        return json.dumps({"summary": ["モックドラフト: 議題の確認"], "todos": ["モックToDo: 資料を準備する"]}, ensure_ascii=False)
+    if "レビューコメント" in prompt:
+        return "モックレビュー: 要約は忠実ですが、ToDoの担当者を明記するとより明確になります。"
+    return "モック回答: ナレッジベースには関連する情報が見つかりませんでした。"
+
+
+class MockChatModel(BaseChatModel):
+    """
+    負荷試験用のローカルなモックLLM。外部APIを呼ばず、設定した遅延の後に各パイプラインステップ向けの有効な応答を返す。
+    トークン使用量は OpenAI と同じ形式の response_metadata に入れるため、_extract_token_usage でそのまま集計できます。
+    """
+    model_name: str = "mock"
+    latency_seconds: float = DEFAULT_LATENCY_SECONDS
+    latency_jitter: float = DEFAULT_LATENCY_JITTER
+    output_tokens: int = DEFAULT_OUTPUT_TOKENS
+    input_tokens: int = DEFAULT_INPUT_TOKENS
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        match = re.search(r"-(\d+)ms\b", self.model_name)
+        if match:
+            self.latency_seconds = int(match.group(1)) / 1000
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency_seconds + random.uniform(-self.latency_jitter, self.latency_jitter) * self.latency_seconds)
+
+    def _build_result(self, messages: list[BaseMessage]) -> tuple[str, dict]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        usage = {"prompt_tokens": self.input_tokens or max(1, len(prompt) // 2), "completion_tokens": self.output_tokens}
+        return _mock_response(prompt), {"token_usage": usage, "model_name": self.model_name}
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._delay())
+        content, metadata = self._build_result(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, response_metadata=metadata))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        content, metadata = self._build_result(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, response_metadata=metadata))])
+
+    def _stream(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        content, _ = self._build_result(messages)
+        # 全体の遅延の半分を最初のトークンまで、残りを各文字に均等に割り当てる
+        time.sleep(self._delay() / 2)
+        for char in content:
+            time.sleep(self.latency_seconds / 2 / max(1, len(content)))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=char))
+
+    async def _astream(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        content, _ = self._build_result(messages)
+        await asyncio.sleep(self._delay() / 2)
+        for char in content:
+            await asyncio.sleep(self.latency_seconds / 2 / max(1, len(content)))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=char))
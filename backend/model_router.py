@@ -0,0 +1,124 @@
+# backend/model_router.py
+
+import os
+import threading
+
+from cost_calculator import MODEL_PRICES_PER_MILLION_TOKENS
+
+# ルーティングの候補（auto 指定時はこの中から選ぶ）
+ROUTING_CANDIDATE_MODELS = [m.strip() for m in os.getenv("ROUTING_CANDIDATE_MODELS", "gpt-4o-mini,gemini-1.5-flash-latest,claude-3-haiku-20240307").split(",") if m.strip()]
+# 要約パイプライン（LLM 4ステップ）全体に許容する時間（秒）
+ROUTING_LLM_SLO_SECONDS = float(os.getenv("ROUTING_LLM_SLO_SECONDS", "60"))
+# 計測値がまだないモデルに使う事前値: 1000トークンあたりの処理時間（秒）
+DEFAULT_SECONDS_PER_1K_TOKENS = float(os.getenv("ROUTING_DEFAULT_SECONDS_PER_1K_TOKENS", "1.0"))
+# 計測値の指数移動平均の重み（新しい計測値の割合）
+EWMA_ALPHA = 0.3
+# 失敗率の上限（予測時間を 1 / (1 - 失敗率) 倍するため、1 に近づきすぎないようにする）
+MAX_FAILURE_RATE = 0.9
+# パイプラインのトークン数の概算に使う定数（プロンプトの固定部分と、各ステップの出力の目安）
+PIPELINE_PROMPT_OVERHEAD_TOKENS = 1500
+PIPELINE_OUTPUT_TOKENS = 1200
+
+
+def estimate_pipeline_tokens(transcript_text: str) -> tuple[int, int]:
+    """
+    要約パイプラインの入出力トークン数を概算する。文字起こしは4ステップすべてのプロンプトに含まれる。
+    日本語は1文字あたり約1トークンとして数える（tiktoken で数えるほどの精度は不要なため）。
+    """
+    transcript_tokens = len(transcript_text or "")
+    return transcript_tokens * 4 + PIPELINE_PROMPT_OVERHEAD_TOKENS, PIPELINE_OUTPUT_TOKENS
+
+
+def estimate_cost_usd(model_name: str, input_tokens: int, output_tokens: int) -> float | None:
+    prices = MODEL_PRICES_PER_MILLION_TOKENS.get(model_name)
+    if not prices:
+        return None
+    return (input_tokens * prices["input"] + output_tokens * prices["output"]) / 1_000_000
+
+
+class ModelRouter:
+    """
+    要約モデルを、実測のレイテンシ・失敗率、処理中の分析数、料金表から選ぶクラス。
+    「処理中の分析」は、どのエンドポイントでも start_job〜finish_job で囲んだ LLM の段階（ルーティング〜要約パイプライン）にあるものを数える。
+
+    - 各モデルの「1000トークンあたりの処理時間」と「失敗率」を指数移動平均で保持する
+    - 失敗・タイムアウトした実行もかかった時間を反映する（トークン数が取れない場合は概算値で割る）
+    - 失敗するモデルは再実行が必要になるため、予測時間を 1 / (1 - 失敗率) 倍して見積もる
+    - 処理中の分析はプロバイダーの同時呼び出し枠を取り合うため、処理中の分析が多いほど待ち時間が増える。
+      予測時間は (処理中の他の分析数 + 1) 倍として見積もる
+    - SLO内に収まるモデルのうち、最も安いものを選ぶ。どれも収まらなければ最も速いものに落とす
+    """
+
+    def __init__(self, candidates: list[str] = None, slo_seconds: float = None):
+        self.candidates = candidates or ROUTING_CANDIDATE_MODELS
+        self.slo_seconds = slo_seconds or ROUTING_LLM_SLO_SECONDS
+        self.seconds_per_1k_tokens = {}
+        self.failure_rate = {}
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def record(self, model_name: str, llm_seconds: float, token_usage: dict, transcript_text: str, succeeded: bool = True):
+        """
+        1回の要約パイプラインの実測値を反映する。失敗した実行（succeeded=False）も時間と失敗率に反映する。
+        token_usage にトークン数が無い場合（失敗時や、トークン数を返さないモデル）は transcript_text から概算する。
+        """
+        total_tokens = token_usage.get("input_tokens", 0) + token_usage.get("output_tokens", 0)
+        if total_tokens <= 0:
+            total_tokens = sum(estimate_pipeline_tokens(transcript_text))
+        with self._lock:
+            samples = [(self.failure_rate, 0.0 if succeeded else 1.0)]
+            if llm_seconds > 0:
+                samples.append((self.seconds_per_1k_tokens, llm_seconds / (total_tokens / 1000)))
+            for stats, value in samples:
+                previous = stats.get(model_name)
+                stats[model_name] = value if previous is None else (1 - EWMA_ALPHA) * previous + EWMA_ALPHA * value
+
+    def start_job(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finish_job(self):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def estimate(self, model_name: str, transcript_text: str) -> dict:
+        input_tokens, output_tokens = estimate_pipeline_tokens(transcript_text)
+        seconds_per_1k = self.seconds_per_1k_tokens.get(model_name, DEFAULT_SECONDS_PER_1K_TOKENS)
+        # 自分自身は start_job 済みなので、他の処理中の分析数は in_flight - 1
+        queue_factor = max(1, self.in_flight)
+        failure_rate = min(self.failure_rate.get(model_name, 0.0), MAX_FAILURE_RATE)
+        cost_usd = estimate_cost_usd(model_name, input_tokens, output_tokens)
+        return {
+            "model_name": model_name,
+            "predicted_seconds": seconds_per_1k * (input_tokens + output_tokens) / 1000 * queue_factor / (1 - failure_rate),
+            "estimated_cost_usd": cost_usd,
+            "measured": model_name in self.seconds_per_1k_tokens,
+            "failure_rate": failure_rate,
+        }
+
+    def choose(self, requested_model: str, transcript_text: str) -> dict:
+        """
+        モデルを選び、{"requested", "model_name", "reason", "estimates"} を返す。
+        requested_model が "auto" 以外の場合は、そのモデルがSLO内に収まる限りそのまま使う。
+        """
+        candidates = list(self.candidates)
+        if requested_model != "auto" and requested_model not in candidates:
+            candidates.insert(0, requested_model)
+        estimates = [self.estimate(model_name, transcript_text) for model_name in candidates]
+        within_slo = [e for e in estimates if e["predicted_seconds"] <= self.slo_seconds]
+        requested = next((e for e in estimates if e["model_name"] == requested_model), None)
+
+        if requested and requested in within_slo:
+            chosen, reason = requested, f"指定モデルの予測時間 {requested['predicted_seconds']:.1f}秒 がSLO {self.slo_seconds:.0f}秒 以内のため、そのまま使用"
+        elif within_slo:
+            chosen = min(within_slo, key=lambda e: (e["estimated_cost_usd"] is None, e["estimated_cost_usd"] or 0.0, e["predicted_seconds"]))
+            prefix = f"指定モデルの予測時間 {requested['predicted_seconds']:.1f}秒 がSLOを超えるため、" if requested else ""
+            reason = f"{prefix}SLO {self.slo_seconds:.0f}秒 以内のモデルのうち最も安い {chosen['model_name']} を選択"
+        else:
+            chosen = min(estimates, key=lambda e: e["predicted_seconds"])
+            reason = f"どのモデルもSLO {self.slo_seconds:.0f}秒 以内に収まらない見込みのため、最も速い {chosen['model_name']} を選択"
+        print(f"Router: {requested_model} -> {chosen['model_name']} ({reason}, 処理中の分析: {self.in_flight})")
+        return {"requested": requested_model, "model_name": chosen["model_name"], "reason": reason, "in_flight": self.in_flight, "estimates": estimates}
+
+
+model_router = ModelRouter()
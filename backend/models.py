@@ -4,19 +4,30 @@ from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_anthropic import ChatAnthropic
 from langchain_core.language_models.chat_models import BaseChatModel
+from functools import lru_cache
+from mock_llm import MockChatModel
 
+def get_provider(model_name: str) -> str:
+    """モデル名からプロバイダー名（openai / google / anthropic / mock / unknown）を返す。"""
+    if model_name.startswith("gpt"):
+        return "openai"
+    elif model_name.startswith("gemini"):
+        return "google"
+    elif model_name.startswith("claude"):
+        return "anthropic"
+    elif model_name.startswith("mock-"):
+        # 負荷試験用: 外部APIを呼ばないローカルのモック
+        return "mock"
+    return "unknown"
+
+# クライアント（HTTP接続プールを含む）はスレッドセーフなため、モデルごとに1つを使い回す
+@lru_cache(maxsize=None)
 def get_llm(model_name: str) -> BaseChatModel:
     """
     モデル名に基づいて、適切なLLMクライアントのインスタンスを生成して返す。
     """
     
-    provider = "unknown"
-    if model_name.startswith("gpt"):
-        provider = "openai"
-    elif model_name.startswith("gemini"):
-        provider = "google"
-    elif model_name.startswith("claude"):
-        provider = "anthropic"
+    provider = get_provider(model_name)
 
     if provider == "openai":
         return ChatOpenAI(
@@ -28,5 +39,7 @@ def get_llm(model_name: str) -> BaseChatModel:
         return ChatGoogleGenerativeAI(model=model_name, temperature=0)
     elif provider == "anthropic":
         return ChatAnthropic(model=model_name, temperature=0)
+    elif provider == "mock":
+        return MockChatModel(model_name=model_name)
     else:
         raise ValueError(f"サポートされていない、または不明なモデル名です: {model_name}")
\ No newline at end of file
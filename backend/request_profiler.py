@@ -0,0 +1,180 @@
+# backend/request_profiler.py
+
+import cProfile
+import contextlib
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+# 0.0〜1.0。ヘッダーがなくても、この割合のリクエストを自動的にプロファイルする（既定は無効）
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# 自動サンプリング時のモード: sample（スタックのサンプリング）/ cprofile
+PROFILE_DEFAULT_MODE = os.getenv("PROFILE_DEFAULT_MODE", "sample")
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_SECONDS", "0.005"))
+PROFILE_MODES = ("sample", "cprofile")
+PROFILE_EXTENSIONS = {"sample": ".folded", "cprofile": ".prof"}
+if PROFILE_DEFAULT_MODE not in PROFILE_MODES:
+    print(f"⚠️ PROFILE_DEFAULT_MODE={PROFILE_DEFAULT_MODE!r} は無効なため、sample を使います。（有効な値: {', '.join(PROFILE_MODES)}）")
+    PROFILE_DEFAULT_MODE = "sample"
+
+# cProfile は1スレッドに1つしか有効にできないため、同時に取るプロファイルは1つに限る
+_profiling_lock = threading.Lock()
+
+
+class StackSampler:
+    """
+    対象スレッドのスタックを一定間隔で取得し、flamegraph.pl / speedscope で読める folded 形式に集計する。
+    対象は、リクエストの重い処理（Whisper や pyannote など）を実行している間だけ追加されるワーカースレッドです。
+    """
+
+    def __init__(self, interval: float):
+        self.thread_ids, self.interval = set(), interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfiler:
+    """
+    1リクエスト分のプロファイルを取り、ステージのタイムラインと一緒に保存する。
+    対象は follow_thread の中で実行した処理（asyncio.to_thread で実行する重い処理）だけです。
+    イベントループのスレッドは他のリクエストのコルーチンも実行するため、プロファイルに含めません
+    （含めると、同時に処理中の他のリクエストの時間までこのリクエストに数えてしまう）。
+    """
+    SCOPE = "worker_threads"
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.started_at = time.time()
+        if mode == "cprofile":
+            # follow_thread で取ったワーカースレッドごとの cProfile（保存時にまとめる）
+            self._thread_profilers = []
+        else:
+            self._profiler = StackSampler(SAMPLE_INTERVAL_SECONDS)
+            self._profiler.start()
+        self._stopped = False
+
+    @contextlib.contextmanager
+    def follow_thread(self):
+        """ワーカースレッドで実行する重い処理を、このリクエストのプロファイルに含める。"""
+        if self._stopped:
+            yield
+            return
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            self._thread_profilers.append(profiler)
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+        else:
+            thread_id = threading.get_ident()
+            self._profiler.thread_ids.add(thread_id)
+            try:
+                yield
+            finally:
+                self._profiler.thread_ids.discard(thread_id)
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        try:
+            if self.mode == "sample":
+                self._profiler.stop()
+        finally:
+            _profiling_lock.release()
+
+    def save(self, profile_dir: str, profile_id: str, timer, endpoint: str) -> dict:
+        """プロファイル本体と、ステージのタイムラインを含むメタデータJSONを profile_dir に保存する。"""
+        self.stop()
+        os.makedirs(profile_dir, exist_ok=True)
+        profile_filename = f"{profile_id}{PROFILE_EXTENSIONS[self.mode]}"
+        if self.mode == "cprofile":
+            profilers = self._thread_profilers
+            if not profilers:
+                # pstats は空のプロファイルを読めないため、何も計測していない場合も1件分のプロファイルを作る
+                empty = cProfile.Profile(); empty.enable(); empty.disable()
+                profilers = [empty]
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(os.path.join(profile_dir, profile_filename))
+        else:
+            self._profiler.dump(os.path.join(profile_dir, profile_filename))
+        metadata = {
+            "id": profile_id,
+            "endpoint": endpoint,
+            "mode": self.mode,
+            # プロファイルに含めた範囲（ワーカースレッドで実行した処理だけ。イベントループのスレッドは含めない）
+            "scope": self.SCOPE,
+            "startedAt": self.started_at,
+            "profileFile": profile_filename,
+            "stages": timer.stages,
+        }
+        with open(os.path.join(profile_dir, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=4)
+        return metadata
+
+
+def start_profiling(requested_mode: str | None) -> RequestProfiler | None:
+    """
+    ヘッダーで要求された場合、またはサンプリングに当たった場合だけプロファイラーを開始する。
+    無効時はヘッダーの確認だけで終わるため、通常のリクエストへのコストはほぼゼロです。
+    """
+    if requested_mode:
+        mode = requested_mode.lower() if requested_mode.lower() in PROFILE_MODES else PROFILE_DEFAULT_MODE
+    elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        mode = PROFILE_DEFAULT_MODE
+    else:
+        return None
+    if not _profiling_lock.acquire(blocking=False):
+        print("Profiler: 別のリクエストをプロファイル中のため、今回はスキップします。")
+        return None
+    try:
+        return RequestProfiler(mode)
+    except Exception:
+        _profiling_lock.release()
+        raise
+
+
+def delete_profile(profile_dir: str, profile_id: str) -> bool:
+    """履歴と一緒に、保存済みのプロファイル（メタデータJSONと本体）を削除する。削除したものがあれば True。"""
+    deleted = False
+    for extension in (".json", *PROFILE_EXTENSIONS.values()):
+        path = os.path.join(profile_dir, f"{profile_id}{extension}")
+        if os.path.exists(path):
+            os.remove(path)
+            deleted = True
+    return deleted
@@ -0,0 +1,72 @@
+# backend/stage_timer.py
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+# 現在処理中のリクエストの StageTimer（リクエストごとにコンテキストで分離される）
+_current_timer = contextvars.ContextVar("stage_timer", default=None)
+# 段階の記録が終わるたびに呼ばれるコールバック（metrics.py がヒストグラムへの記録に使う）
+_stage_observers = []
+
+
+def add_stage_observer(callback):
+    """段階の記録（{"name","start","duration","labels"}）を受け取るコールバックを登録する。"""
+    _stage_observers.append(callback)
+
+
+class StageTimer:
+    """
+    1リクエスト内の各処理段階（ffmpeg変換、文字起こし、話者分離、LLMの各ステップなど）の所要時間を記録するクラス。
+    記録した内容は Server-Timing ヘッダーとしてクライアントに返せます。
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages = []
+
+    @contextmanager
+    def activate(self):
+        """このタイマーを現在のコンテキストに設定し、track_stage から記録できるようにする。"""
+        token = _current_timer.set(self)
+        try:
+            yield self
+        finally:
+            _current_timer.reset(token)
+
+    @contextmanager
+    def stage(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            record = {"name": name, "start": start - self.started_at, "duration": end - start, "labels": labels}
+            self.stages.append(record)
+            for observer in _stage_observers:
+                observer(record)
+
+    def duration(self, name: str) -> float:
+        """指定した名前の段階の合計時間（秒）を返す。"""
+        return sum(stage["duration"] for stage in self.stages if stage["name"] == name)
+
+    def server_timing_header(self) -> str:
+        """Server-Timing ヘッダーの値（name;desc="...";dur=ミリ秒 をカンマ区切り）を返す。"""
+        entries = []
+        for stage in self.stages:
+            entry = stage["name"]
+            if stage["labels"]:
+                entry += ';desc="' + " ".join(f"{k}={v}" for k, v in stage["labels"].items()) + '"'
+            entries.append(f"{entry};dur={stage['duration'] * 1000:.1f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def track_stage(name: str, **labels):
+    """現在のリクエストにタイマーがあれば段階の時間を記録する。なければ何もしない。"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name, **labels):
+        yield
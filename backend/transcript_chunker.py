@@ -0,0 +1,176 @@
+# backend/transcript_chunker.py
+
+import re
+import tiktoken
+
+# merge_results が生成する「**話者**: 発言」形式の1ターンにマッチする
+SPEAKER_TURN_PATTERN = re.compile(r"\*\*(.+?)\*\*:\s*(.*?)(?=\n\n\*\*|\Z)", re.DOTALL)
+# 日本語・英語の文末記号の直後で区切る
+SENTENCE_END_PATTERN = re.compile(r"(?<=[。！？!?])")
+# 文が長すぎる場合の第二候補の区切り（読点）
+CLAUSE_END_PATTERN = re.compile(r"(?<=[、，,])")
+# whisper-timestamped の言い淀みマーカー
+DISFLUENCY_PATTERN = re.compile(r"\[\*\]")
+# 日本語の文字同士の間に入る不要なスペース（英単語間のスペースは残す）
+JAPANESE_SPACING_PATTERN = re.compile(r"(?<=[^\x00-\x7F])\s+(?=[^\x00-\x7F])")
+
+
+def _join_sentences(sentences: list[str]) -> str:
+    """日本語の文はそのまま連結し、英語の文同士の間にだけスペースを入れる。"""
+    joined = ""
+    for sentence in sentences:
+        if joined and joined[-1].isascii() and sentence[0].isascii():
+            joined += " "
+        joined += sentence
+    return joined
+
+
+class TranscriptChunker:
+    """
+    会議の文字起こしを、話者ターンと日本語の文境界（。！？）に沿ってチャンクに分割するクラス。
+
+    チャンクの大きさは文字数ではなくトークン数で決め、各チャンクは話者名付きの行で構成するため、
+    前後のチャンクに頼らずに単体で意味が通ります。既定ではチャンク間の重複はありません。
+    """
+
+    def __init__(self, max_tokens: int = 400, overlap_sentences: int = 0, encoding_name: str = "cl100k_base"):
+        """
+        Args:
+            max_tokens (int): 1チャンクあたりの最大トークン数。
+            overlap_sentences (int): 次のチャンクの先頭に繰り返す文の数。0なら重複なし。
+            encoding_name (str): トークン数の計算に使う tiktoken のエンコーディング名。
+                text-embedding-3-small と同じ cl100k_base が既定です。
+        """
+        self.max_tokens = max_tokens
+        self.overlap_sentences = overlap_sentences
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """言い淀みマーカーと、日本語の文字間に挟まった不要なスペースを取り除く。"""
+        text = DISFLUENCY_PATTERN.sub("", text)
+        text = JAPANESE_SPACING_PATTERN.sub("", text)
+        return re.sub(r"\s+", " ", text).strip()
+
+    @staticmethod
+    def parse_speaker_turns(speakers_text: str) -> list[dict]:
+        """
+        「**話者**: 発言」形式のテキストを話者ターンのリストに変換する。
+        話者ラベルが見つからない場合は、全体を話者不明の1ターンとして扱う。
+        """
+        turns = [{"speaker": speaker.strip(), "text": speech} for speaker, speech in SPEAKER_TURN_PATTERN.findall(speakers_text)]
+        if not turns and speakers_text.strip():
+            turns = [{"speaker": "", "text": speakers_text}]
+        return turns
+
+    def split_sentences(self, text: str, limit: int | None = None) -> list[str]:
+        """文末記号で文に分割し、limit（既定は max_tokens）を超える文は読点、それでも長ければ文字数で分割する。"""
+        limit = limit or self.max_tokens
+        sentences = []
+        for sentence in SENTENCE_END_PATTERN.split(text):
+            sentence = self.normalize(sentence)
+            if not sentence:
+                continue
+            if self.count_tokens(sentence) <= limit:
+                sentences.append(sentence)
+                continue
+            for clause in CLAUSE_END_PATTERN.split(sentence):
+                sentences.extend(self._split_by_tokens(clause, limit))
+        return [s for s in sentences if s]
+
+    def _split_by_tokens(self, text: str, limit: int) -> list[str]:
+        """句読点のない長い文を、limit に収まる最長の文字数で切り出していく。"""
+        pieces = []
+        while text:
+            if self.count_tokens(text) <= limit:
+                pieces.append(text)
+                break
+            low, high = 1, len(text)
+            while low < high:
+                middle = (low + high + 1) // 2
+                if self.count_tokens(text[:middle]) <= limit:
+                    low = middle
+                else:
+                    high = middle - 1
+            pieces.append(text[:low])
+            text = text[low:]
+        return pieces
+
+    def split_turns(self, turns: list[dict]) -> list[dict]:
+        """
+        話者ターンのリストをチャンクに分割する。
+
+        Args:
+            turns (list[dict]): {"speaker", "text"} と、任意で {"start", "end"}（秒）を持つ辞書のリスト。
+
+        Returns:
+            list[dict]: {"text", "metadata"} のリスト。metadata には話者、チャンク番号、トークン数、
+                ターンに時刻があれば開始・終了時刻が入ります。
+        """
+        # (話者, 文, 開始時刻, 終了時刻) の並びに展開する
+        units = []
+        for turn in turns:
+            speaker = turn.get("speaker", "")
+            # 1文だけでチャンクになっても話者ラベル込みで max_tokens に収まるようにする
+            limit = max(1, self.max_tokens - self._label_tokens(speaker))
+            for sentence in self.split_sentences(turn.get("text", ""), limit):
+                units.append((speaker, sentence, turn.get("start"), turn.get("end")))
+
+        chunks, current, current_tokens = [], [], 0
+        for unit in units:
+            unit_tokens = self._unit_tokens(unit, previous=current[-1] if current else None)
+            if current and current_tokens + unit_tokens > self.max_tokens:
+                chunks.append(self._build_chunk(current, len(chunks), current_tokens))
+                current = current[-self.overlap_sentences:] if self.overlap_sentences else []
+                current_tokens = sum(self._unit_tokens(u, previous=current[i - 1] if i else None) for i, u in enumerate(current))
+                unit_tokens = self._unit_tokens(unit, previous=current[-1] if current else None)
+            current.append(unit)
+            current_tokens += unit_tokens
+        if current:
+            chunks.append(self._build_chunk(current, len(chunks), current_tokens))
+        return chunks
+
+    def split_transcript(self, speakers_text: str) -> list[dict]:
+        """「**話者**: 発言」形式のテキストを分割する。時刻情報は付きません。"""
+        return self.split_turns(self.parse_speaker_turns(speakers_text))
+
+    def split_text(self, text: str) -> list[str]:
+        """RecursiveCharacterTextSplitter.split_text と同じ形で、チャンクの本文だけを返す。"""
+        return [chunk["text"] for chunk in self.split_transcript(text)]
+
+    def _unit_tokens(self, unit: tuple, previous: tuple | None) -> int:
+        speaker, sentence = unit[0], unit[1]
+        tokens = self.count_tokens(sentence)
+        # 話者が変わる箇所では「話者: 」のラベル分も数える
+        if previous is None or previous[0] != speaker:
+            tokens += self._label_tokens(speaker)
+        return tokens
+
+    def _label_tokens(self, speaker: str) -> int:
+        """「話者: 」ラベルと改行のトークン数。"""
+        return self.count_tokens(f"{speaker}: ") + 1 if speaker else 0
+
+    @staticmethod
+    def _build_chunk(units: list[tuple], chunk_index: int, token_count: int) -> dict:
+        lines, speakers = [], []
+        for speaker, sentence, _, _ in units:
+            if lines and lines[-1][0] == speaker:
+                lines[-1][1].append(sentence)
+            else:
+                lines.append((speaker, [sentence]))
+            if speaker and speaker not in speakers:
+                speakers.append(speaker)
+        text = "\n".join(f"{speaker}: {_join_sentences(sentences)}" if speaker else _join_sentences(sentences) for speaker, sentences in lines)
+
+        # ChromaDBのメタデータは None やリストを保持できないため、文字列と数値だけにする
+        metadata = {"chunk_index": chunk_index, "speakers": ",".join(speakers), "token_count": token_count}
+        starts = [start for _, _, start, _ in units if start is not None]
+        ends = [end for _, _, _, end in units if end is not None]
+        if starts:
+            metadata["start_time"] = float(min(starts))
+        if ends:
+            metadata["end_time"] = float(max(ends))
+        return {"text": text, "metadata": metadata}
@@ -0,0 +1,52 @@
+# backend/transcript_utils.py
+
+import re
+
+# merge_results が生成する「**話者**: 発言」形式のターンにマッチする
+SPEAKER_SECTION_PATTERN = re.compile(r"\*\*(.*?)\*\*:\s*(.*?)(?=\n\n\*\*|$)", re.DOTALL)
+
+
+def merge_results_with_turns(diarization, transcription):
+    """
+    話者分離と文字起こしを統合し、(話者付きテキスト, 全文, 話者ターンのリスト) を返す。
+    話者ターンは {"speaker", "start", "end", "text"} の辞書で、ナレッジベースへの取り込み時に時刻情報として使う。
+    """
+    if not diarization: return "話者分離パイプラインが利用できません。", transcription.get("text", ""), []
+    word_speakers = []
+    for segment in transcription.get("segments", []):
+        for word in segment.get("words", []):
+            speaker_label = "UNKNOWN"
+            try:
+                cropped_annotation = diarization.crop(word)
+                if cropped_annotation:
+                    speaker_turn = cropped_annotation.get_timeline().support().pop(0)
+                    speaker_label = speaker_turn[2]
+            except (IndexError, KeyError): speaker_label = "UNKNOWN"
+            word_speakers.append({'word': word.get('text', ''), 'speaker': speaker_label, 'start': word.get('start'), 'end': word.get('end')})
+    if not word_speakers: return "発言が見つかりませんでした。", transcription.get("text", ""), []
+    full_transcript_with_speakers, speaker_turns = "", []
+    current_turn = {"speaker": word_speakers[0]['speaker'], "start": word_speakers[0]['start'], "end": word_speakers[0]['end'], "text": ""}
+    for item in word_speakers:
+        if item['speaker'] != current_turn["speaker"]:
+            current_turn["text"] = current_turn["text"].strip(); speaker_turns.append(current_turn)
+            full_transcript_with_speakers += f"**{current_turn['speaker']}**: {current_turn['text']}\n\n"
+            current_turn = {"speaker": item['speaker'], "start": item['start'], "end": item['end'], "text": ""}
+        current_turn["text"] += item['word'] + " "; current_turn["end"] = item['end']
+    if current_turn["text"]:
+        current_turn["text"] = current_turn["text"].strip(); speaker_turns.append(current_turn)
+        full_transcript_with_speakers += f"**{current_turn['speaker']}**: {current_turn['text']}\n"
+    return full_transcript_with_speakers.strip(), transcription.get("text", ""), speaker_turns
+
+
+def merge_results(diarization, transcription):
+    speakers_text, transcript_text, _ = merge_results_with_turns(diarization, transcription)
+    return speakers_text, transcript_text
+
+
+def parse_speaker_contributions(speakers_text: str) -> list[dict]:
+    """話者付きテキストから、話者ごとの発言文字数を {"name", "value"} のリストで返す。"""
+    contribution_data = {}
+    for speaker, speech in SPEAKER_SECTION_PATTERN.findall(speakers_text):
+        speech_length = len(speech.strip())
+        contribution_data[speaker] = contribution_data.get(speaker, 0) + speech_length
+    return [{"name": name, "value": value} for name, value in contribution_data.items()]
@@ -0,0 +1,108 @@
+# backend/vad.py
+
+import bisect
+import os
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() == "true"
+FRAME_SECONDS = 0.03
+# 雑音レベル（フレームのエネルギーの下位パーセンタイル）より何dB大きければ発話とみなすか
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "12"))
+# 発話区間の前後に付ける余白と、この長さ未満の無音は区間をつなげる
+VAD_PADDING_SECONDS = 0.2
+VAD_MIN_SILENCE_SECONDS = 0.6
+VAD_MIN_SPEECH_SECONDS = 0.25
+# 区間をつなげるときに挟む無音（単語が隣の区間とくっつかないようにする）
+COMPACT_GAP_SECONDS = 0.1
+# 発話の割合がこれ以上なら、切り出しても効果が小さいため全体をそのまま使う
+VAD_SKIP_RATIO = 0.9
+
+
+def detect_speech_regions(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> list[tuple[float, float]]:
+    """
+    フレームごとのエネルギーから発話区間 [(開始秒, 終了秒), ...] を検出する。
+    しきい値は録音ごとの雑音レベルに合わせて決めるため、録音レベルの違いに強い。
+    """
+    frame_length = int(FRAME_SECONDS * sample_rate)
+    n_frames = len(audio) // frame_length
+    if n_frames == 0:
+        return []
+    frames = audio[:n_frames * frame_length].reshape(n_frames, frame_length)
+    energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    noise_floor = np.percentile(energy_db, 10)
+    is_speech = energy_db > max(noise_floor + VAD_THRESHOLD_DB, -60.0)
+
+    # 連続する発話フレームを区間にまとめる
+    changes = np.flatnonzero(np.diff(np.concatenate(([0], is_speech.astype(np.int8), [0]))))
+    regions = []
+    for start_frame, end_frame in zip(changes[::2], changes[1::2]):
+        start, end = float(start_frame * FRAME_SECONDS), float(end_frame * FRAME_SECONDS)
+        if regions and start - regions[-1][1] < VAD_MIN_SILENCE_SECONDS:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+
+    duration = len(audio) / sample_rate
+    padded = []
+    for start, end in regions:
+        if end - start < VAD_MIN_SPEECH_SECONDS:
+            continue
+        start, end = max(0.0, start - VAD_PADDING_SECONDS), min(duration, end + VAD_PADDING_SECONDS)
+        if padded and start <= padded[-1][1]:
+            padded[-1] = (padded[-1][0], end)
+        else:
+            padded.append((start, end))
+    return padded
+
+
+def compact_audio(audio: np.ndarray, regions: list[tuple[float, float]], sample_rate: int = SAMPLE_RATE) -> tuple[np.ndarray, list[tuple[float, float]]]:
+    """
+    発話区間だけをつなげた配列と、タイムスタンプの対応表 [(切り出し後の開始秒, 元の開始秒), ...] を返す。
+    """
+    gap = np.zeros(int(COMPACT_GAP_SECONDS * sample_rate), dtype=audio.dtype)
+    pieces, mapping, position = [], [], 0
+    for start, end in regions:
+        piece = audio[int(start * sample_rate):int(end * sample_rate)]
+        mapping.append((position / sample_rate, start))
+        pieces.extend([piece, gap])
+        position += len(piece) + len(gap)
+    return np.concatenate(pieces) if pieces else audio[:0], mapping
+
+
+def remap_time(t: float, mapping: list[tuple[float, float]], compact_starts: list[float]) -> float:
+    """切り出し後の時刻を元の録音の時刻に戻す。compact_starts は mapping の切り出し後の開始秒だけのリスト。"""
+    index = max(0, bisect.bisect_right(compact_starts, t) - 1)
+    compact_start, original_start = mapping[index]
+    return round(original_start + (t - compact_start), 3)
+
+
+def remap_transcription(transcription: dict, mapping: list[tuple[float, float]]) -> dict:
+    """Whisper の結果（segments と words）の start / end を元の録音の時刻に書き換える。"""
+    compact_starts = [compact_start for compact_start, _ in mapping]
+    for segment in transcription.get("segments", []):
+        for item in [segment] + segment.get("words", []):
+            for key in ("start", "end"):
+                if item.get(key) is not None:
+                    item[key] = remap_time(item[key], mapping, compact_starts)
+    return transcription
+
+
+def filter_speech(audio: np.ndarray, sample_rate: int = SAMPLE_RATE):
+    """
+    発話区間だけを切り出す。戻り値は (Whisper に渡す配列, 対応表 or None, 統計情報)。
+    対応表が None の場合は切り出しを行っていない（元の配列をそのまま使う）。
+    """
+    audio_seconds = len(audio) / sample_rate
+    regions = detect_speech_regions(audio, sample_rate) if VAD_ENABLED else []
+    speech_seconds = sum(end - start for start, end in regions)
+    speech_ratio = speech_seconds / audio_seconds if audio_seconds else 0.0
+    stats = {"enabled": VAD_ENABLED, "audio_seconds": round(audio_seconds, 2), "speech_seconds": round(speech_seconds, 2), "speech_ratio": round(speech_ratio, 3), "regions": len(regions), "applied": False}
+    if not regions or speech_ratio >= VAD_SKIP_RATIO:
+        return audio, None, stats
+    compact, mapping = compact_audio(audio, regions, sample_rate)
+    stats["applied"] = True
+    stats["skipped_seconds"] = round(audio_seconds - len(compact) / sample_rate, 2)
+    return compact, mapping, stats
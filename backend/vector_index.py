@@ -0,0 +1,338 @@
+# backend/vector_index.py
+
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class QuantizedVectorIndex:
+    """
+    int8に量子化した埋め込みをメモリマップファイルに保存する、ローカルのベクトルインデックス。
+
+    ChromaDBのコレクションと同じ add / query / count / delete の呼び出し方ができるため、
+    KnowledgeBaseManager からバックエンドを差し替えて利用できます。
+    ベクトルは読み取り専用のメモリマップで開くので、同じファイルを開いた複数のワーカープロセスは
+    OSのページキャッシュを共有し、プロセスごとにfloat32のベクトルを抱えることがありません。
+    """
+    VECTORS_FILE = "vectors.i8"
+    SCALES_FILE = "scales.f32"
+    TOMBSTONES_FILE = "tombstones.u8"
+    ASSIGNMENTS_FILE = "ivf_assignments.i32"
+    CENTROIDS_FILE = "ivf_centroids.npy"
+    RECORDS_FILE = "records.jsonl"
+    OFFSETS_FILE = "records.offsets.i64"
+    META_FILE = "meta.json"
+    LOCK_FILE = ".lock"
+
+    # 全件スキャン時に一度にfloat32へ展開する行数（作業メモリの上限を決める）
+    SCAN_BLOCK_ROWS = 8192
+
+    def __init__(self, path: str, embedding_function=None, search_mode: str = "exact", n_probe: int = 8):
+        """
+        Args:
+            path (str): インデックスファイルを置くディレクトリ。
+            embedding_function: LangChainのEmbeddings互換オブジェクト（embed_documents / embed_query を持つもの）。
+                埋め込みを直接渡す場合は None でもよい。
+            search_mode (str): "exact"（全件スキャン）または "ivf"（転置ファイルによる近似検索）。
+            n_probe (int): IVF検索時に調べるクラスタ数。
+        """
+        if search_mode not in ("exact", "ivf"):
+            raise ValueError(f"サポートされていない検索モードです: {search_mode}")
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+        self.embedding_function = embedding_function
+        self.search_mode = search_mode
+        self.n_probe = n_probe
+        os.makedirs(self.path, exist_ok=True)
+
+        self.dim = None
+        self._rows = 0
+        self._vectors = self._scales = self._tombstones = self._assignments = self._offsets = None
+        self._centroids = None
+        # 読み込んだクラスタ中心ファイルの (inode, 更新時刻, サイズ)。他のプロセスが build_ivf で作り直したことを検出する
+        self._ivf_signature = None
+        self._ids_to_rows = None
+        self._refresh()
+
+    # --- ファイル操作のヘルパー ---
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _write_lock(self):
+        """書き込みはプロセス間で排他する。読み込みはロック不要。"""
+        with open(self._file(self.LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _replace_file(self, name: str, write):
+        """一時ファイルに書いてから os.replace で差し替える（他のプロセスが開いているメモリマップは古いファイルを指したまま壊れない）。"""
+        temp_path = self._file(f"{name}.{os.getpid()}.tmp")
+        with open(temp_path, "wb") as f:
+            write(f)
+        os.replace(temp_path, self._file(name))
+
+    def _file_signature(self, name: str):
+        try:
+            stat = os.stat(self._file(name))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _memmap(self, name: str, dtype, rows: int, width: int = 1):
+        if rows == 0:
+            return np.zeros((0, width) if width > 1 else (0,), dtype=dtype)
+        shape = (rows, width) if width > 1 else (rows,)
+        return np.memmap(self._file(name), dtype=dtype, mode="r", shape=shape)
+
+    def _refresh(self):
+        """
+        他のプロセスが追記した行を取り込むため、ファイルサイズが変わっていればメモリマップを開き直す。
+        行数の基準は最後に書き込まれる scales ファイルとする。
+        クラスタ中心のファイルが差し替えられていれば（build_ivf）、中心と割り当てを読み直す。
+        """
+        meta_path = self._file(self.META_FILE)
+        if self.dim is None and os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        if self.dim is None:
+            return
+
+        scales_path = self._file(self.SCALES_FILE)
+        rows = os.path.getsize(scales_path) // 4 if os.path.exists(scales_path) else 0
+        ivf_signature = self._file_signature(self.CENTROIDS_FILE)
+        ivf_changed = ivf_signature != self._ivf_signature
+        if ivf_changed:
+            self._ivf_signature = ivf_signature
+            self._centroids = np.load(self._file(self.CENTROIDS_FILE)) if ivf_signature else None
+        if rows == self._rows and self._vectors is not None and not ivf_changed:
+            return
+
+        self._rows = rows
+        self._vectors = self._memmap(self.VECTORS_FILE, np.int8, rows, self.dim)
+        self._scales = self._memmap(self.SCALES_FILE, np.float32, rows)
+        self._tombstones = self._memmap(self.TOMBSTONES_FILE, np.uint8, rows)
+        self._offsets = self._memmap(self.OFFSETS_FILE, np.int64, rows)
+        if self._centroids is not None:
+            self._assignments = self._memmap(self.ASSIGNMENTS_FILE, np.int32, rows)
+        self._ids_to_rows = None
+
+    # --- 量子化 ---
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @staticmethod
+    def quantize(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """行ごとの対称スケールでint8に量子化し、(int8ベクトル, スケール) を返す。"""
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    def _nearest_centroids(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    # --- ChromaDB互換のAPI ---
+    def count(self) -> int:
+        self._refresh()
+        if self._rows == 0:
+            return 0
+        return int(self._rows - np.count_nonzero(self._tombstones))
+
+    def add(self, ids: list[str], documents: list[str], metadatas: list[dict] | None = None, embeddings=None):
+        """ドキュメントと埋め込みをインデックスの末尾に追記する。"""
+        if not ids:
+            return
+        if embeddings is None:
+            if self.embedding_function is None:
+                raise ValueError("埋め込みが指定されておらず、embedding_function も設定されていません。")
+            embeddings = self.embedding_function.embed_documents(documents)
+        vectors = self._normalize(embeddings)
+        metadatas = metadatas or [{} for _ in ids]
+
+        with self._write_lock():
+            self._refresh()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self._file(self.META_FILE), "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"埋め込みの次元が一致しません: {vectors.shape[1]} != {self.dim}")
+
+            quantized, scales = self.quantize(vectors)
+            offsets = []
+            with open(self._file(self.RECORDS_FILE), "ab") as f:
+                for record_id, document, metadata in zip(ids, documents, metadatas):
+                    offsets.append(f.tell())
+                    line = json.dumps({"id": record_id, "document": document, "metadata": metadata or {}}, ensure_ascii=False)
+                    f.write(line.encode("utf-8") + b"\n")
+            with open(self._file(self.OFFSETS_FILE), "ab") as f:
+                f.write(np.asarray(offsets, dtype=np.int64).tobytes())
+            with open(self._file(self.VECTORS_FILE), "ab") as f:
+                f.write(quantized.tobytes())
+            with open(self._file(self.TOMBSTONES_FILE), "ab") as f:
+                f.write(np.zeros(len(ids), dtype=np.uint8).tobytes())
+            if self._centroids is not None:
+                with open(self._file(self.ASSIGNMENTS_FILE), "ab") as f:
+                    f.write(self._nearest_centroids(vectors).tobytes())
+            # scales は行数の基準になるため最後に書き込む
+            with open(self._file(self.SCALES_FILE), "ab") as f:
+                f.write(scales.tobytes())
+        self._refresh()
+
+    def delete(self, ids: list[str]):
+        """指定IDの行に削除フラグ（トゥームストーン）を立てる。ファイルの詰め直しは行わない。"""
+        self._refresh()
+        rows = [self._row_for_id(record_id) for record_id in ids]
+        with self._write_lock():
+            with open(self._file(self.TOMBSTONES_FILE), "r+b") as f:
+                for row in rows:
+                    if row is None:
+                        continue
+                    f.seek(row)
+                    f.write(b"\x01")
+
+    def query(self, query_texts: list[str] | None = None, query_embeddings=None, n_results: int = 10) -> dict:
+        """
+        コサイン類似度で上位 n_results 件を検索し、ChromaDBと同じ形式の辞書を返す。
+        distances には 1 - コサイン類似度 を入れる。
+        """
+        if query_embeddings is None:
+            if self.embedding_function is None:
+                raise ValueError("クエリの埋め込みが指定されておらず、embedding_function も設定されていません。")
+            query_embeddings = [self.embedding_function.embed_query(text) for text in query_texts]
+        queries = self._normalize(query_embeddings)
+        self._refresh()
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query in queries:
+            rows, scores = self._search(query, n_results)
+            records = [self._read_record(row) for row in rows]
+            results["ids"].append([record["id"] for record in records])
+            results["documents"].append([record["document"] for record in records])
+            results["metadatas"].append([record["metadata"] for record in records])
+            results["distances"].append([float(1.0 - score) for score in scores])
+        return results
+
+    def reset(self):
+        """インデックスのファイルをすべて削除して空にする。"""
+        with self._write_lock():
+            for name in os.listdir(self.path):
+                if name == self.LOCK_FILE:
+                    continue
+                file_path = self._file(name)
+                if os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
+                else:
+                    os.remove(file_path)
+        self.dim = None
+        self._rows = 0
+        self._vectors = self._scales = self._tombstones = self._assignments = self._offsets = None
+        self._centroids = None
+        self._ivf_signature = None
+        self._ids_to_rows = None
+
+    # --- IVF ---
+    def build_ivf(self, n_lists: int | None = None, n_iter: int = 10, sample_size: int = 50_000, seed: int = 0):
+        """
+        k-meansでクラスタ中心を学習し、全行をクラスタに割り当てる。
+        構築後に追記された行は add の時点で最も近いクラスタに割り当てられる。
+        """
+        # 行数の確認から割り当ての書き込みまでを同じロックの中で行う
+        # （ロックの外で行数を読むと、その間に add された行の割り当てが欠け、割り当てファイルが行数より短くなる）
+        with self._write_lock():
+            self._refresh()
+            live_rows = np.flatnonzero(self._tombstones == 0) if self._rows else np.zeros(0, dtype=np.int64)
+            if len(live_rows) == 0:
+                raise ValueError("インデックスが空のため、IVFを構築できません。")
+            n_lists = n_lists or max(1, int(np.sqrt(len(live_rows))))
+            n_lists = min(n_lists, len(live_rows))
+
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(live_rows, size=min(sample_size, len(live_rows)), replace=False))
+            sample = self._normalize(self._dequantize(sample_rows))
+            centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+            for _ in range(n_iter):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for list_id in range(n_lists):
+                    members = sample[labels == list_id]
+                    if len(members):
+                        centroids[list_id] = members.mean(axis=0)
+                centroids = self._normalize(centroids)
+
+            self._centroids = centroids.astype(np.float32)
+            assignments = np.empty(self._rows, dtype=np.int32)
+            for start in range(0, self._rows, self.SCAN_BLOCK_ROWS):
+                block = np.arange(start, min(start + self.SCAN_BLOCK_ROWS, self._rows))
+                assignments[block] = self._nearest_centroids(self._dequantize(block))
+            # 他のワーカーがメモリマップで開いているため、上書きせずに差し替える。
+            # 中心を最後に差し替え、中心の変化に気づいたプロセスが新しい割り当てを読むようにする
+            self._replace_file(self.ASSIGNMENTS_FILE, lambda f: f.write(assignments.tobytes()))
+            self._replace_file(self.CENTROIDS_FILE, lambda f: np.save(f, self._centroids))
+        self._refresh()
+        print(f"✅ IVFインデックスを構築しました: {n_lists}クラスタ, {self._rows}行")
+
+    # --- 検索の内部処理 ---
+    def _dequantize(self, rows: np.ndarray) -> np.ndarray:
+        return self._vectors[rows].astype(np.float32) * self._scales[rows, None]
+
+    def _candidate_rows(self, query: np.ndarray) -> np.ndarray | None:
+        """IVFモードなら調べる行番号を返す。全件スキャンの場合は None。"""
+        if self.search_mode != "ivf" or self._centroids is None:
+            return None
+        probe_lists = np.argsort(-(self._centroids @ query))[:self.n_probe]
+        return np.flatnonzero(np.isin(self._assignments, probe_lists))
+
+    def _search(self, query: np.ndarray, n_results: int) -> tuple[np.ndarray, np.ndarray]:
+        if self._rows == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        candidates = self._candidate_rows(query)
+        if candidates is None:
+            scores = np.empty(self._rows, dtype=np.float32)
+            for start in range(0, self._rows, self.SCAN_BLOCK_ROWS):
+                end = min(start + self.SCAN_BLOCK_ROWS, self._rows)
+                scores[start:end] = (self._vectors[start:end].astype(np.float32) @ query) * self._scales[start:end]
+            scores[self._tombstones[:self._rows] != 0] = -np.inf
+            candidates = np.arange(self._rows)
+        else:
+            scores = np.empty(len(candidates), dtype=np.float32)
+            for start in range(0, len(candidates), self.SCAN_BLOCK_ROWS):
+                block = candidates[start:start + self.SCAN_BLOCK_ROWS]
+                scores[start:start + len(block)] = (self._vectors[block].astype(np.float32) @ query) * self._scales[block]
+            scores[self._tombstones[candidates] != 0] = -np.inf
+
+        n_results = min(n_results, len(scores))
+        if n_results == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-scores, n_results - 1)[:n_results]
+        top = top[np.argsort(-scores[top])]
+        top = top[np.isfinite(scores[top])]
+        return candidates[top], scores[top]
+
+    def _read_record(self, row: int) -> dict:
+        with open(self._file(self.RECORDS_FILE), "rb") as f:
+            f.seek(int(self._offsets[row]))
+            return json.loads(f.readline())
+
+    def _row_for_id(self, record_id: str) -> int | None:
+        if self._ids_to_rows is None:
+            self._ids_to_rows = {}
+            if self._rows:
+                with open(self._file(self.RECORDS_FILE), "rb") as f:
+                    for row, line in enumerate(f):
+                        if row >= self._rows:
+                            break
+                        self._ids_to_rows[json.loads(line)["id"]] = row
+        return self._ids_to_rows.get(record_id)
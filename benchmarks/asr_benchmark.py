@@ -0,0 +1,132 @@
+"""
+文字起こし（ASR）プロファイルの比較ベンチマーク。
+
+backend/asr_engines.py の各プロファイル（fast / balanced / accurate / legacy）を別プロセスで読み込み、
+同じ音声を文字起こしして次の指標をJSONで出力します。
+- モデルの読み込み時間
+- real-time factor（文字起こし時間 / 音声の長さ。1未満なら実時間より速い）
+- RSS（読み込み後 / ピーク, MB）
+- 基準プロファイルの文字起こしとの文字単位の一致率（精度の目安）
+
+音声は実際の会議録音を --audio で指定するのが望ましいです。指定しない場合は合成音声を使いますが、
+その場合の一致率は意味を持ちません（速度とメモリの比較のみ）。
+
+使い方:
+    python benchmarks/asr_benchmark.py --audio meeting1.mp3 meeting2.m4a --profiles fast balanced legacy --output bench_asr.json
+"""
+import argparse
+import difflib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(os.path.dirname(BENCHMARKS_DIR), "backend"))
+sys.path.append(BENCHMARKS_DIR)
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * resource.getpagesize() / (1024 * 1024)
+
+
+def _run_profile(profile_name: str, audio_paths: list[str], device: str, queue):
+    from asr_engines import create_engine
+    from audio_io import SAMPLE_RATE, decode_audio
+
+    audios = [(path, decode_audio(path)) for path in audio_paths]
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    engine = create_engine(profile_name, device)
+    load_seconds = time.perf_counter() - started
+    rss_after_load = current_rss_mb()
+
+    files = []
+    for path, audio in audios:
+        started = time.perf_counter()
+        result = engine.transcribe(audio, language="ja")
+        seconds = time.perf_counter() - started
+        audio_seconds = len(audio) / SAMPLE_RATE
+        files.append({
+            "file": os.path.basename(path),
+            "audio_seconds": audio_seconds,
+            "transcribe_seconds": seconds,
+            "real_time_factor": seconds / audio_seconds if audio_seconds else None,
+            "words": sum(len(segment.get("words", [])) for segment in result["segments"]),
+            "text": result["text"],
+        })
+    total_audio = sum(f["audio_seconds"] for f in files)
+    queue.put({
+        "profile": profile_name,
+        "device": device,
+        "load_seconds": load_seconds,
+        "real_time_factor": sum(f["transcribe_seconds"] for f in files) / total_audio if total_audio else None,
+        "rss_mb_model": rss_after_load - rss_before,
+        "rss_mb_after_load": rss_after_load,
+        # ru_maxrss は Linux では KB 単位
+        "rss_mb_peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "files": files,
+    })
+
+
+def add_agreement(results: list[dict], reference: str):
+    """基準プロファイルの文字起こしとの一致率（difflib の ratio）を各ファイルに付ける。"""
+    reference_result = next((r for r in results if r["profile"] == reference), None)
+    if not reference_result:
+        return
+    reference_texts = {f["file"]: f["text"] for f in reference_result["files"]}
+    for result in results:
+        ratios = []
+        for f in result["files"]:
+            f["agreement_with_reference"] = difflib.SequenceMatcher(None, reference_texts.get(f["file"], ""), f["text"]).ratio()
+            ratios.append(f["agreement_with_reference"])
+        result["agreement_with_reference"] = sum(ratios) / len(ratios) if ratios else None
+
+
+def main():
+    from asr_engines import ASR_PROFILES
+
+    parser = argparse.ArgumentParser(description="ASRプロファイルの real-time factor / メモリ / 一致率を比較する")
+    parser.add_argument("--audio", nargs="+", help="計測に使う音声ファイル（未指定なら合成音声）")
+    parser.add_argument("--synthetic-seconds", type=float, default=60.0, help="合成音声を使う場合の長さ")
+    parser.add_argument("--profiles", nargs="+", choices=list(ASR_PROFILES), default=list(ASR_PROFILES))
+    parser.add_argument("--reference", default="accurate", help="一致率の基準にするプロファイル")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", default="bench_asr.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        audio_paths = args.audio
+        if not audio_paths:
+            from load_test import make_wav
+            audio_paths = [os.path.join(workdir, "synthetic.wav")]
+            with open(audio_paths[0], "wb") as f:
+                f.write(make_wav(args.synthetic_seconds))
+
+        results, context = [], multiprocessing.get_context("spawn")
+        for profile_name in args.profiles:
+            queue = context.Queue()
+            process = context.Process(target=_run_profile, args=(profile_name, audio_paths, args.device, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            print(f"{profile_name:10s} load={result['load_seconds']:.1f}s RTF={result['real_time_factor']:.3f} "
+                  f"model={result['rss_mb_model']:.0f}MB peak={result['rss_mb_peak']:.0f}MB")
+            results.append(result)
+
+    add_agreement(results, args.reference)
+    for result in results:
+        if result.get("agreement_with_reference") is not None:
+            print(f"{result['profile']:10s} {args.reference} との一致率: {result['agreement_with_reference']:.3f}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "cpu_count": os.cpu_count(), "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
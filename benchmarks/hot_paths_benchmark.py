@@ -0,0 +1,208 @@
+"""
+バックエンドのうち、データ量に比例して重くなる処理のマイクロベンチマーク。
+
+対象:
+- merge_results（話者分離と単語タイムスタンプの統合）
+- /history の一覧作成（list_history_summaries）
+- /api/dashboard の発言量集計（parse_speaker_contributions）
+- _parse_json_from_response（LLM応答からのJSON抽出）
+- search_knowledge_base（chroma / mmap バックエンド）
+- calculate_cost_in_jpy
+
+合成データのみを使うため、APIキーやネットワークは不要です。結果はJSONで保存し、
+--compare で前回の結果と比較できます。
+
+使い方:
+    python benchmarks/hot_paths_benchmark.py --output bench_hot_paths.json
+    python benchmarks/hot_paths_benchmark.py --quick --compare bench_hot_paths.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCHMARKS_DIR)
+sys.path.append(os.path.join(PROJECT_ROOT, "backend"))
+sys.path.append(BENCHMARKS_DIR)
+
+from synthetic_data import (HashingEmbeddings, make_diarization, make_knowledge_chunks, make_llm_responses,
+                            make_speakers_text, make_transcription, write_history_dir)
+
+# 名前 -> (規模のリスト, セットアップ関数)
+BENCHMARKS = {}
+
+
+def benchmark(name: str, scales: list[int]):
+    """セットアップ関数を登録するデコレーター。セットアップ関数は計測対象の引数なし関数を返す。"""
+    def register(setup):
+        BENCHMARKS[name] = (scales, setup)
+        return setup
+    return register
+
+
+@benchmark("merge_results", scales=[1_000, 10_000, 50_000])
+def bench_merge_results(n_words: int, workdir: str):
+    from transcript_utils import merge_results
+    transcription = make_transcription(n_words)
+    diarization = make_diarization(transcription["segments"][-1]["end"])
+    return lambda: merge_results(diarization, transcription)
+
+
+@benchmark("history_list", scales=[100, 1_000, 5_000])
+def bench_history_list(n_records: int, workdir: str):
+    from history_store import list_history_summaries
+    history_dir = write_history_dir(os.path.join(workdir, "history"), n_records)
+    return lambda: list_history_summaries(history_dir)
+
+
+@benchmark("dashboard_parse", scales=[100, 1_000, 10_000])
+def bench_dashboard_parse(n_turns: int, workdir: str):
+    from transcript_utils import parse_speaker_contributions
+    speakers_text = make_speakers_text(n_turns)
+    return lambda: parse_speaker_contributions(speakers_text)
+
+
+@benchmark("parse_json_from_response", scales=[5, 50, 500])
+def bench_parse_json(payload_items: int, workdir: str):
+    from ai_pipelines import _parse_json_from_response
+    responses = make_llm_responses(payload_items)
+    return lambda: [_parse_json_from_response(response) for response in responses]
+
+
+def _knowledge_base_manager(backend: str, workdir: str, n_chunks: int):
+    """__init__ を通さずに、合成埋め込みを使う KnowledgeBaseManager を組み立てる（APIキー不要にするため）。"""
+    from knowledge_base_manager import KnowledgeBaseManager
+    from vector_index import QuantizedVectorIndex
+
+    kb_manager = object.__new__(KnowledgeBaseManager)
+    kb_manager.backend = backend
+    embeddings = HashingEmbeddings()
+    if backend == "chroma":
+        import chromadb
+        kb_manager.client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma"))
+        kb_manager.collection = kb_manager.client.get_or_create_collection(name="bench", embedding_function=embeddings)
+    else:
+        kb_manager.client = None
+        kb_manager.collection = QuantizedVectorIndex(os.path.join(workdir, "mmap"), embedding_function=embeddings)
+
+    ids, documents, metadatas = make_knowledge_chunks(n_chunks)
+    for start in range(0, n_chunks, 5000):
+        kb_manager.collection.add(ids=ids[start:start + 5000], documents=documents[start:start + 5000], metadatas=metadatas[start:start + 5000])
+    return kb_manager
+
+
+@benchmark("search_knowledge_base[chroma]", scales=[1_000, 10_000, 50_000])
+def bench_search_chroma(n_chunks: int, workdir: str):
+    kb_manager = _knowledge_base_manager("chroma", workdir, n_chunks)
+    return lambda: kb_manager.search_knowledge_base("来週の会議の資料について")
+
+
+@benchmark("search_knowledge_base[mmap]", scales=[1_000, 10_000, 50_000])
+def bench_search_mmap(n_chunks: int, workdir: str):
+    kb_manager = _knowledge_base_manager("mmap", workdir, n_chunks)
+    return lambda: kb_manager.search_knowledge_base("来週の会議の資料について")
+
+
+@benchmark("calculate_cost_in_jpy", scales=[1_000])
+def bench_calculate_cost(n_calls: int, workdir: str):
+    from cost_calculator import calculate_cost_in_jpy
+    models = ["gpt-4o-mini", "gemini-1.5-flash-latest", "claude-3-haiku-20240307", "unknown-model"]
+    return lambda: [calculate_cost_in_jpy(models[i % len(models)], 12_000 + i, 800 + i, 600.0) for i in range(n_calls)]
+
+
+def measure(func, min_seconds: float, max_repeats: int) -> dict:
+    """1回のウォームアップの後、min_seconds 以上または max_repeats 回まで繰り返して計測する。"""
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        func()
+        timings, started = [], time.perf_counter()
+        while len(timings) < max_repeats and (len(timings) < 3 or time.perf_counter() - started < min_seconds):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+            sink.seek(0); sink.truncate()
+    timings.sort()
+    return {
+        "repeats": len(timings),
+        "mean_ms": statistics.fmean(timings),
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "min_ms": timings[0],
+    }
+
+
+def environment_info() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results: list[dict], baseline_path: str, threshold: float) -> list[str]:
+    """前回の結果と中央値を比較し、threshold 倍以上遅くなったものを返す。"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["name"], r["scale"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["name"], result["scale"]))
+        if not previous:
+            continue
+        ratio = result["median_ms"] / previous["median_ms"] if previous["median_ms"] else float("inf")
+        result["baseline_median_ms"] = previous["median_ms"]
+        result["ratio_to_baseline"] = ratio
+        marker = "  <-- 遅くなっています" if ratio >= threshold else ""
+        print(f"{result['name']:32s} scale={result['scale']:>7d} {previous['median_ms']:10.3f}ms -> {result['median_ms']:10.3f}ms (x{ratio:.2f}){marker}")
+        if ratio >= threshold:
+            regressions.append(f"{result['name']}@{result['scale']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="バックエンドのホットパスのマイクロベンチマーク")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="実行するベンチマークを絞り込む")
+    parser.add_argument("--quick", action="store_true", help="各ベンチマークの最小規模だけを実行する")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="1つの規模あたりの最小計測時間")
+    parser.add_argument("--max-repeats", type=int, default=50)
+    parser.add_argument("--output", default="bench_hot_paths.json")
+    parser.add_argument("--compare", help="比較対象とする前回の結果JSON")
+    parser.add_argument("--regression-threshold", type=float, default=1.2, help="この倍率以上遅くなったら回帰とみなす")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.only or list(BENCHMARKS):
+        scales, setup = BENCHMARKS[name]
+        for scale in scales[:1] if args.quick else scales:
+            with tempfile.TemporaryDirectory() as workdir:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    func = setup(scale, workdir)
+                stats = measure(func, args.min_seconds, args.max_repeats)
+            result = {"name": name, "scale": scale, **stats}
+            results.append(result)
+            print(f"{name:32s} scale={scale:>7d} median={stats['median_ms']:10.3f}ms p95={stats['p95_ms']:10.3f}ms (n={stats['repeats']})")
+
+    regressions = compare(results, args.compare, args.regression_threshold) if args.compare else []
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment_info(), "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {args.output}")
+    if regressions:
+        print(f"⚠️ 回帰の可能性: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
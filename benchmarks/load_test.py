@@ -0,0 +1,179 @@
+"""
+バックエンドAPIのエンドツーエンド負荷試験。
+
+音声ファイルを /analyze・/benchmark-summary に、質問を /api/ask-knowledge-base に、
+指定した並列数で送り続けます。LLMには mock-* モデル（backend/mock_llm.py）を使うため、
+OpenAI / Gemini / Anthropic の料金は発生しません。
+
+エンドポイントごとのスループットと p50/p95/p99 レイテンシに加え、レスポンスの Server-Timing ヘッダーから
+段階別（decode / transcribe / diarize / llm_draft など）のレイテンシも集計します。
+
+音声は実際の会議録音（発話を含むもの）を --audio で指定してください。
+--audio を省略すると合成音声（トーンと無音）を使いますが、合成音声はほとんど文字起こしされないため、
+/analyze は「短すぎる」扱いになってLLMの段階が計測されず、/benchmark-summary は 400 になります。
+合成音声は文字起こし・話者分離までの計測や、動作確認にだけ使ってください。
+
+使い方:
+    # バックエンドをモックLLMで起動（ナレッジベースの回答もモックにする）
+    KNOWLEDGE_LLM_MODEL=mock-gpt MOCK_LLM_LATENCY_SECONDS=0.8 uvicorn main:app --port 8000
+    # 実際の録音で負荷をかける
+    python benchmarks/load_test.py --base-url http://localhost:8000 --audio meeting1.mp3 meeting2.m4a --concurrency 4 --requests 40 --output load_test.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import statistics
+import time
+import wave
+
+import httpx
+import numpy as np
+
+SAMPLE_RATE = 16000
+KNOWLEDGE_QUESTIONS = ["来週の会議の資料について教えてください。", "予算の担当者は誰ですか？", "前回決まったToDoは何ですか？"]
+SERVER_TIMING_PATTERN = re.compile(r'^\s*([\w.-]+)(?:;desc="[^"]*")?;dur=([\d.]+)\s*$')
+
+
+def make_wav(duration_seconds: float, seed: int = 0) -> bytes:
+    """話者交代を模した、周波数の異なるトーンと無音を繋いだ16kHzモノラルWAVを生成する。"""
+    rng = np.random.default_rng(seed)
+    chunks, total = [], int(duration_seconds * SAMPLE_RATE)
+    while sum(len(c) for c in chunks) < total:
+        length = int(rng.uniform(1.0, 4.0) * SAMPLE_RATE)
+        t = np.arange(length) / SAMPLE_RATE
+        tone = 0.3 * np.sin(2 * np.pi * rng.uniform(120, 300) * t) + 0.02 * rng.standard_normal(length)
+        chunks.extend([tone, np.zeros(int(rng.uniform(0.1, 0.6) * SAMPLE_RATE))])
+    samples = (np.clip(np.concatenate(chunks)[:total], -1, 1) * 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1); f.setsampwidth(2); f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def parse_server_timing(header: str) -> dict[str, float]:
+    """Server-Timing ヘッダーを {段階名: ミリ秒} に変換する。同じ名前の段階は合計する。"""
+    stages = {}
+    for entry in header.split(",") if header else []:
+        match = SERVER_TIMING_PATTERN.match(entry)
+        if match:
+            stages[match.group(1)] = stages.get(match.group(1), 0.0) + float(match.group(2))
+    return stages
+
+
+def load_audio_files(args) -> list[tuple[str, bytes]]:
+    """--audio のファイルを読み込む。未指定なら合成音声を生成する。(ファイル名, 内容) のリストを返す。"""
+    if args.audio:
+        audio_files = []
+        for path in args.audio:
+            with open(path, "rb") as f:
+                audio_files.append((os.path.basename(path), f.read()))
+        return audio_files
+    print("⚠️ --audio が指定されていないため合成音声を使います。LLMの段階（llm_draft など）は計測されません。")
+    random.seed(args.seed)
+    return [(f"synthetic_{i}.wav", make_wav(random.uniform(args.min_duration, args.max_duration), seed=args.seed + i)) for i in range(args.audio_files)]
+
+
+def build_request(endpoint: str, audio_files: list[tuple[str, bytes]], model: str, i: int) -> dict:
+    filename, content = audio_files[i % len(audio_files)]
+    if endpoint == "analyze":
+        return {"url": "/analyze", "files": {"file": (filename, content, "application/octet-stream")}, "data": {"model_name": model}}
+    if endpoint == "benchmark-summary":
+        return {"url": "/benchmark-summary", "files": {"file": (filename, content, "application/octet-stream")}, "data": {"models_to_benchmark": json.dumps([model, f"{model}-fast-200ms"])}}
+    return {"url": "/api/ask-knowledge-base", "json": {"question": KNOWLEDGE_QUESTIONS[i % len(KNOWLEDGE_QUESTIONS)]}}
+
+
+async def run_endpoint(client: httpx.AsyncClient, endpoint: str, audio_files: list[tuple[str, bytes]], model: str, concurrency: int, n_requests: int) -> dict:
+    """n_requests 件を concurrency 並列で送り、各リクエストの結果を集める。"""
+    semaphore, samples = asyncio.Semaphore(concurrency), []
+
+    async def one(i: int):
+        async with semaphore:
+            request = build_request(endpoint, audio_files, model, i)
+            start = time.perf_counter()
+            try:
+                response = await client.post(request.pop("url"), **request)
+                status, stages = response.status_code, parse_server_timing(response.headers.get("server-timing", ""))
+            except httpx.HTTPError as e:
+                status, stages = type(e).__name__, {}
+            samples.append({"latency_ms": (time.perf_counter() - start) * 1000, "status": status, "stages": stages})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    return summarize(endpoint, samples, time.perf_counter() - started, concurrency)
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(len(values) * q))]
+    return {"count": len(values), "mean_ms": statistics.fmean(values), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": values[-1]}
+
+
+def summarize(endpoint: str, samples: list[dict], elapsed: float, concurrency: int) -> dict:
+    ok = [s for s in samples if s["status"] == 200]
+    stage_names = sorted({name for s in ok for name in s["stages"]})
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "errors": {str(status): sum(1 for s in samples if s["status"] == status) for status in {s["status"] for s in samples} if status != 200},
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "latency": percentiles([s["latency_ms"] for s in ok]),
+        "stages": {name: percentiles([s["stages"][name] for s in ok if name in s["stages"]]) for name in stage_names},
+    }
+
+
+def print_report(report: dict):
+    latency = report["latency"]
+    print(f"\n[{report['endpoint']}] 並列={report['concurrency']} 成功={report['succeeded']}/{report['requests']} スループット={report['throughput_rps']:.2f} req/s")
+    if report["errors"]:
+        print(f"  エラー: {report['errors']}")
+    if latency:
+        print(f"  {'(全体)':20s} p50={latency['p50_ms']:9.1f}ms p95={latency['p95_ms']:9.1f}ms p99={latency['p99_ms']:9.1f}ms")
+    for name, stats in report["stages"].items():
+        print(f"  {name:20s} p50={stats['p50_ms']:9.1f}ms p95={stats['p95_ms']:9.1f}ms p99={stats['p99_ms']:9.1f}ms")
+
+
+async def main_async(args):
+    audio_files = load_audio_files(args)
+    reports = []
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        for endpoint in args.endpoints:
+            report = await run_endpoint(client, endpoint, audio_files, args.model, args.concurrency, args.requests)
+            print_report(report)
+            reports.append(report)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="モックLLMを使ったバックエンドAPIの負荷試験")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--endpoints", nargs="+", choices=["analyze", "benchmark-summary", "ask-knowledge-base"], default=["analyze", "benchmark-summary", "ask-knowledge-base"])
+    parser.add_argument("--model", default="mock-gpt", help="要約に使うモデル名（mock- で始まる名前ならモックLLM）")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20, help="エンドポイントごとのリクエスト数")
+    parser.add_argument("--audio", nargs="+", help="送信する音声ファイル（発話を含む実際の録音。未指定なら合成音声）")
+    parser.add_argument("--audio-files", type=int, default=4, help="生成する合成音声の種類数")
+    parser.add_argument("--min-duration", type=float, default=20.0, help="合成音声の最短秒数")
+    parser.add_argument("--max-duration", type=float, default=60.0, help="合成音声の最長秒数")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test.json")
+    args = parser.parse_args()
+
+    reports = asyncio.run(main_async(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args), "cpu_count": os.cpu_count(), "results": reports}, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+ベンチマーク用の合成データ生成。
+
+Whisper（whisper-timestamped）と pyannote の出力、分析履歴ディレクトリ、ナレッジベースのチャンクを
+乱数から生成します。外部APIやモデルのダウンロードは一切行いません。
+"""
+import hashlib
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+# 日本語らしい文字列を作るための音節
+SYLLABLES = list("あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん") + ["会議", "資料", "確認", "予算", "来週", "担当", "提案", "準備"]
+SENTENCE_ENDINGS = ["。", "。", "。", "！", "？"]
+
+
+def make_words(n_words: int, seed: int = 0, words_per_second: float = 3.0) -> list[dict]:
+    """whisper-timestamped の単語リストと同じ形式（text / start / end / confidence）の単語を生成する。"""
+    rng = random.Random(seed)
+    words, t = [], 0.0
+    for i in range(n_words):
+        duration = rng.uniform(0.5, 1.5) / words_per_second
+        text = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+        if i % 12 == 11:
+            text += rng.choice(SENTENCE_ENDINGS)
+        words.append({"text": text, "start": round(t, 3), "end": round(t + duration, 3), "confidence": rng.uniform(0.5, 1.0)})
+        t += duration + rng.uniform(0.0, 0.2)
+    return words
+
+
+def make_transcription(n_words: int, seed: int = 0, words_per_segment: int = 24) -> dict:
+    """whisper.transcribe の戻り値と同じ構造（text / segments / words）を生成する。"""
+    words = make_words(n_words, seed)
+    segments = []
+    for i in range(0, len(words), words_per_segment):
+        segment_words = words[i:i + words_per_segment]
+        segments.append({
+            "id": len(segments),
+            "start": segment_words[0]["start"],
+            "end": segment_words[-1]["end"],
+            "text": " ".join(w["text"] for w in segment_words),
+            "words": segment_words,
+        })
+    return {"text": " ".join(w["text"] for w in words), "segments": segments, "language": "ja"}
+
+
+def make_diarization(duration_seconds: float, n_speakers: int = 4, mean_turn_seconds: float = 8.0, seed: int = 0):
+    """pyannote の話者分離結果（pyannote.core.Annotation）を生成する。"""
+    from pyannote.core import Annotation, Segment
+
+    rng = random.Random(seed)
+    annotation = Annotation(uri="synthetic")
+    t, speaker = 0.0, 0
+    while t < duration_seconds:
+        turn = min(rng.expovariate(1.0 / mean_turn_seconds) + 0.5, duration_seconds - t)
+        annotation[Segment(t, t + turn)] = f"SPEAKER_{speaker:02d}"
+        t += turn + rng.uniform(0.0, 0.3)
+        speaker = (speaker + rng.randint(1, n_speakers - 1)) % n_speakers if n_speakers > 1 else 0
+    return annotation
+
+
+def make_speakers_text(n_turns: int, n_speakers: int = 4, words_per_turn: int = 30, seed: int = 0) -> str:
+    """merge_results が生成する「**話者**: 発言」形式のテキストを生成する。"""
+    rng = random.Random(seed)
+    words = make_words(n_turns * words_per_turn, seed)
+    turns = []
+    for i in range(n_turns):
+        speech = " ".join(w["text"] for w in words[i * words_per_turn:(i + 1) * words_per_turn])
+        turns.append(f"**SPEAKER_{rng.randrange(n_speakers):02d}**: {speech}")
+    return "\n\n".join(turns)
+
+
+def make_history_record(words: int = 600, seed: int = 0) -> dict:
+    """/analyze が保存する分析結果JSONと同じ構造のレコードを生成する。"""
+    rng = random.Random(seed)
+    speakers_text = make_speakers_text(max(1, words // 30), seed=seed)
+    created_at = datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=rng.randrange(500_000))
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "createdAt": created_at.isoformat(),
+        "originalFilename": f"meeting_{seed}.mp3",
+        "model_name": rng.choice(["gpt-4o-mini", "gemini-1.5-flash-latest", "claude-3-haiku-20240307"]),
+        "transcript": speakers_text.replace("**", ""),
+        "summary": "- 要約1\n- 要約2\n- 要約3",
+        "todos": ["ToDo1", "ToDo2"],
+        "speakers": speakers_text,
+        "cost": rng.uniform(0.01, 1.0),
+        "reliability": {"score": rng.uniform(0.0, 1.0), "justification": "合成データ"},
+    }
+
+
+def write_history_dir(path: str, n_records: int, words_per_record: int = 600, seed: int = 0) -> str:
+    """分析履歴ディレクトリに n_records 件のJSONを書き出す。"""
+    os.makedirs(path, exist_ok=True)
+    for i in range(n_records):
+        record = make_history_record(words_per_record, seed=seed + i)
+        with open(os.path.join(path, f"{record['id']}.json"), "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=4)
+    return path
+
+
+def make_llm_responses(payload_items: int, seed: int = 0) -> list[str]:
+    """_parse_json_from_response が受け取る、各プロバイダーの典型的な応答文字列を生成する。"""
+    rng = random.Random(seed)
+    payload = {
+        "summary": ["".join(rng.choice(SYLLABLES) for _ in range(40)) for _ in range(payload_items)],
+        "todos": ["".join(rng.choice(SYLLABLES) for _ in range(20)) for _ in range(payload_items)],
+    }
+    body = json.dumps(payload, ensure_ascii=False)
+    return [
+        body,                                                  # OpenAI (json_object モード)
+        f"```json\n{body}\n```",                               # Gemini / Claude のマークダウンブロック
+        f"以下が結果です。\n{body}\nご確認ください。",             # 前後に説明文が付く応答
+    ]
+
+
+class HashingEmbeddings:
+    """
+    文字列のハッシュから決定的なベクトルを作る埋め込み関数。
+    LangChainのEmbeddings（embed_documents / embed_query）と ChromaDB の EmbeddingFunction（__call__）の両方の形で使えます。
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+    def __call__(self, input: list[str]) -> list[list[float]]:
+        return self.embed_documents(input)
+
+    def name(self) -> str:
+        return "hashing-embeddings"
+
+
+def make_knowledge_chunks(n_chunks: int, seed: int = 0) -> tuple[list[str], list[str], list[dict]]:
+    """ナレッジベースに追加する (ids, documents, metadatas) を生成する。"""
+    rng = random.Random(seed)
+    ids, documents, metadatas = [], [], []
+    for i in range(n_chunks):
+        ids.append(f"chunk-{i}")
+        documents.append("".join(rng.choice(SYLLABLES) for _ in range(200)))
+        metadatas.append({"source_file": f"meeting_{i // 20}.json", "chunk_index": i % 20})
+    return ids, documents, metadatas
@@ -0,0 +1,144 @@
+"""
+ナレッジベースのベクトル検索バックエンドを比較するベンチマーク。
+
+合成した埋め込み（クラスタ構造を持つ正規乱数）を使うため、APIキーやネットワークは不要です。
+各バックエンドは別プロセスで計測し、次の指標をJSONで出力します。
+- recall@k: float32の全件検索（厳密解）に対する再現率
+- 検索レイテンシ (p50 / p95, ミリ秒)
+- プロセスのRSS (MB)
+
+使い方:
+    python benchmarks/vector_index_benchmark.py --sizes 10000 50000 --dim 1536 --output bench_vector_index.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.append(BACKEND_DIR)
+
+
+def make_dataset(n_vectors: int, dim: int, n_queries: int, seed: int = 0):
+    """クラスタ構造を持つ合成埋め込みとクエリを生成する。"""
+    rng = np.random.default_rng(seed)
+    n_clusters = max(8, n_vectors // 500)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, n_clusters, n_vectors)] + 0.6 * rng.normal(size=(n_vectors, dim)).astype(np.float32)
+    queries = vectors[rng.integers(0, n_vectors, n_queries)] + 0.3 * rng.normal(size=(n_queries, dim)).astype(np.float32)
+    return vectors, queries
+
+
+def exact_ground_truth(vectors: np.ndarray, queries: np.ndarray, k: int) -> list[set]:
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = []
+    for query in q:
+        scores = normalized @ query
+        truth.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+    return truth
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * resource.getpagesize() / (1024 * 1024)
+
+
+def _run_backend(backend: str, n_vectors: int, dim: int, n_queries: int, k: int, workdir: str, queue):
+    vectors, queries = make_dataset(n_vectors, dim, n_queries)
+    truth = exact_ground_truth(vectors, queries, k)
+    ids = [str(i) for i in range(n_vectors)]
+    documents = [f"doc-{i}" for i in range(n_vectors)]
+    batch = 5000
+
+    if backend == "chroma":
+        # knowledge_base_manager と同じ sqlite3 パッチを当てる
+        __import__("pysqlite3")
+        sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
+        import chromadb
+        client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma"))
+        collection = client.get_or_create_collection(name="bench", metadata={"hnsw:space": "cosine"})
+        for start in range(0, n_vectors, batch):
+            collection.add(ids=ids[start:start + batch], documents=documents[start:start + batch], embeddings=vectors[start:start + batch].tolist())
+        del client
+        client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma"))
+        collection = client.get_collection(name="bench")
+        search = lambda query: collection.query(query_embeddings=[query.tolist()], n_results=k)["ids"][0]
+    else:
+        from vector_index import QuantizedVectorIndex
+        index_path = os.path.join(workdir, "mmap")
+        index = QuantizedVectorIndex(index_path)
+        for start in range(0, n_vectors, batch):
+            index.add(ids[start:start + batch], documents[start:start + batch], embeddings=vectors[start:start + batch])
+        search_mode = "ivf" if backend == "mmap-ivf" else "exact"
+        if search_mode == "ivf":
+            index.build_ivf()
+        del index
+        index = QuantizedVectorIndex(index_path, search_mode=search_mode, n_probe=8)
+        search = lambda query: index.query(query_embeddings=[query], n_results=k)["ids"][0]
+
+    # 入力データを解放してから、検索に必要なメモリだけを計測する
+    del vectors
+    rss_before = current_rss_mb()
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(expected & {int(i) for i in found})
+
+    queue.put({
+        "backend": backend,
+        "n_vectors": n_vectors,
+        "dim": dim,
+        "k": k,
+        "recall_at_k": hits / (k * len(truth)),
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        "rss_mb_before_queries": rss_before,
+        "rss_mb_after_queries": current_rss_mb(),
+    })
+
+
+def run(backends: list[str], sizes: list[int], dim: int, n_queries: int, k: int) -> list[dict]:
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for n_vectors in sizes:
+        for backend in backends:
+            with tempfile.TemporaryDirectory() as workdir:
+                queue = context.Queue()
+                process = context.Process(target=_run_backend, args=(backend, n_vectors, dim, n_queries, k, workdir, queue))
+                process.start()
+                result = queue.get()
+                process.join()
+            print(f"{backend:10s} n={n_vectors:>8d} recall@{k}={result['recall_at_k']:.3f} "
+                  f"p50={result['latency_ms_p50']:.2f}ms p95={result['latency_ms_p95']:.2f}ms rss={result['rss_mb_after_queries']:.1f}MB")
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベクトル検索バックエンドのrecall / レイテンシ / RSS を比較する")
+    parser.add_argument("--backends", nargs="+", default=["chroma", "mmap-exact", "mmap-ivf"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 50_000])
+    parser.add_argument("--dim", type=int, default=1536, help="text-embedding-3-small と同じ1536次元が既定")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--output", default="bench_vector_index.json")
+    args = parser.parse_args()
+
+    results = run(args.backends, args.sizes, args.dim, args.queries, args.k)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
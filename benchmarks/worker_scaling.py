@@ -0,0 +1,106 @@
+"""
+gunicorn のワーカー数ごとのスループットを計測する。
+
+ワーカー数を変えて backend を gunicorn（backend/gunicorn.conf.py）で起動し、load_test.py で同じ負荷をかけて
+エンドポイントごとのスループットと p50/p95 を比較します。LLMはモック（mock-*）を使うため料金は発生しません。
+結果はJSONと、README に貼り付けられるMarkdownの表で出力します。
+
+使い方:
+    python benchmarks/worker_scaling.py --audio meeting1.mp3 meeting2.m4a --workers 1 2 4 --concurrency 8 --requests 40 --output bench_workers.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "backend")
+sys.path.append(BENCHMARKS_DIR)
+
+import load_test
+
+
+def start_server(n_workers: int, port: int, extra_env: dict) -> subprocess.Popen:
+    env = {**os.environ, "WEB_CONCURRENCY": str(n_workers), "PORT": str(port), "PRELOAD_MODELS": "true",
+           "KNOWLEDGE_LLM_MODEL": "mock-gpt", **extra_env}
+    # ワーカー数に合わせて同時実行の上限も増やす（上限が1のままだとワーカーを増やしても並列にならない）
+    env.setdefault("ADMISSION_MAX_QUEUED_JOBS", "1000")
+    return subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "main:app"], cwd=BACKEND_DIR, env=env, start_new_session=True)
+
+
+def wait_until_ready(base_url: str, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(base_url + "/", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(2)
+    raise TimeoutError(f"{base_url} が {timeout:.0f}秒以内に起動しませんでした。")
+
+
+def stop_server(process: subprocess.Popen):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def markdown_table(results: list[dict]) -> str:
+    lines = ["| ワーカー数 | エンドポイント | 並列数 | スループット (req/s) | p50 (s) | p95 (s) | 成功/全体 |", "|---|---|---|---|---|---|---|"]
+    for result in results:
+        for report in result["reports"]:
+            latency = report["latency"] or {}
+            lines.append(f"| {result['workers']} | {report['endpoint']} | {report['concurrency']} | {report['throughput_rps']:.3f} | "
+                         f"{latency.get('p50_ms', 0) / 1000:.1f} | {latency.get('p95_ms', 0) / 1000:.1f} | {report['succeeded']}/{report['requests']} |")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gunicorn のワーカー数ごとのスループットを計測する")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--endpoints", nargs="+", default=["analyze"])
+    parser.add_argument("--model", default="mock-gpt")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--audio", nargs="+", help="送信する音声ファイル（発話を含む実際の録音。未指定なら合成音声）")
+    parser.add_argument("--audio-files", type=int, default=4)
+    parser.add_argument("--min-duration", type=float, default=30.0)
+    parser.add_argument("--max-duration", type=float, default=90.0)
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--output", default="bench_workers.json")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    load_args = argparse.Namespace(base_url=base_url, endpoints=args.endpoints, model=args.model, concurrency=args.concurrency,
+                                   requests=args.requests, audio=args.audio, audio_files=args.audio_files, min_duration=args.min_duration,
+                                   max_duration=args.max_duration, timeout=3600.0, seed=0)
+    results = []
+    for n_workers in args.workers:
+        print(f"\n=== ワーカー数 {n_workers} ===")
+        process = start_server(n_workers, args.port, {"ADMISSION_MAX_CONCURRENT_JOBS": "1"})
+        try:
+            wait_until_ready(base_url, args.startup_timeout)
+            reports = asyncio.run(load_test.main_async(load_args))
+        finally:
+            stop_server(process)
+        results.append({"workers": n_workers, "reports": reports})
+
+    table = markdown_table(results)
+    print("\n" + table)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "cpu_count": os.cpu_count(), "args": vars(args), "results": results, "markdown": table}, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
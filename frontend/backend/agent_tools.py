@@ -1,10 +1,41 @@
 # agent_tools.py
-import pandas as pd
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from langchain.tools import tool
-from sqlalchemy.orm import Session
 import database
 from models import invoke_model
-from config import RAG_CONFIG_OPTIONS
+from config import RAG_CONFIG_OPTIONS, EVAL_MAX_CONCURRENCY, FAILURE_ANALYSIS_DEFAULT_COUNT, FAILURE_ANALYSIS_MAX_COUNT
+from log_stats import success_rates, model_stats
+
+# --- 失敗分析のキャッシュ ---
+# ログIDごとに (内容のハッシュ, 分析結果) を保持する。履歴をクリアするとIDが再利用されるため、内容が一致する場合だけ使う
+_failure_analysis_cache = {}
+_failure_analysis_lock = threading.Lock()
+
+def explain_failure(row) -> str:
+    """「X」と判定された評価ログ1件の原因をLLMで分析する（結果はログIDごとにキャッシュ）"""
+    content_hash = hashlib.sha256("\0".join(str(v) for v in (row.model_name, row.question, row.ground_truth, row.generated_answer)).encode("utf-8")).hexdigest()
+    with _failure_analysis_lock:
+        cached = _failure_analysis_cache.get(row.id)
+    if cached is not None and cached[0] == content_hash:
+        return cached[1]
+    try:
+        analysis_prompt = f"""
+        以下の質問に対する生成回答は、正解と比べてなぜ「X」と判定されたのでしょうか？
+        簡潔に理由を分析してください。
+        質問: {row.question}
+        正解: {row.ground_truth}
+        生成回答: {row.generated_answer}
+        """
+        analysis = invoke_model(row.model_name, analysis_prompt, {})
+    except Exception as e:
+        # エラーはキャッシュしない（次回の依頼で再試行する）
+        return f"【質問: {row.question}】\n分析中にエラーが発生しました: {e}\n"
+    result = f"【質問: {row.question}】\n原因分析: {analysis}\n"
+    with _failure_analysis_lock:
+        _failure_analysis_cache[row.id] = (content_hash, result)
+    return result
 
 class AgentToolsManager:
     """AIアシスタントが使用するツールを管理するクラス"""
@@ -22,85 +53,55 @@ class AgentToolsManager:
             self.run_evaluation_for_agent,
         ]
 
-    def _get_df_from_db(self) -> pd.DataFrame:
-        """データベースから評価履歴をDataFrameとして読み込むヘルパー関数"""
-        db = self.db_session_factory()
-        try:
-            query = db.query(database.EvaluationLog).statement
-            df = pd.read_sql(query, db.bind)
-            return df
-        finally:
-            db.close()
-
     @tool
     def summarize_model_performance(self) -> str:
         """評価履歴データに基づき、各モデルの性能を要約します。"""
-        df = self._get_df_from_db()
-        if df.empty:
+        summary = success_rates("model_name")
+        if summary.empty:
             return "評価履歴データがありません。"
         
-        summary = df.groupby('model_name')['final_judgement'].apply(
-            lambda x: (x == 'O').mean()
-        ).sort_values(ascending=False)
-        
         summary_text = "【モデル別性能サマリー】\n"
-        for model, success_rate in summary.items():
-            count = len(df[df['model_name'] == model])
-            summary_text += f"- {model}: 成功率 {success_rate:.2%} ({count}件中)\n"
+        for row in summary.itertuples():
+            summary_text += f"- {row.group}: 成功率 {row.success_rate:.2%} ({row.total}件中)\n"
         return summary_text
 
     @tool
-    def analyze_failed_questions(self) -> str:
-        """最終判定が「X」となった質問を抽出し、その原因をAIで分析します。"""
-        df = self._get_df_from_db()
-        if df.empty:
-            return "評価履歴データがありません。"
-
-        failed_df = df[df['final_judgement'] == 'X']
-        if failed_df.empty:
+    def analyze_failed_questions(self, count: int = FAILURE_ANALYSIS_DEFAULT_COUNT) -> str:
+        """最終判定が「X」となった質問のうち新しいものから count 件を抽出し、その原因をAIで分析します。"""
+        count = max(1, min(int(count), FAILURE_ANALYSIS_MAX_COUNT))
+        log = database.EvaluationLog
+        db = self.db_session_factory()
+        try:
+            failed_rows = db.query(log.id, log.model_name, log.question, log.ground_truth, log.generated_answer) \
+                .filter(log.final_judgement == 'X').order_by(log.id.desc()).limit(count).all()
+        finally:
+            db.close()
+        if not failed_rows:
             return "最終判定が「X」の質問はありませんでした。"
-        
-        # 最新3件に絞って分析
-        recent_failed_df = failed_df.tail(3)
-        analysis_results = []
-        for _, row in recent_failed_df.iterrows():
-            try:
-                analysis_prompt = f"""
-                以下の質問に対する生成回答は、正解と比べてなぜ「X」と判定されたのでしょうか？
-                簡潔に理由を分析してください。
-                質問: {row['question']}
-                正解: {row['ground_truth']}
-                生成回答: {row['generated_answer']}
-                """
-                analysis = invoke_model(row['model_name'], analysis_prompt, {})
-                analysis_results.append(f"【質問: {row['question']}】\n原因分析: {analysis}\n")
-            except Exception as e:
-                analysis_results.append(f"【質問: {row['question']}】\n分析中にエラーが発生しました: {e}\n")
+
+        # 分析は並列に行い、結果はログごとにキャッシュする（同じ依頼の2回目以降はLLMを呼ばない）
+        with ThreadPoolExecutor(max_workers=EVAL_MAX_CONCURRENCY) as executor:
+            analysis_results = list(executor.map(explain_failure, failed_rows))
         return "「X」と判定された質問の原因分析:\n\n" + "\n".join(analysis_results)
 
     @tool
     def compare_models_configs(self, query: str) -> str:
         """ "gpt-4o vs claude-3-sonnet" のように、2つのモデルの性能を比較します。"""
-        df = self._get_df_from_db()
-        if df.empty:
-            return "評価履歴データがありません。"
-
         parts = query.lower().split(" vs ")
         if len(parts) != 2:
             return "比較するには「A vs B」の形式でモデル名を指定してください。"
         item1, item2 = parts[0].strip(), parts[1].strip()
+        if success_rates("model_name").empty:
+            return "評価履歴データがありません。"
 
-        def get_summary(item_name, df_group):
-            filtered_df = df_group[df_group['model_name'].str.lower() == item_name]
-            if filtered_df.empty:
+        def get_summary(item_name):
+            stats = model_stats(item_name)
+            if stats is None:
                 return f"'{item_name}'のデータが見つかりません。"
-            success_rate = (filtered_df['final_judgement'] == 'O').mean()
-            avg_faithfulness = filtered_df['faithfulness'].mean()
-            avg_cost = filtered_df['cost_usd'].mean()
-            return f"- {item_name}:\n  - 成功率: {success_rate:.2%}\n  - 忠実性 (Faithfulness): {avg_faithfulness:.3f}\n  - 平均コスト: ${avg_cost:.6f}"
+            return f"- {item_name}:\n  - 成功率: {stats['success_rate']:.2%}\n  - 忠実性 (Faithfulness): {stats['avg_faithfulness']:.3f}\n  - 平均コスト: ${stats['avg_cost']:.6f}"
         
-        summary1 = get_summary(item1, df)
-        summary2 = get_summary(item2, df)
+        summary1 = get_summary(item1)
+        summary2 = get_summary(item2)
         return f"【モデル性能比較レポート】\n{summary1}\n\n{summary2}"
 
     @tool
@@ -26,4 +26,38 @@ MODEL_COSTS = {
     "claude-3-opus-20240229": {"input": 0.015, "output": 0.075},
     "claude-3-sonnet-20240229": {"input": 0.003, "output": 0.015},
     "claude-3-haiku-20240307": {"input": 0.00025, "output": 0.00125},
-}
\ No newline at end of file
+}
+
+# 一括評価で回答生成・LLM判定を同時に実行する最大数（プロバイダーのレート制限に合わせて調整）
+EVAL_MAX_CONCURRENCY = int(os.getenv("EVAL_MAX_CONCURRENCY", "4"))
+
+# 埋め込みモデル（utils のコサイン類似度と、文脈CSVのベクトルストアで共有する）
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "intfloat/multilingual-e5-large")
+# 同時に届いたエンコード要求をまとめる最大件数と、まとめるために待つ時間（ミリ秒）
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10"))
+# 埋め込みのLRUキャッシュに保持するテキスト数
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+
+# 文脈CSVのベクトルストアの保存先と、チャンク分割の設定（設定を変えると別のストアとして作り直される）
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vector_stores")
+DOCS_CHUNK_SIZE = int(os.getenv("DOCS_CHUNK_SIZE", "1000"))
+DOCS_CHUNK_OVERLAP = int(os.getenv("DOCS_CHUNK_OVERLAP", "200"))
+
+# 評価履歴テーブルの1ページの行数と、一覧で表示する長文列（質問・正解・生成回答・文脈）の最大文字数
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_TEXT_PREVIEW_CHARS = int(os.getenv("HISTORY_TEXT_PREVIEW_CHARS", "80"))
+
+# 評価ログDB（SQLite）の接続プールと、評価ログをまとめて書き込むバッファの設定
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+LOG_WRITE_BATCH_SIZE = int(os.getenv("LOG_WRITE_BATCH_SIZE", "200"))
+LOG_WRITE_BATCH_WAIT_MS = float(os.getenv("LOG_WRITE_BATCH_WAIT_MS", "20"))
+
+# AIアシスタントの失敗分析で、原因を分析する「X」判定の件数（既定）と上限
+FAILURE_ANALYSIS_DEFAULT_COUNT = int(os.getenv("FAILURE_ANALYSIS_DEFAULT_COUNT", "3"))
+FAILURE_ANALYSIS_MAX_COUNT = int(os.getenv("FAILURE_ANALYSIS_MAX_COUNT", "20"))
+
+# 3Dスコアプロットに個別の点として描く最大件数。超えた場合はスコアを丸めて集計し、件数を点の大きさで表す
+PLOT_MAX_POINTS = int(os.getenv("PLOT_MAX_POINTS", "5000"))
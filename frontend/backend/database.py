@@ -1,14 +1,40 @@
 # database.py
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy import create_engine, event, func, Column, Integer, String, Float, DateTime, Index
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+from concurrent.futures import Future
 import datetime
+import threading
+
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_BUSY_TIMEOUT_MS, LOG_WRITE_BATCH_SIZE, LOG_WRITE_BATCH_WAIT_MS
+from micro_batcher import MicroBatcher
 
 # SQLiteデータベースファイルのパス
 DATABASE_URL = "sqlite:///evaluation_log.db"
 
 # SQLAlchemyのエンジンを作成
 # connect_argsはSQLite使用時にスレッドセーフを確保するために必要
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# 接続数は pool_size + max_overflow までに制限し、それ以上は空くまで待つ
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT_MS / 1000},
+    poolclass=QueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True,
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WALモード: 書き込み中も読み取り（履歴・グラフ）がブロックされない
+    synchronous=NORMAL: WALではコミットごとのfsyncを省いても破損しない（電源断時に直近のコミットが失われる可能性のみ）
+    busy_timeout: 他の接続が書き込み中のとき、すぐに "database is locked" にせず待つ
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.close()
 
 # データベースセッションを作成するためのクラス
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -42,9 +68,111 @@ class EvaluationLog(Base):
     # コスト
     cost_usd = Column(Float)
 
+    # モデル別・RAG構成別の成功率の集計を、テーブル本体を読まずにインデックスだけで行うための複合インデックス
+    __table_args__ = (
+        Index("ix_evaluation_logs_model_config_judgement", "model_name", "rag_config", "final_judgement"),
+        Index("ix_evaluation_logs_config_judgement", "rag_config", "final_judgement"),
+    )
+
+# --- データバージョンと件数 ---
+# data_version: 評価ログの追加・変更・削除がコミットされるたびに増える。集計やグラフのキャッシュはこの値が変わったら作り直す
+# 件数は最初の1回だけ COUNT(*) で数え、以降はコミットされた追加・削除の数で更新する（このプロセスからの書き込みのみ反映）
+data_version = 0
+_log_count = None
+_counter_lock = threading.Lock()
+
+def get_log_count() -> int:
+    """評価ログの件数"""
+    global _log_count
+    if _log_count is None:
+        db = SessionLocal()
+        try:
+            count = db.query(func.count(EvaluationLog.id)).scalar()
+        finally:
+            db.close()
+        with _counter_lock:
+            if _log_count is None: _log_count = count
+    return _log_count
+
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_logs_changed(session, flush_context):
+    added = sum(isinstance(obj, EvaluationLog) for obj in session.new)
+    deleted = sum(isinstance(obj, EvaluationLog) for obj in session.deleted)
+    if added or deleted or any(isinstance(obj, EvaluationLog) for obj in session.dirty):
+        session.info["evaluation_logs_changed"] = True
+        session.info["evaluation_logs_delta"] = session.info.get("evaluation_logs_delta", 0) + added - deleted
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_data_version(session):
+    global data_version, _log_count
+    if session.info.pop("evaluation_logs_changed", False):
+        delta = session.info.pop("evaluation_logs_delta", 0)
+        with _counter_lock:
+            data_version += 1
+            if _log_count is not None: _log_count = max(0, _log_count + delta)
+
+@event.listens_for(SessionLocal, "after_bulk_delete")
+def _mark_bulk_delete(delete_context):
+    if delete_context.mapper.class_ is EvaluationLog:
+        session = delete_context.session
+        session.info["evaluation_logs_changed"] = True
+        session.info["evaluation_logs_delta"] = session.info.get("evaluation_logs_delta", 0) - delete_context.result.rowcount
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _clear_logs_changed(session):
+    session.info.pop("evaluation_logs_changed", None)
+    session.info.pop("evaluation_logs_delta", None)
+
+# --- 評価ログの書き込みバッファ ---
+class LogWriter:
+    """
+    評価ログの書き込みを専用スレッドに集め、まとめて1トランザクションで INSERT する。
+    SQLiteの書き込みは1接続ずつしか行えないため、複数のセッションや一括評価から同時に届いた書き込みを
+    LOG_WRITE_BATCH_WAIT_MS の間（最大 LOG_WRITE_BATCH_SIZE 件）まとめ、コミットの回数とロック待ちを減らす。
+    """
+    def __init__(self, batch_size=LOG_WRITE_BATCH_SIZE, batch_wait_ms=LOG_WRITE_BATCH_WAIT_MS):
+        self._batcher = MicroBatcher(self._write_batch, batch_size, batch_wait_ms, name="evaluation-log-writer")
+
+    def submit(self, logs: list) -> Future:
+        """ログを書き込み待ちに追加する。返り値の Future はコミットが終わると完了する（失敗時は例外）"""
+        return self._batcher.submit(logs)
+
+    def write(self, logs: list):
+        """ログを書き込み、コミットが終わるまで待つ"""
+        self.submit(logs).result()
+
+    def _commit(self, logs):
+        db = SessionLocal()
+        try:
+            db.add_all(logs)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_batch(self, batch):
+        try:
+            self._commit([log for logs, _ in batch for log in logs])
+            for _, future in batch: future.set_result(None)
+        except Exception:
+            # まとめた中の1件が原因で全体が失敗した場合に巻き込まないよう、依頼ごとに書き直す
+            for logs, future in batch:
+                try:
+                    self._commit(logs)
+                    future.set_result(None)
+                except Exception as e:
+                    future.set_exception(e)
+
+log_writer = LogWriter()
+
 def init_db():
     """
     データベースを初期化し、テーブルが存在しない場合は作成します。
     アプリケーションの起動時に一度だけ呼び出されます。
     """
     Base.metadata.create_all(bind=engine)
+    # create_all は既存のテーブルにインデックスを追加しないため、後から追加したインデックスはここで作成する
+    for index in EvaluationLog.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
@@ -0,0 +1,112 @@
+# docs_store.py
+import datetime
+import hashlib
+import json
+import os
+
+from langchain_community.vectorstores import Chroma
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from config import VECTOR_STORE_DIR, DOCS_CHUNK_SIZE, DOCS_CHUNK_OVERLAP, EMBEDDING_MODEL_NAME
+from embedding_service import SharedEmbeddings
+
+# Chromaのget/addに一度に渡すID数（SQLiteの変数上限を超えないように分割する）
+CHROMA_IO_BATCH = 1000
+
+def _sha256(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def settings_key() -> str:
+    """分割・埋め込みの設定のハッシュ。設定が変わると、保存済みの埋め込みは使わない"""
+    return _sha256(EMBEDDING_MODEL_NAME, DOCS_CHUNK_SIZE, DOCS_CHUNK_OVERLAP)[:16]
+
+def _batches(items, size=CHROMA_IO_BATCH):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _upsert(vectorstore, ids, texts, vectors, metadatas):
+    """埋め込み済みのチャンクをそのままChromaに書き込む（再計算させない）"""
+    for start in range(0, len(ids), CHROMA_IO_BATCH):
+        end = start + CHROMA_IO_BATCH
+        vectorstore._collection.upsert(ids=ids[start:end], documents=texts[start:end], embeddings=vectors[start:end], metadatas=metadatas[start:end])
+
+class DocsVectorStore:
+    """
+    アップロードされた文脈CSVのベクトルストアを、内容のハッシュをキーにディスクへ保存する。
+    VECTOR_STORE_DIR/<設定のハッシュ>/ に次の2種類のChromaコレクションを置く:
+      - rows: 行の内容ハッシュごとのチャンクと埋め込み（CSVをまたいで再利用するキャッシュ）
+      - csv_<CSVのハッシュ>: そのCSVの検索用ストア。作成完了後に manifest を書き、次回からはそのまま開く
+    CSVが少しだけ変わった場合は、rows に無い行だけを分割・埋め込みする。
+    """
+    def __init__(self, base_dir=VECTOR_STORE_DIR):
+        self.directory = os.path.join(base_dir, settings_key())
+        os.makedirs(self.directory, exist_ok=True)
+        self.embeddings = SharedEmbeddings()
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=DOCS_CHUNK_SIZE, chunk_overlap=DOCS_CHUNK_OVERLAP)
+        self.row_cache = self._open("rows")
+
+    def _open(self, collection_name):
+        return Chroma(collection_name=collection_name, embedding_function=self.embeddings, persist_directory=self.directory)
+
+    def _manifest_path(self, csv_hash):
+        return os.path.join(self.directory, f"csv_{csv_hash}.json")
+
+    def load_or_build(self, csv_bytes: bytes, documents: list[str]):
+        """
+        CSVのベクトルストアを返す。同じ内容・同じ設定のストアが保存済みならそれを開く。
+
+        Returns:
+            tuple[Chroma, dict]: (ベクトルストア, {"reused", "chunks", "rows", "embedded_rows"})
+        """
+        csv_hash = _sha256(csv_bytes)[:16]
+        manifest_path = self._manifest_path(csv_hash)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            return self._open(f"csv_{csv_hash}"), {**manifest, "reused": True, "embedded_rows": 0}
+
+        # 同じ内容の行は1回だけ扱う（行の内容ハッシュがチャンクIDの元になる）
+        rows = {_sha256(text)[:32]: text for text in documents}
+        chunks_by_row, embedded_rows = self._get_or_embed_rows(rows)
+
+        vectorstore = self._open(f"csv_{csv_hash}")
+        ids, texts, vectors, metadatas = [], [], [], []
+        for row_hash in rows:
+            for i, (text, vector) in enumerate(chunks_by_row[row_hash]):
+                ids.append(f"{row_hash}:{i}")
+                texts.append(text)
+                vectors.append(vector)
+                metadatas.append({"row_hash": row_hash})
+        _upsert(vectorstore, ids, texts, vectors, metadatas)
+
+        manifest = {"chunks": len(ids), "rows": len(rows), "created_at": datetime.datetime.now().isoformat(timespec="seconds")}
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        return vectorstore, {**manifest, "reused": False, "embedded_rows": embedded_rows}
+
+    def _get_or_embed_rows(self, rows: dict):
+        """行ごとの (チャンク, 埋め込み) のリストを返す。キャッシュに無い行だけ分割・埋め込みする"""
+        chunks_by_row = {row_hash: [] for row_hash in rows}
+        for batch in _batches(list(rows)):
+            cached = self.row_cache._collection.get(where={"row_hash": {"$in": batch}}, include=["documents", "embeddings", "metadatas"])
+            found = sorted(zip(cached["ids"], cached["documents"], cached["embeddings"]), key=lambda x: int(x[0].rsplit(":", 1)[1]))
+            for chunk_id, text, vector in found:
+                chunks_by_row[chunk_id.rsplit(":", 1)[0]].append((text, list(vector)))
+
+        missing = [row_hash for row_hash, chunks in chunks_by_row.items() if not chunks]
+        new_ids, new_texts, new_metadatas = [], [], []
+        for row_hash in missing:
+            for i, chunk in enumerate(self.splitter.split_text(rows[row_hash])):
+                new_ids.append(f"{row_hash}:{i}")
+                new_texts.append(chunk)
+                new_metadatas.append({"row_hash": row_hash})
+        if new_texts:
+            vectors = self.embeddings.embed_documents(new_texts)
+            _upsert(self.row_cache, new_ids, new_texts, vectors, new_metadatas)
+            for chunk_id, text, vector in zip(new_ids, new_texts, vectors):
+                chunks_by_row[chunk_id.rsplit(":", 1)[0]].append((text, vector))
+        return chunks_by_row, len(missing)
@@ -0,0 +1,112 @@
+# embedding_service.py
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import EMBEDDING_MODEL_NAME, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT_MS, EMBEDDING_CACHE_SIZE
+from micro_batcher import MicroBatcher
+
+def text_key(text: str) -> str:
+    """キャッシュのキー（テキストのSHA-256）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingService:
+    """
+    プロセス内で1つだけ SentenceTransformer を保持する埋め込みサービス。
+    - モデルは最初のエンコード要求で読み込む（import時には読み込まない）
+    - 複数のスレッドから同時に届いた要求は、専用スレッドが1回の encode にまとめて処理する
+    - 埋め込みはテキストのハッシュをキーにしたLRUキャッシュに保持する
+    返す埋め込みはL2正規化済みなので、内積がそのままコサイン類似度になる。
+    """
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, batch_size=EMBEDDING_BATCH_SIZE,
+                 batch_wait_ms=EMBEDDING_BATCH_WAIT_MS, cache_size=EMBEDDING_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._batcher = MicroBatcher(self._encode_batch, batch_size, batch_wait_ms, name="embedding-batcher")
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    print(f"埋め込みモデル {self.model_name} をロード中...")
+                    self._model = SentenceTransformer(self.model_name)
+                    print("埋め込みモデルのロード完了。")
+        return self._model
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """テキストのリストを (件数, 次元) の正規化済み埋め込みに変換する。"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        keys = [text_key(t) for t in texts]
+        found = self._cache_get(keys)
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        if missing:
+            found.update(zip(missing.keys(), self._batcher.submit(list(missing.values())).result()))
+        return np.stack([found[k] for k in keys])
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+    def cache_info(self) -> dict:
+        with self._cache_lock:
+            return {"size": len(self._cache), "max_size": self.cache_size}
+
+    def _cache_get(self, keys):
+        found = {}
+        with self._cache_lock:
+            for k in keys:
+                if k in self._cache:
+                    self._cache.move_to_end(k)
+                    found[k] = self._cache[k]
+        return found
+
+    def _cache_put(self, keys, vectors):
+        with self._cache_lock:
+            for k, v in zip(keys, vectors):
+                self._cache[k] = v
+                self._cache.move_to_end(k)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _encode_batch(self, batch):
+        # 同じテキストが複数の要求に含まれていても1回だけエンコードする
+        unique = list(dict.fromkeys(t for texts, _ in batch for t in texts))
+        vectors = self.model.encode(unique, batch_size=self.batch_size, convert_to_numpy=True,
+                                    normalize_embeddings=True, show_progress_bar=False).astype(np.float32)
+        by_text = dict(zip(unique, vectors))
+        self._cache_put([text_key(t) for t in unique], vectors)
+        for texts, future in batch:
+            future.set_result([by_text[t] for t in texts])
+
+class SharedEmbeddings(Embeddings):
+    """LangChain（Chroma など）から共有の埋め込みサービスを使うためのアダプタ"""
+    def __init__(self, service: EmbeddingService = None):
+        self.service = service or get_embedding_service()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.service.embed(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.service.embed_one(text).tolist()
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_embedding_service() -> EmbeddingService:
+    """プロセスで共有する EmbeddingService を返す"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService()
+    return _service
@@ -1,7 +1,10 @@
 # gradio_ui.py
+from functools import partial
+
 import gradio as gr
 from config import RAG_CONFIG_OPTIONS, EVAL_MODEL_OPTIONS, AGENT_MODEL_OPTIONS, DF_HEADERS
 import japanize_matplotlib
+from handlers import handle_history_page, handle_history_row_select
 
 def create_ui_tabs():
     """Gradio UIのタブ構成とコンポーネントを定義する"""
@@ -64,6 +67,18 @@ def create_ui_tabs():
                 ui_components["csv_save_status"] = gr.Textbox(label="保存ステータス", interactive=False)
 
             ui_components["history_df_display"] = gr.DataFrame(headers=DF_HEADERS, interactive=False, wrap=True)
+            # 履歴はページ単位で読み込む（idによるキーセットページング）。長文の列は一覧では省略し、行を選択すると全文を表示する
+            ui_components["history_cursors"] = gr.State([None])
+            ui_components["history_next_cursor"] = gr.State(None)
+            with gr.Row():
+                ui_components["history_prev_btn"] = gr.Button("前のページ")
+                ui_components["history_page_label"] = gr.Textbox(label="ページ", interactive=False, value="1ページ目")
+                ui_components["history_next_btn"] = gr.Button("次のページ")
+            with gr.Accordion("選択した評価の全文", open=False):
+                ui_components["history_detail_question"] = gr.Textbox(label="質問", interactive=False)
+                ui_components["history_detail_ground_truth"] = gr.Textbox(label="正解", interactive=False)
+                ui_components["history_detail_answer"] = gr.Textbox(label="生成回答", interactive=False, lines=5)
+                ui_components["history_detail_contexts"] = gr.Textbox(label="検索された文脈", interactive=False, lines=8)
 
             gr.Markdown("### フィルタリング")
             with gr.Row():
@@ -71,6 +86,17 @@ def create_ui_tabs():
                 ui_components["filter_config"] = gr.Dropdown(label="RAG構成", choices=["All"] + RAG_CONFIG_OPTIONS, value="All", interactive=True)
                 ui_components["filter_final"] = gr.Dropdown(label="最終判定", choices=["All", "O", "X"], value="All", interactive=True)
 
+            # 履歴のページ移動（フィルターを変えたら先頭ページに戻る）と、選択した行の全文の読み込み
+            history_inputs = [ui_components[name] for name in ("filter_model", "filter_config", "filter_final", "history_cursors", "history_next_cursor")]
+            history_outputs = [ui_components[name] for name in ("history_df_display", "history_cursors", "history_next_cursor", "history_page_label")]
+            page_events = [(ui_components["history_prev_btn"].click, "prev"), (ui_components["history_next_btn"].click, "next")]
+            page_events += [(ui_components[name].change, "first") for name in ("filter_model", "filter_config", "filter_final")]
+            for event, direction in page_events:
+                event(partial(handle_history_page, direction=direction), inputs=history_inputs, outputs=history_outputs)
+            ui_components["history_df_display"].select(
+                handle_history_row_select, inputs=[ui_components["history_df_display"]],
+                outputs=[ui_components[name] for name in ("history_detail_question", "history_detail_ground_truth", "history_detail_answer", "history_detail_contexts")])
+
             gr.Markdown("### グラフ分析")
             with gr.Row():
                 ui_components["graph_3d_btn"] = gr.Button("3Dスコアプロットを生成", variant="primary")
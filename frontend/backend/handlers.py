@@ -2,15 +2,12 @@
 import pandas as pd
 import io
 import datetime
+import threading
 import chardet
 import gradio as gr
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datasets import Dataset
-from sqlalchemy.orm import Session
-
-# LangChain & RAG
-from langchain_community.vectorstores import Chroma
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.embeddings import SentenceTransformerEmbeddings
+from sqlalchemy import func
 
 # Ragas
 from ragas import evaluate
@@ -18,9 +15,11 @@ from ragas.metrics import faithfulness, answer_relevancy, context_precision, con
 
 # ローカルモジュール
 import database
-from rag_pipeline import run_rag_pipeline
-from utils import tonic_similarity, cosine_sim, llm_evaluate, plot_3d_scores, plot_group_analysis
-from config import DF_HEADERS, COSINE_THRESHOLD
+from rag_pipeline import run_rag_pipeline_batch
+from utils import tonic_similarity, cosine_sim_batch, llm_evaluate, plot_3d_scores, plot_group_analysis
+from config import DF_HEADERS, COSINE_THRESHOLD, EVAL_MAX_CONCURRENCY, HISTORY_PAGE_SIZE, HISTORY_TEXT_PREVIEW_CHARS
+from docs_store import DocsVectorStore
+from log_stats import success_rates, score_points, cached_by_data_version
 from agent_setup import initialize_agent_executor
 from agent_tools import AgentToolsManager
 
@@ -39,6 +38,13 @@ def determine_final_judgement(ragas_score, cosine_score):
     return "X"
 
 # --- ファイル読み込みとベクトルストア構築 ---
+_docs_store = None
+
+def get_docs_store():
+    global _docs_store
+    if _docs_store is None: _docs_store = DocsVectorStore()
+    return _docs_store
+
 def handle_csv_qna_upload(state, f):
     if f is None: return gr.update(), gr.update(), "ファイルが選択されていません。"
     try:
@@ -60,101 +66,226 @@ def handle_csv_docs_upload(state, f):
         byte_data = f.read()
         encoding = chardet.detect(byte_data)['encoding']
         df = pd.read_csv(io.BytesIO(byte_data), encoding=encoding)
-        documents = [row['内容'] for _, row in df.iterrows()]
-        
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        splits = text_splitter.create_documents(documents)
+        documents = [doc for doc in df['内容'].dropna().astype(str) if doc.strip()]
+
+        # 同じCSV・同じ設定のストアが保存済みなら再利用し、変わった行だけを埋め込む
+        vectorstore, stats = get_docs_store().load_or_build(byte_data, documents)
 
-        embedding_function = SentenceTransformerEmbeddings(model_name="intfloat/multilingual-e5-large")
-        vectorstore = Chroma.from_documents(documents=splits, embedding=embedding_function)
-        
         state.retriever = vectorstore.as_retriever()
-        return f"文脈CSVがロードされ、ベクトルストアが構築されました ({len(splits)}チャンク)。"
+        if stats["reused"]:
+            return f"文脈CSVがロードされ、保存済みのベクトルストアを再利用しました ({stats['chunks']}チャンク)。"
+        return f"文脈CSVがロードされ、ベクトルストアが構築されました ({stats['chunks']}チャンク、新規に埋め込んだ行: {stats['embedded_rows']}/{stats['rows']})。"
     except Exception as e:
         return f"エラー: {e}"
 
 # --- 評価実行 ---
+RAGAS_METRICS = [faithfulness, answer_relevancy, context_precision, context_recall]
+
+def _split_contexts(contexts):
+    return [c.strip() for c in contexts.split('\n\n') if c]
+
+def _score_value(scores, key):
+    value = scores.get(key, 0)
+    return 0.0 if pd.isna(value) else float(value)
+
+def run_batch_evaluation(state, model_name, questions, prog=None):
+    """
+    複数の質問をまとめて評価し、評価ログを1トランザクションで保存する。
+    1) 文脈検索を全質問まとめて行い、回答生成を EVAL_MAX_CONCURRENCY 件まで並列に実行（run_rag_pipeline_batch）
+    2) ragas の evaluate を全件のデータセットに対して1回だけ実行
+    3) LLM判定（Tonic・O/X）を並列に実行し、コサイン類似度を計算
+    4) 全ログを書き込みバッファ（database.log_writer）に渡し、1回のコミットで保存
+
+    Returns:
+        tuple[list[dict], list[tuple[str, str]]]: (成功した評価結果のリスト, (質問, エラー内容) のリスト)
+    """
+    # 文脈検索1 + 回答生成n + Ragas1 + LLM判定n + 保存1
+    total_steps = len(questions) * 2 + 3
+    done_steps = 0
+    # 回答生成の進捗は run_rag_pipeline_batch のワーカースレッドから呼ばれるため、ロックの中で数える
+    progress_lock = threading.Lock()
+    def advance(desc):
+        nonlocal done_steps
+        with progress_lock:
+            done_steps += 1
+            if prog is not None: prog(done_steps / total_steps, desc=desc)
+
+    ground_truths = state.df_qna.drop_duplicates("質問").set_index("質問")["正解"]
+    rag_config = ", ".join(state.current_rag_config)
+    errors = []
+
+    # 1. 文脈検索と回答生成（バッチ）
+    generated = {}
+    results = run_rag_pipeline_batch(state.retriever, model_name, questions, max_concurrency=EVAL_MAX_CONCURRENCY, on_progress=advance)
+    for question, result in zip(questions, results):
+        if isinstance(result, Exception):
+            print(f"回答生成エラー ({question[:30]}): {result}")
+            errors.append((question, str(result)))
+        else:
+            generated[question] = result
+
+    items = [{"question": q, "ground_truth": ground_truths[q], "answer": generated[q][0], "contexts": generated[q][1], "cost": generated[q][2]}
+             for q in questions if q in generated]
+    if not items:
+        return [], errors
+
+    # 2. Ragas評価（全件を1回で）
+    dataset = Dataset.from_dict({
+        'question': [item["question"] for item in items], 'answer': [item["answer"] for item in items],
+        'contexts': [_split_contexts(item["contexts"]) for item in items], 'ground_truth': [item["ground_truth"] for item in items],
+    })
+    ragas_rows = evaluate(dataset, metrics=RAGAS_METRICS).to_pandas().to_dict("records")
+    advance(f"Ragas評価完了 ({len(items)}件)")
+
+    # 3. LLM判定（並列）とコサイン類似度
+    def judge(item):
+        tonic_score = tonic_similarity(item["question"], item["ground_truth"], item["answer"], model_name)
+        mlflow_ox = llm_evaluate(model_name, [item["question"]], [item["answer"]], [item["ground_truth"]])[0]
+        return tonic_score, mlflow_ox
+
+    with ThreadPoolExecutor(max_workers=EVAL_MAX_CONCURRENCY) as executor:
+        futures = {executor.submit(judge, item): i for i, item in enumerate(items)}
+        for n, future in enumerate(as_completed(futures), start=1):
+            items[futures[future]]["tonic_score"], items[futures[future]]["mlflow_judgement"] = future.result()
+            advance(f"LLM判定: {n}/{len(items)}")
+
+    cosines = cosine_sim_batch([item["ground_truth"] for item in items], [item["answer"] for item in items])
+    for item, scores, cosine in zip(items, ragas_rows, cosines):
+        item["ragas"] = {metric.name: _score_value(scores, metric.name) for metric in RAGAS_METRICS}
+        item["cosine"] = float(cosine)
+        item["final_judgement"] = determine_final_judgement(item["ragas"], item["cosine"])
+
+    # 4. DB保存（書き込みバッファ経由で1トランザクション）
+    database.log_writer.write([database.EvaluationLog(
+        model_name=model_name, rag_config=rag_config,
+        question=item["question"], ground_truth=item["ground_truth"], generated_answer=item["answer"],
+        retrieved_contexts=item["contexts"], final_judgement=item["final_judgement"],
+        tonic_score=item["tonic_score"], cosine_similarity=round(item["cosine"], 3), mlflow_judgement=item["mlflow_judgement"],
+        faithfulness=item["ragas"]['faithfulness'], answer_relevancy=item["ragas"]['answer_relevancy'],
+        context_precision=item["ragas"]['context_precision'], context_recall=item["ragas"]['context_recall'],
+        cost_usd=item["cost"]
+    ) for item in items])
+    advance(f"{len(items)}件の評価ログを保存しました")
+    return items, errors
+
+def get_eval_count():
+    return database.get_log_count()
+
 def handle_single_evaluation(state, model_name, question):
     if state.df_qna is None: return "", "質問データがロードされていません。", "", "0"
     if state.retriever is None: return "", "文脈データがロードされていません。", "", "0"
     
-    db = next(get_db())
     try:
-        row = state.df_qna[state.df_qna["質問"] == question].iloc[0]
-        ground_truth = row["正解"]
-
-        answer, contexts, cost = run_rag_pipeline(state.retriever, model_name, question)
-        
-        data_samples = {'question': [question], 'answer': [answer], 'contexts': [[c.strip() for c in contexts.split('\n\n') if c]], 'ground_truth': [ground_truth]}
-        dataset = Dataset.from_dict(data_samples)
-        ragas_score = evaluate(dataset, metrics=[faithfulness, answer_relevancy, context_precision, context_recall])
-        
-        tonic_score = tonic_similarity(question, ground_truth, answer, model_name)
-        cosine = cosine_sim(ground_truth, answer)
-        mlflow_ox = llm_evaluate(model_name, [question], [answer], [ground_truth])[0]
-        
-        final_judgement = determine_final_judgement(ragas_score, cosine)
-
-        new_log = database.EvaluationLog(
-            model_name=model_name, rag_config=", ".join(state.current_rag_config),
-            question=question, ground_truth=ground_truth, generated_answer=answer,
-            retrieved_contexts=contexts, final_judgement=final_judgement,
-            tonic_score=tonic_score, cosine_similarity=round(cosine, 3), mlflow_judgement=mlflow_ox,
-            faithfulness=ragas_score.get('faithfulness', 0), answer_relevancy=ragas_score.get('answer_relevancy', 0),
-            context_precision=ragas_score.get('context_precision', 0), context_recall=ragas_score.get('context_recall', 0),
-            cost_usd=cost
-        )
-        db.add(new_log)
-        db.commit()
-        
-        eval_count = db.query(database.EvaluationLog).count()
-        detail_text = f"コスト: ${cost:.6f}, Faithfulness: {ragas_score.get('faithfulness', 0):.3f}, Answer Relevancy: {ragas_score.get('answer_relevancy', 0):.3f}"
-        return answer, f"最終判定: {final_judgement}", detail_text, str(eval_count)
+        items, errors = run_batch_evaluation(state, model_name, [question])
+        if errors: raise RuntimeError(errors[0][1])
+        item = items[0]
+        detail_text = f"コスト: ${item['cost']:.6f}, Faithfulness: {item['ragas']['faithfulness']:.3f}, Answer Relevancy: {item['ragas']['answer_relevancy']:.3f}"
+        return item["answer"], f"最終判定: {item['final_judgement']}", detail_text, str(get_eval_count())
     except Exception as e:
-        db.rollback()
         print(f"評価エラー: {e}")
-        return "エラー発生", str(e), "", str(db.query(database.EvaluationLog).count())
-    finally:
-        db.close()
+        return "エラー発生", str(e), "", str(get_eval_count())
 
 def handle_multi_evaluation(state, model_name, selected_questions, prog=gr.Progress()):
-    db = next(get_db())
-    count = db.query(database.EvaluationLog).count()
-    db.close()
-    if not selected_questions: return "評価する質問が選択されていません。", str(count)
-        
-    for i, question in enumerate(selected_questions):
-        prog((i + 1) / len(selected_questions), desc=f"評価中: {question[:30]}...")
-        handle_single_evaluation(state, model_name, question)
-    
-    db = next(get_db())
-    eval_count = db.query(database.EvaluationLog).count()
-    db.close()
-    return f"{len(selected_questions)} 件を一括評価しました。", str(eval_count)
+    if not selected_questions: return "評価する質問が選択されていません。", str(get_eval_count())
+    if state.df_qna is None: return "質問データがロードされていません。", str(get_eval_count())
+    if state.retriever is None: return "文脈データがロードされていません。", str(get_eval_count())
+
+    try:
+        items, errors = run_batch_evaluation(state, model_name, selected_questions, prog)
+    except Exception as e:
+        print(f"一括評価エラー: {e}")
+        return f"一括評価中にエラーが発生しました: {e}", str(get_eval_count())
+
+    status = f"{len(items)} 件を一括評価しました。"
+    if errors:
+        status += f"（{len(errors)} 件は回答生成に失敗: " + ", ".join(q[:20] for q, _ in errors) + "）"
+    return status, str(get_eval_count())
 
 # --- 履歴の取得とクリア ---
+_PREVIEW_COLUMNS = {"質問": "question", "正解": "ground_truth", "生成回答": "generated_answer", "検索された文脈": "retrieved_contexts"}
+
+def _truncate(text, limit=HISTORY_TEXT_PREVIEW_CHARS):
+    if text is None: return ""
+    return text[:limit] + "…" if len(text) > limit else text
+
 def get_history_df(model_filter="All", config_filter="All", final_filter="All"):
+    """評価履歴の先頭ページ（新しい順に HISTORY_PAGE_SIZE 件）をDataFrameで返す。ページ移動は handle_history_page を使う"""
+    return get_history_page(model_filter, config_filter, final_filter)[0]
+
+def get_history_page(model_filter="All", config_filter="All", final_filter="All", before_id=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    評価履歴を新しい順に1ページ分返す（idによるキーセットページング）。
+    長文の列は先頭 HISTORY_TEXT_PREVIEW_CHARS 文字だけをSQLで切り出して読み、全文は get_log_detail で取得する。
+
+    Returns:
+        tuple[pd.DataFrame, int | None]: (表示用のDataFrame, 次のページの before_id。最後のページなら None)
+    """
+    log = database.EvaluationLog
     db = next(get_db())
     try:
-        query = db.query(database.EvaluationLog)
-        if model_filter != "All": query = query.filter(database.EvaluationLog.model_name == model_filter)
-        if config_filter != "All": query = query.filter(database.EvaluationLog.rag_config == config_filter)
-        if final_filter != "All": query = query.filter(database.EvaluationLog.final_judgement == final_filter)
-        
-        logs = query.order_by(database.EvaluationLog.id.desc()).all()
-        if not logs: return pd.DataFrame(columns=DF_HEADERS)
-        
-        log_list = [{
-            "ID": log.id, "タイムスタンプ": log.timestamp.strftime("%Y-%m-%d %H:%M"), "モデル": log.model_name,
-            "構成": log.rag_config, "質問": log.question, "最終判定": log.final_judgement,
-            "Faithfulness": f"{log.faithfulness:.3f}", "Answer Relevancy": f"{log.answer_relevancy:.3f}",
-            "Context Precision": f"{log.context_precision:.3f}", "Context Recall": f"{log.context_recall:.3f}",
-            "コスト(USD)": f"${log.cost_usd:.6f}", "正解": log.ground_truth,
-            "生成回答": log.generated_answer, "検索された文脈": log.retrieved_contexts
-        } for log in logs]
-        return pd.DataFrame(log_list, columns=DF_HEADERS)
+        # 「…」を付けるかを判定するため、1文字多く切り出す
+        previews = [func.substr(getattr(log, column), 1, HISTORY_TEXT_PREVIEW_CHARS + 1).label(column) for column in _PREVIEW_COLUMNS.values()]
+        query = db.query(log.id, log.timestamp, log.model_name, log.rag_config, log.final_judgement, log.faithfulness,
+                         log.answer_relevancy, log.context_precision, log.context_recall, log.cost_usd, *previews)
+        if model_filter != "All": query = query.filter(log.model_name == model_filter)
+        if config_filter != "All": query = query.filter(log.rag_config == config_filter)
+        if final_filter != "All": query = query.filter(log.final_judgement == final_filter)
+        if before_id is not None: query = query.filter(log.id < before_id)
+
+        rows = query.order_by(log.id.desc()).limit(page_size + 1).all()
+    finally:
+        db.close()
+
+    next_before_id = rows[page_size - 1].id if len(rows) > page_size else None
+    rows = rows[:page_size]
+    if not rows: return pd.DataFrame(columns=DF_HEADERS), None
+
+    log_list = [{
+        "ID": row.id, "タイムスタンプ": row.timestamp.strftime("%Y-%m-%d %H:%M"), "モデル": row.model_name,
+        "構成": row.rag_config, "最終判定": row.final_judgement,
+        "Faithfulness": f"{row.faithfulness:.3f}", "Answer Relevancy": f"{row.answer_relevancy:.3f}",
+        "Context Precision": f"{row.context_precision:.3f}", "Context Recall": f"{row.context_recall:.3f}",
+        "コスト(USD)": f"${row.cost_usd:.6f}",
+        **{header: _truncate(getattr(row, column)) for header, column in _PREVIEW_COLUMNS.items()}
+    } for row in rows]
+    return pd.DataFrame(log_list, columns=DF_HEADERS), next_before_id
+
+def handle_history_page(model_filter, config_filter, final_filter, cursors, next_cursor, direction="first"):
+    """
+    履歴テーブルのページ移動。
+    cursors はこれまでに表示したページの before_id のリスト（先頭ページは None）、next_cursor は表示中のページの次の before_id。
+    direction: "first"（フィルター変更・再読み込み）/ "next" / "prev"
+
+    Returns:
+        tuple: (表示用のDataFrame, cursors, next_cursor, ページ表示)
+    """
+    cursors = list(cursors or [None])
+    if direction == "first": cursors = [None]
+    elif direction == "next" and next_cursor is not None: cursors.append(next_cursor)
+    elif direction == "prev" and len(cursors) > 1: cursors.pop()
+
+    df, next_cursor = get_history_page(model_filter, config_filter, final_filter, before_id=cursors[-1])
+    page_label = f"{len(cursors)}ページ目" + ("" if next_cursor is not None else "（最後のページ）")
+    return df, cursors, next_cursor, page_label
+
+def get_log_detail(log_id):
+    """1件の評価ログの全文（質問・正解・生成回答・検索された文脈）を返す"""
+    log = database.EvaluationLog
+    db = next(get_db())
+    try:
+        row = db.query(log.question, log.ground_truth, log.generated_answer, log.retrieved_contexts).filter(log.id == log_id).first()
     finally:
         db.close()
+    if row is None: return "", "", "", ""
+    return tuple(value or "" for value in row)
+
+def handle_history_row_select(history_df, evt: gr.SelectData):
+    """履歴テーブルの行が選択されたときに、その行の全文を読み込む"""
+    try:
+        log_id = int(history_df.iloc[evt.index[0]]["ID"])
+    except (IndexError, KeyError, ValueError, TypeError):
+        return "", "", "", ""
+    return get_log_detail(log_id)
 
 def clear_all_history(state):
     db = next(get_db())
@@ -181,28 +312,23 @@ def clear_all_history(state):
         "generated_text": "", "eval_result": "", "eval_detail": "",
         "question_multi_dropdown": gr.update(choices=[], value=[]), "multi_eval_status": "",
         "eval_count": "0", "csv_save_file": gr.update(value=None, visible=False), "csv_save_status": "",
-        "history_df_display": pd.DataFrame(columns=DF_HEADERS), "graph_3d_out": None,
+        "history_df_display": pd.DataFrame(columns=DF_HEADERS), "history_cursors": [None], "history_next_cursor": None,
+        "history_page_label": "1ページ目（最後のページ）", "history_detail_question": "", "history_detail_ground_truth": "",
+        "history_detail_answer": "", "history_detail_contexts": "", "graph_3d_out": None,
         "group_model_plot_out": None, "group_config_plot_out": None,
         "agent_status_output": "エージェントは初期化されていません。", "agent_chat_history_display": [],
         "agent_query_input": gr.update(interactive=False, value="")
     }
 
 # --- グラフ描画ハンドラ ---
+# 評価ログが増えていなければ前回の図をそのまま返す（database.data_version が変わったときだけ描き直す）
+@cached_by_data_version
 def handle_plot_3d_scores():
-    db = next(get_db())
-    try:
-        df = pd.read_sql(db.query(database.EvaluationLog).statement, db.bind)
-        return plot_3d_scores(df)
-    finally:
-        db.close()
+    return plot_3d_scores(score_points())
 
+@cached_by_data_version
 def handle_group_analysis():
-    db = next(get_db())
-    try:
-        df = pd.read_sql(db.query(database.EvaluationLog).statement, db.bind)
-        return plot_group_analysis(df)
-    finally:
-        db.close()
+    return plot_group_analysis(success_rates("model_name"), success_rates("rag_config"))
 
 # --- その他UIハンドラ ---
 def get_current_question_context(state, selected_question: str):
@@ -0,0 +1,100 @@
+# log_stats.py
+import threading
+from functools import wraps
+
+import pandas as pd
+from sqlalchemy import func, case
+
+import database
+from database import EvaluationLog
+
+# --- 集計結果のキャッシュ ---
+# 関数名と引数ごとに (データバージョン, 結果) を保持し、評価ログが書き込まれてバージョンが変わったら作り直す
+# 返すDataFrameや図は呼び出し元で共有されるため、変更しないこと
+_cache = {}
+_cache_lock = threading.Lock()
+
+def cached_by_data_version(fn):
+    @wraps(fn)
+    def wrapper(*args):
+        key = (fn.__name__, args)
+        version = database.data_version
+        with _cache_lock:
+            hit = _cache.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        result = fn(*args)
+        with _cache_lock:
+            _cache[key] = (version, result)
+        return result
+    return wrapper
+
+# --- SQLでの集計（必要な列だけを読む） ---
+_GROUP_COLUMNS = {"model_name": EvaluationLog.model_name, "rag_config": EvaluationLog.rag_config}
+
+@cached_by_data_version
+def success_rates(group_by: str) -> pd.DataFrame:
+    """
+    モデル別（group_by="model_name"）またはRAG構成別（"rag_config"）の件数と成功率を返す。
+    列: group, total, success, success_rate（成功率の高い順）
+    """
+    column = _GROUP_COLUMNS[group_by]
+    db = database.SessionLocal()
+    try:
+        query = db.query(
+            column.label("group"),
+            func.count().label("total"),
+            func.sum(case((EvaluationLog.final_judgement == "O", 1), else_=0)).label("success"),
+        ).group_by(column)
+        df = pd.DataFrame(query.all(), columns=["group", "total", "success"])
+    finally:
+        db.close()
+    df["success_rate"] = df["success"] / df["total"]
+    return df.sort_values("success_rate", ascending=False).reset_index(drop=True)
+
+@cached_by_data_version
+def model_stats(model_name_lower: str):
+    """指定モデル（小文字で比較）の件数・成功率・平均忠実性・平均コスト。データが無ければ None"""
+    db = database.SessionLocal()
+    try:
+        total, success, avg_faithfulness, avg_cost = db.query(
+            func.count(),
+            func.sum(case((EvaluationLog.final_judgement == "O", 1), else_=0)),
+            func.avg(EvaluationLog.faithfulness),
+            func.avg(EvaluationLog.cost_usd),
+        ).filter(func.lower(EvaluationLog.model_name) == model_name_lower).one()
+    finally:
+        db.close()
+    if not total:
+        return None
+    return {"total": total, "success_rate": success / total, "avg_faithfulness": avg_faithfulness or 0.0, "avg_cost": avg_cost or 0.0}
+
+# 3Dプロット用の点は、前回読んだ最大のidより新しい行だけを追加で読む
+_points = {"version": None, "df": None}
+_points_lock = threading.Lock()
+
+def score_points() -> pd.DataFrame:
+    """
+    3Dスコアプロット用の列（id・モデル名・Tonicスコア・コサイン類似度・最終判定）だけを返す。
+    データバージョンが変わったときは新しい行だけを読み足し、削除があった（件数が database.get_log_count と合わない）場合は全件を読み直す。
+    """
+    version = database.data_version
+    with _points_lock:
+        if _points["version"] == version:
+            return _points["df"]
+        cached = _points["df"]
+        log = EvaluationLog
+        db = database.SessionLocal()
+        try:
+            query = db.query(log.id, log.model_name, log.tonic_score, log.cosine_similarity, log.final_judgement)
+            if cached is not None and not cached.empty:
+                new_rows = pd.read_sql(query.filter(log.id > int(cached["id"].max())).order_by(log.id).statement, db.bind)
+                df = pd.concat([cached, new_rows], ignore_index=True) if not new_rows.empty else cached
+            else:
+                df = None
+            if df is None or len(df) != database.get_log_count():
+                df = pd.read_sql(query.order_by(log.id).statement, db.bind)
+        finally:
+            db.close()
+        _points["version"], _points["df"] = version, df
+        return df
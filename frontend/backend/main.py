@@ -9,6 +9,7 @@ import uuid
 import json
 import torch
 import subprocess
+import numpy as np
 from pyannote.audio import Pipeline
 from models import get_llm_instance
 from config import MODEL_COSTS, HUGGING_FACE_HUB_TOKEN
@@ -53,6 +54,17 @@ device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 diarization_pipeline.to(device)
 print("話者分離モデルのロード完了。")
 
+SAMPLE_RATE = 16000
+
+def decode_audio(file_path: str) -> np.ndarray:
+    """ffmpegで16kHzモノラルにデコードし、float32配列として返す（WAVファイルは作らない）。"""
+    command = ['ffmpeg', '-nostdin', '-i', file_path, '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(SAMPLE_RATE), '-']
+    raw = subprocess.run(command, check=True, capture_output=True).stdout
+    audio = np.frombuffer(raw, np.int16).astype(np.float32)
+    del raw
+    audio /= 32768.0
+    return audio
+
 
 @app.get("/")
 def read_root():
@@ -72,26 +84,23 @@ def get_history():
 async def analyze_audio(file: UploadFile = File(...)):
     db = database.SessionLocal()
     temp_filepath = ""
-    wav_filepath = ""
     try:
-        # 1. ファイル保存とWAV変換
+        # 1. ファイル保存とデコード（1回だけデコードし、話者分離と文字起こしで同じ配列を使う）
         file_extension = os.path.splitext(file.filename)[1]
         temp_filename = f"{uuid.uuid4()}{file_extension}"
         temp_filepath = os.path.join(UPLOAD_DIR, temp_filename)
         with open(temp_filepath, "wb") as buffer:
             buffer.write(await file.read())
-        wav_filename = f"{uuid.uuid4()}.wav"
-        wav_filepath = os.path.join(UPLOAD_DIR, wav_filename)
-        subprocess.run(['ffmpeg', '-i', temp_filepath, wav_filepath], check=True)
+        audio = decode_audio(temp_filepath)
 
         # 2a. 話者分離を実行
         print("話者分離を実行中...")
-        diarization = diarization_pipeline(wav_filepath)
+        diarization = diarization_pipeline({"waveform": torch.from_numpy(audio).unsqueeze(0), "sample_rate": SAMPLE_RATE})
         print("話者分離完了。")
 
         # 2b. Whisperで単語タイムスタンプ付き文字起こし
         print("タイムスタンプ付き文字起こしを実行中...")
-        whisper_result = whisper_model.transcribe(wav_filepath, language="ja", word_timestamps=True)
+        whisper_result = whisper_model.transcribe(audio, language="ja", word_timestamps=True)
         print("文字起こし完了。")
 
         # 3. 話者分離と文字起こし結果を統合
@@ -187,8 +196,6 @@ async def analyze_audio(file: UploadFile = File(...)):
     finally:
         if os.path.exists(temp_filepath):
             os.remove(temp_filepath)
-        if os.path.exists(wav_filepath):
-            os.remove(wav_filepath)
         db.close()
 
 @app.get("/api/history/{log_id}")
@@ -0,0 +1,59 @@
+# micro_batcher.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class MicroBatcher:
+    """
+    複数のスレッドから同時に届いた要求を専用スレッドに集め、まとめて処理する。
+    最初の要求が来てから batch_wait_ms の間に届いた要求を、項目数の合計が batch_size に達するまでまとめ、
+    process_batch([(項目のリスト, Future), ...]) を呼ぶ。process_batch は各 Future に結果か例外を設定すること
+    （process_batch 自体が例外を送出した場合は、未完了の Future にその例外を設定する）。
+    """
+    def __init__(self, process_batch, batch_size: int, batch_wait_ms: float, name: str):
+        self.process_batch = process_batch
+        self.batch_size = batch_size
+        self.batch_wait_seconds = batch_wait_ms / 1000
+        self.name = name
+        self._requests = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def submit(self, items: list) -> Future:
+        """項目のリストを処理待ちに追加する。返り値の Future は process_batch が結果を設定すると完了する"""
+        future = Future()
+        self._ensure_worker()
+        self._requests.put((list(items), future))
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._worker.start()
+
+    def _collect_batch(self):
+        batch = [self._requests.get()]
+        n_items = len(batch[0][0])
+        deadline = time.monotonic() + self.batch_wait_seconds
+        while n_items < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            n_items += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                self.process_batch(batch)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done(): future.set_exception(e)
@@ -4,6 +4,7 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_anthropic import ChatAnthropic
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.language_models.chat_models import BaseChatModel
+from functools import lru_cache
 
 # configからAPIキーを直接インポート
 from config import OPENAI_API_KEY, GOOGLE_API_KEY, ANTHROPIC_API_KEY
@@ -20,6 +21,8 @@ def is_anthropic_model(model_name: str) -> bool:
     """モデル名がAnthropicのものか判定する"""
     return model_name.startswith("claude")
 
+# クライアント（HTTP接続プールを含む）はスレッドセーフなため、モデルごとに1つを使い回す
+@lru_cache(maxsize=None)
 def get_llm_instance(model_name: str) -> BaseChatModel:
     """
     モデル名に基づいてLLMのインスタンスを生成して返す。
@@ -1,71 +1,104 @@
 # rag_pipeline.py
+import threading
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-from langchain.callbacks import get_openai_callback
+from langchain_community.callbacks.openai_info import OpenAICallbackHandler
 from models import get_llm_instance
-from config import MODEL_COSTS
+from config import MODEL_COSTS, EVAL_MAX_CONCURRENCY
+
+RAG_PROMPT = ChatPromptTemplate.from_template("""
+    あなたは親切なアシスタントです。以下の文脈情報のみを使って、最後の質問に答えてください。
+    文脈情報で答えがわからない場合は、その旨を正直に伝えてください。
+
+    文脈:
+    {context}
+
+    質問: {question}
+    """)
 
 def format_docs(docs):
     """検索されたドキュメントを文字列にフォーマットする"""
     return "\n\n".join(doc.page_content for doc in docs)
 
-def run_rag_pipeline(retriever, model_name: str, question: str):
+class _QuestionCallback(OpenAICallbackHandler):
+    """質問ごとのトークン数を数え、回答の生成が終わったら on_complete を呼ぶ"""
+    def __init__(self, on_complete=None):
+        super().__init__()
+        self.on_complete = on_complete
+
+    def on_chain_end(self, outputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None and self.on_complete: self.on_complete()
+
+    def on_chain_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None and self.on_complete: self.on_complete()
+
+def run_rag_pipeline_batch(retriever, model_name: str, questions: list[str], max_concurrency: int = EVAL_MAX_CONCURRENCY, on_progress=None):
     """
-    本格的なRAGパイプラインを実行し、回答、文脈、コストを返す。
-    
+    複数の質問に対してRAGパイプラインをまとめて実行する。
+    検索は retriever.batch で全質問を一度に行い（質問の埋め込みは共有の埋め込みサービスで1回にまとめられる）、
+    回答生成は batch（スレッドプール）で max_concurrency 件まで並列に行う。
+    （asyncio.run で abatch を呼ぶと、キャッシュしたLLMクライアントが閉じたイベントループに紐づいて次回以降に失敗するため使わない）
+
     Args:
         retriever: LangChainのretrieverオブジェクト。
         model_name (str): 使用するモデルの名前。
-        question (str): ユーザーの質問。
-        
+        questions (list[str]): 質問のリスト。
+        max_concurrency (int): 検索・回答生成の最大同時実行数。
+        on_progress: 進捗を受け取る関数 on_progress(説明文)。検索の完了時と、回答が1件生成されるたびに呼ばれる。
+
     Returns:
-        tuple[str, str, float]: (生成された回答, 検索された文脈, 概算コスト)
+        list[tuple[str, str, float] | Exception]: 質問ごとの (生成された回答, 検索された文脈, 概算コスト)。失敗した質問は例外。
     """
+    if not questions: return []
     llm = get_llm_instance(model_name)
-    
-    template = """
-    あなたは親切なアシスタントです。以下の文脈情報のみを使って、最後の質問に答えてください。
-    文脈情報で答えがわからない場合は、その旨を正直に伝えてください。
+    chain = RAG_PROMPT | llm | StrOutputParser()
 
-    文脈:
-    {context}
+    contexts_docs = retriever.batch(questions, config={"max_concurrency": max_concurrency}, return_exceptions=True)
+    if on_progress: on_progress(f"文脈検索完了 ({len(questions)}件)")
 
-    質問: {question}
+    # complete は chain.batch のワーカースレッドからも呼ばれるため、ロックの中で数える
+    # （トークン数は質問ごとのハンドラに分けて数えるので、スレッド間で共有しない）
+    finished = 0
+    finished_lock = threading.Lock()
+    def complete():
+        nonlocal finished
+        with finished_lock:
+            finished += 1
+            if on_progress: on_progress(f"回答生成: {finished}/{len(questions)}")
+
+    targets = [i for i, docs in enumerate(contexts_docs) if not isinstance(docs, Exception)]
+    # 検索に失敗した質問は回答を生成しないので、ここで完了として数える
+    for _ in range(len(questions) - len(targets)): complete()
+    inputs = [{"context": format_docs(contexts_docs[i]), "question": questions[i]} for i in targets]
+    # get_openai_callbackは全体の合計しか取れないため、質問ごとにハンドラを渡してトークン数を数える
+    # （OpenAIモデル以外ではトークン数が取れず、コストは0になる）
+    handlers = [_QuestionCallback(complete) for _ in targets]
+    configs = [{"callbacks": [handler], "max_concurrency": max_concurrency} for handler in handlers]
+    answers = chain.batch(inputs, config=configs, return_exceptions=True) if inputs else []
+
+    model_cost = MODEL_COSTS.get(model_name, {"input": 0, "output": 0})
+    results = list(contexts_docs)
+    for i, answer, handler in zip(targets, answers, handlers):
+        if isinstance(answer, Exception):
+            results[i] = answer
+            continue
+        cost = (handler.prompt_tokens * model_cost["input"] / 1000) + \
+               (handler.completion_tokens * model_cost["output"] / 1000)
+        results[i] = (answer, format_docs(contexts_docs[i]), cost)
+    return results
+
+def run_rag_pipeline(retriever, model_name: str, question: str):
+    """
+    本格的なRAGパイプラインを実行し、回答、文脈、コストを返す。
+
+    Args:
+        retriever: LangChainのretrieverオブジェクト。
+        model_name (str): 使用するモデルの名前。
+        question (str): ユーザーの質問。
+
+    Returns:
+        tuple[str, str, float]: (生成された回答, 検索された文脈, 概算コスト)
     """
-    prompt = ChatPromptTemplate.from_template(template)
-
-    # LCELを使ってチェーンを構築
-    rag_chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-
-    # 回答と一緒に文脈も取得するためのチェーン
-    # retrieverを2回呼ばないように、最初にretrieverの結果を保持する
-    chain_with_context = RunnablePassthrough.assign(
-        contexts_docs=lambda x: retriever.invoke(x["question"])
-    ).assign(
-        answer=lambda x: (
-            {"context": format_docs(x["contexts_docs"]), "question": x["question"]}
-            | prompt
-            | llm
-            | StrOutputParser()
-        )
-    )
-    
-    cost = 0.0
-    # get_openai_callbackはOpenAIモデルでのみトークン数を正確に取得できる
-    # 他モデルのコスト計算は概算または別途実装が必要
-    with get_openai_callback() as cb:
-        result = chain_with_context.invoke({"question": question})
-        
-        # コスト計算
-        model_cost = MODEL_COSTS.get(model_name, {"input": 0, "output": 0})
-        cost = (cb.prompt_tokens * model_cost["input"] / 1000) + \
-               (cb.completion_tokens * model_cost["output"] / 1000)
-
-    contexts_str = format_docs(result["contexts_docs"])
-    return result["answer"], contexts_str, cost
+    result = run_rag_pipeline_batch(retriever, model_name, [question])[0]
+    if isinstance(result, Exception): raise result
+    return result
@@ -1,13 +1,14 @@
 # utils.py
 import numpy as np
-import matplotlib.pyplot as plt
+import matplotlib
+# サーバー上で描画するため、GUIを使わないAggバックエンドを明示する
+matplotlib.use("Agg")
 import pandas as pd
 from matplotlib import cm
-from sentence_transformers import SentenceTransformer, util
+from matplotlib.figure import Figure
 from models import invoke_model
-
-# --- モデルのキャッシュ ---
-sentence_model = SentenceTransformer("intfloat/multilingual-e5-large")
+from embedding_service import get_embedding_service
+from config import PLOT_MAX_POINTS
 
 # --- 評価関数 ---
 def tonic_similarity(question, target_answer, generated_answer, model_name):
@@ -33,9 +34,14 @@ def tonic_similarity(question, target_answer, generated_answer, model_name):
         return 0.0
 
 def cosine_sim(text1, text2):
-    embeddings = sentence_model.encode([text1, text2], convert_to_tensor=True)
-    cosine_scores = util.cos_sim(embeddings[0], embeddings[1])
-    return cosine_scores.item()
+    return float(cosine_sim_batch([text1], [text2])[0])
+
+def cosine_sim_batch(texts1, texts2):
+    """texts1[i] と texts2[i] のコサイン類似度を、1回のエンコードとベクトル演算でまとめて計算する"""
+    if not texts1: return np.empty(0, dtype=np.float32)
+    embeddings = get_embedding_service().embed(list(texts1) + list(texts2))
+    # 埋め込みは正規化済みなので、行ごとの内積がコサイン類似度になる
+    return np.einsum("ij,ij->i", embeddings[:len(texts1)], embeddings[len(texts1):])
 
 def score_to_ox(score, threshold):
     return "O" if score >= threshold else "X"
@@ -61,53 +67,76 @@ def llm_evaluate(model_name, questions, generated_answers, target_answers):
     return results
 
 # --- グラフ描画関数 ---
+# pyplot を使わずに Figure を直接作る（pyplot は作成した図を閉じるまで保持し続けるため、描画のたびにメモリが増える）
+
+def bin_score_points(df: pd.DataFrame, max_points=PLOT_MAX_POINTS) -> tuple[pd.DataFrame, bool]:
+    """
+    3Dプロット用の点を、件数が max_points を超える場合にだけ集計する。戻り値は (点, 集計したかどうか)。
+    Tonicスコアは0.1刻み・コサイン類似度は0.01刻みに丸め（それでも多ければ0.5刻み・0.05刻み）、
+    (モデル, x, y, z) ごとの件数を count 列に入れる。
+    """
+    points = pd.DataFrame({
+        'model_name': df['model_name'], 'x': df['tonic_score'], 'y': df['cosine_similarity'],
+        'z': (df['final_judgement'] == 'O').astype(int),
+    }).dropna(subset=['x', 'y'])
+    if len(points) <= max_points:
+        return points.assign(count=1), False
+    for x_step, y_step in [(0.1, 0.01), (0.5, 0.05)]:
+        binned = points.assign(x=(points['x'] / x_step).round() * x_step, y=(points['y'] / y_step).round() * y_step)
+        binned = binned.groupby(['model_name', 'x', 'y', 'z'], as_index=False).size().rename(columns={'size': 'count'})
+        if len(binned) <= max_points: break
+    return binned, True
+
 def plot_3d_scores(df: pd.DataFrame):
     """DataFrameを受け取り、3Dスコアグラフを生成する"""
     if df.empty or 'tonic_score' not in df.columns or 'cosine_similarity' not in df.columns:
         return None
     
-    fig = plt.figure(figsize=(12, 8))
+    points, binned = bin_score_points(df)
+    fig = Figure(figsize=(12, 8))
     ax = fig.add_subplot(111, projection='3d')
     
-    colors = cm.rainbow(np.linspace(0, 1, len(df['model_name'].unique())))
-    color_map = dict(zip(df['model_name'].unique(), colors))
+    colors = cm.rainbow(np.linspace(0, 1, len(points['model_name'].unique())))
+    color_map = dict(zip(points['model_name'].unique(), colors))
+    max_count = points['count'].max()
     
     for model_name, color in color_map.items():
-        sub_df = df[df['model_name'] == model_name]
-        ax.scatter(sub_df['tonic_score'], sub_df['cosine_similarity'], sub_df['final_judgement'].apply(lambda x: 1 if x == 'O' else 0),
-                   c=[color], label=model_name, s=50, alpha=0.7)
+        sub_df = points[points['model_name'] == model_name]
+        # 集計した場合は件数に応じて点を大きくする
+        sizes = 20 + 180 * np.sqrt(sub_df['count'] / max_count) if binned else 50
+        ax.scatter(sub_df['x'], sub_df['y'], sub_df['z'], c=[color], label=model_name, s=sizes, alpha=0.7)
                    
     ax.set_xlabel('TONICスコア')
     ax.set_ylabel('コサイン類似度')
     ax.set_zlabel('最終判定 (O=1, X=0)')
-    ax.set_title('RAG評価スコア 3Dプロット')
+    ax.set_title('RAG評価スコア 3Dプロット' + (f"（{points['count'].sum()}件を集計して表示）" if binned else ''))
     ax.legend()
     
     return fig
 
-def plot_group_analysis(df: pd.DataFrame):
-    """DataFrameを受け取り、グループ別分析グラフを生成する"""
-    if df.empty:
+def plot_group_analysis(model_summary: pd.DataFrame, config_summary: pd.DataFrame):
+    """モデル別・RAG構成別の成功率（log_stats.success_rates の結果）を受け取り、グループ別分析グラフを生成する"""
+    if model_summary.empty:
         return None, None
     
     # モデル別分析
-    model_summary = df.groupby('model_name')['final_judgement'].apply(lambda x: (x == 'O').mean()).sort_values(ascending=False)
-    fig1, ax1 = plt.subplots(figsize=(10, 6))
-    model_summary.plot(kind='bar', ax=ax1, color='skyblue')
+    fig1 = Figure(figsize=(10, 6))
+    ax1 = fig1.add_subplot(111)
+    model_summary.set_index('group')['success_rate'].plot(kind='bar', ax=ax1, color='skyblue')
     ax1.set_title('モデル別成功率 (最終判定: Oの割合)')
     ax1.set_ylabel('成功率')
     ax1.set_xlabel('モデル')
     ax1.tick_params(axis='x', rotation=45)
-    plt.tight_layout()
+    fig1.tight_layout()
 
     # RAG構成別分析
-    config_summary = df.groupby('rag_config')['final_judgement'].apply(lambda x: (x == 'O').mean()).sort_values(ascending=False)
-    fig2, ax2 = plt.subplots(figsize=(10, 6))
-    config_summary.plot(kind='bar', ax=ax2, color='lightgreen')
+    fig2 = Figure(figsize=(10, 6))
+    ax2 = fig2.add_subplot(111)
+    config_summary.set_index('group')['success_rate'].plot(kind='bar', ax=ax2, color='lightgreen')
     ax2.set_title('RAG構成別成功率 (最終判定: Oの割合)')
     ax2.set_ylabel('成功率')
     ax2.set_xlabel('RAG構成')
     ax2.tick_params(axis='x', rotation=45)
-    plt.tight_layout()
+    fig2.tight_layout()
     
     return fig1, fig2
@@ -14,7 +14,7 @@ interface HistoryItem {
   reliability_score: number;
 }
 
-const modelOptions = ALL_MODELS;
+const modelOptions = [...ALL_MODELS, { value: 'auto', label: '自動選択 (混雑状況と料金から選択)' }];
 const ITEMS_PER_PAGE = 10;
 
 export default function HomePage() {
@@ -14,4 +14,10 @@ export interface AnalysisResult {
     score: number;
     justification: string;
   };
+  // model_name=auto などでモデルが自動選択された場合のみ
+  routing?: {
+    requested: string;
+    chosen: string;
+    reason: string;
+  };
 }
\ No newline at end of file
@@ -1,10 +1,11 @@
 import os
 import sys
 import json
-import re # 正規表現ライブラリをインポート
 
 # 親ディレクトリ（プロジェクトルート）をPythonのパスに追加
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# backend内のモジュール同士の import を解決するため、backendディレクトリもパスに追加
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
 
 from backend.knowledge_base_manager import KnowledgeBaseManager
 
@@ -43,17 +44,15 @@ def main():
                 
                 # 話者分離済みの文字起こしテキストが格納されているキー
                 transcript_text = data.get('speakers', '') 
+                # 新しい分析結果には発言時刻付きの話者ターンも保存されている
+                speaker_turns = data.get('speaker_turns')
 
-                if transcript_text:
-                    # --- ディープクリーニング処理 ---
-                    # 1. 不自然なスペースを全て削除
-                    temp_text = transcript_text.replace(" ", "")
-                    # 2. 「**話者名:**」や「[*]」のような記号を正規表現で削除し、純粋な会話内容だけを抽出
-                    cleaned_text = re.sub(r'\*\*[^:]+:\s*|\[\*\]', '', temp_text)
-
-                    metadata = {"source_file": file_name}
-                    # 掃除したテキストをデータベースに追加
-                    kb_manager.add_text_to_knowledge_base(cleaned_text, metadata)
+                if transcript_text or speaker_turns:
+                    # 話者ラベルや文の区切りを残したまま、TranscriptChunker が話者ターンと文境界で分割する
+                    # （日本語の文字間の不要なスペースや「[*]」の除去もチャンカー側で行う）
+                    # 会議の日付は、回答時にコンテキストを日付順に並べるために使う
+                    metadata = {"source_file": file_name, "created_at": data.get('createdAt', '')}
+                    kb_manager.add_transcript_to_knowledge_base(transcript_text, metadata, speaker_turns=speaker_turns)
                 else:
                     print(f"⚠️ ファイル: {file_name} に文字起こしテキストが見つかりませんでした。スキップします。")
 
@@ -62,6 +61,10 @@ def main():
         except Exception as e:
             print(f"❌ ファイル: {file_name} の処理中に予期せぬエラーが発生しました: {e}")
 
+    # mmapバックエンドでIVF検索を使う場合は、取り込み後にクラスタを学習し直す
+    if kb_manager.backend == "mmap" and kb_manager.MMAP_SEARCH_MODE == "ivf" and kb_manager.collection.count() > 0:
+        kb_manager.collection.build_ivf()
+
     print("\n🎉 全てのファイルのインポート処理が完了しました。")
     print(f"現在のナレッジ総数: {kb_manager.collection.count()}")
 